@@ -0,0 +1,95 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from app.planner import (
+    PlanError, assignment_result, basket_key, bucket_center, cache_assignment, cached_assignment,
+    candidate_stores, finish_plan, make_assignment, parse_basket, prepare_assignment, submit_assignment
+)
+from app.workers import get_solver_pool
+
+
+def shared_offers(catalog, baskets):
+    """One PriceMatrix covering every basket's items and candidate stores."""
+    item_ids = set()
+    store_ids = set()
+    for basket in baskets:
+        item_ids.update(basket['requirements'])
+        stores = candidate_stores(catalog, bucket_center(basket['start']), basket['radius_km'])
+        store_ids.update(store['id'] for store in stores)
+    return catalog.item_store_matrix(sorted(item_ids), sorted(store_ids))
+
+
+def plan_batch(catalog, bodies):
+    """
+    Plan many /api/optimize bodies at once, yielding (index, response dict) as each
+    finishes. Baskets with the same basket_key are solved once; cached plans are
+    answered first, the rest are spread over the solver pool with at most its
+    queue_depth of them in flight, the next submitted as each one finishes. Baskets
+    are answered with the pool's 'busy' error only when other requests fill it and
+    none of this batch's jobs are left to wait for.
+    """
+    parsed = {}
+    for index, body in enumerate(bodies):
+        try:
+            parsed[index] = parse_basket(body)
+        except PlanError as e:
+            yield index, {'error': e.message}
+
+    # group identical sub-problems
+    groups = {}
+    for index, basket in parsed.items():
+        groups.setdefault(basket_key(basket), []).append(index)
+
+    pending = deque()
+    for key, indices in groups.items():
+        assignment = cached_assignment(catalog, key)
+        if assignment is not None:
+            yield from _finish(catalog, parsed, indices, assignment)
+        else:
+            pending.append((key, indices))
+
+    in_flight = max(1, get_solver_pool().queue_depth)
+    futures = {}
+    offers = None
+    while pending or futures:
+        while pending and len(futures) < in_flight:
+            key, indices = pending[0]
+            if offers is None:
+                offers = shared_offers(catalog, [parsed[group[0]] for _, group in pending])
+            try:
+                problem = prepare_assignment(catalog, parsed[indices[0]], offers)
+                future = submit_assignment(problem)
+            except PlanError as e:
+                if e.status == 503 and futures:
+                    # the pool is full; retry once one of ours has finished
+                    break
+                pending.popleft()
+                for index in indices:
+                    yield index, {'error': e.message}
+                continue
+            pending.popleft()
+            futures[future] = (key, indices, problem)
+        if not futures:
+            continue
+
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            key, indices, problem = futures.pop(future)
+            try:
+                result = assignment_result(future)
+            except PlanError as e:
+                for index in indices:
+                    yield index, {'error': e.message}
+                continue
+            assignment = make_assignment(problem, result)
+            cache_assignment(catalog, key, assignment)
+            yield from _finish(catalog, parsed, indices, assignment)
+
+
+def _finish(catalog, parsed, indices, assignment):
+    # duplicates share the price plan but may start from different points
+    for index in indices:
+        try:
+            yield index, finish_plan(catalog, parsed[index], assignment)
+        except PlanError as e:
+            yield index, {'error': e.message}
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and hit/miss counters.
+
+    Entries belong to a catalog generation (CatalogSnapshot.generation): passing a
+    newer one to get() or put() drops everything cached for the previous one, while
+    calls from an older one (a batch or job still holding the previous snapshot)
+    miss and store nothing.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def _check_version(self, version):
+        """Switch to version if it is newer; False when it is older than the cache's."""
+        if version is not None and self._version is not None and version < self._version:
+            self.stale += 1
+            return False
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+        return True
+
+    def get(self, key, version=None):
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if not self._check_version(version):
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale': self.stale
+            }
@@ -0,0 +1,67 @@
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_MILE = 1609.344
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distances in meters between every point of set 1 (rows) and every
+    point of set 2 (columns). Inputs are degrees, scalars or 1-d arrays.
+    """
+    lat1 = np.radians(np.atleast_1d(np.asarray(lat1, dtype=np.float64)))[:, None]
+    lon1 = np.radians(np.atleast_1d(np.asarray(lon1, dtype=np.float64)))[:, None]
+    lat2 = np.radians(np.atleast_1d(np.asarray(lat2, dtype=np.float64)))[None, :]
+    lon2 = np.radians(np.atleast_1d(np.asarray(lon2, dtype=np.float64)))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def ellipsoid_matrix(lat1, lon1, lat2, lon2):
+    """
+    Lambert's ellipsoidal correction of the haversine distance, in meters. Agrees
+    with geopy's geodesic() to well under a meter at city scale, in one vectorized
+    pass instead of one Karney solve per pair.
+    """
+    lat1 = np.radians(np.atleast_1d(np.asarray(lat1, dtype=np.float64)))[:, None]
+    lon1 = np.radians(np.atleast_1d(np.asarray(lon1, dtype=np.float64)))[:, None]
+    lat2 = np.radians(np.atleast_1d(np.asarray(lat2, dtype=np.float64)))[None, :]
+    lon2 = np.radians(np.atleast_1d(np.asarray(lon2, dtype=np.float64)))[None, :]
+
+    # reduced latitudes
+    beta1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    beta2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    a = np.sin((beta2 - beta1) / 2) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin((lon2 - lon1) / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    p = (beta1 + beta2) / 2
+    q = (beta2 - beta1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        distance = WGS84_A * (sigma - WGS84_F / 2 * (x + y))
+    return np.where(sigma > 0, distance, 0.0)
+
+
+def distance_matrix(points_a, points_b=None):
+    """
+    Meters between two lists of (lat, lon) points; points_b defaults to points_a.
+    """
+    points_a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    points_b = points_a if points_b is None else np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    return ellipsoid_matrix(points_a[:, 0], points_a[:, 1], points_b[:, 0], points_b[:, 1])
+
+
+def bounding_box(lat, lon, radius_meters):
+    """
+    (min_lat, max_lat, min_lon, max_lon) enclosing the circle of radius_meters around
+    (lat, lon), with a 1% margin for the ellipsoid.
+    """
+    dlat = float(np.degrees(1.01 * radius_meters / EARTH_RADIUS_METERS))
+    coslat = np.cos(np.radians(min(abs(lat) + dlat, 89.9)))
+    dlon = min(180.0, dlat / coslat)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
@@ -0,0 +1,168 @@
+import numpy as np
+
+from app import config
+from app.calculator.optimizer import assignmentSolver, dense_offers, fill_cheapest, plan_for
+from app.calculator.prices import PriceMatrix
+from app.calculator.routing import held_karp
+
+
+def _shortlist(prices, start_row, keep, limit):
+    """
+    Columns worth searching when there are too many candidates: the stores of the
+    cheapest-basket plan, then alternately the nearest stores and the stores that
+    are among the three cheapest for the most items.
+    """
+    cheap_rank = np.argsort(prices, axis=1, kind="stable")[:, :3]
+    cheap_count = np.bincount(cheap_rank.ravel(), minlength=prices.shape[1])
+    by_value = np.lexsort((start_row, -cheap_count)).tolist()
+    by_distance = np.argsort(start_row, kind="stable").tolist()
+    chosen = list(dict.fromkeys(keep))
+    for a, b in zip(by_distance, by_value):
+        for col in (a, b):
+            if len(chosen) < limit and col not in chosen:
+                chosen.append(col)
+        if len(chosen) >= limit:
+            break
+    return sorted(chosen, key=lambda col: start_row[col])
+
+
+def joint_solve(store_item_prices, item_requirements, max_stores, store_ids, from_start, store_distances,
+                distance_weight=None, warm_stores=None):
+    """
+    Minimize purchase cost + distance_weight × route length (in km) in one search.
+
+    Store subsets are enumerated depth-first with branch and bound, starting from
+    the cheapest-basket plan. A subset's route (Held-Karp from the start) only
+    grows when stores are added and its purchase cost only shrinks, so a subtree
+    is pruned once
+        max(cheapest purchase using every store still addable, cheapest basket)
+        + weight × route so far
+    cannot beat the best plan found. Routes are cached per subset.
+
+    Above JOINT_MAX_CANDIDATES candidate stores only a shortlist is searched, and
+    if JOINT_NODE_LIMIT subsets are visited the search stops early; either way,
+    or when the price solver could not prove its plan optimal, the plan is then
+    reported as 'Feasible' with its gap to the lower bound.
+
+    :param store_item_prices: PriceMatrix, or a list of tuples (store_id, item_id, price, inventory)
+    :param item_requirements: { item_id: required_qty, … }
+    :param store_ids: candidate store ids, the order of from_start and store_distances
+    :param from_start: meters from the starting point to each candidate store
+    :param store_distances: meters between candidate stores
+    :param distance_weight: dollars per km travelled
+    :param warm_stores: stores of a previous plan, passed on to the price solver
+    :return: Dictionary with the plan, purchase cost, route (store ids in visiting
+             order), distance in meters, objective, status, engine and gap
+    """
+    if distance_weight is None:
+        distance_weight = config.JOINT_DISTANCE_WEIGHT
+    weight = distance_weight / 1000.0  # per meter
+
+    infeasible = {"plan": [], "total_cost": None, "route": [], "distance": None, "objective": None,
+                  "status": "Infeasible", "engine": "joint", "gap": None}
+    store_item_prices = PriceMatrix.of(store_item_prices)
+    item_list, store_list, prices, stock, required = dense_offers(store_item_prices, item_requirements)
+    if not item_list:
+        return {"plan": [], "total_cost": 0.0, "route": [], "distance": 0.0, "objective": 0.0,
+                "status": "Optimal", "engine": "joint", "gap": 0.0}
+    if max_stores < 1 or not store_list:
+        return infeasible
+
+    # The cheapest basket under the same store cap gives a starting incumbent and a
+    # purchase-cost floor for every subset (heuristic plans are within their gap).
+    # Without a gap (a MILP stopped before proving optimality) its cost is only an
+    # upper bound, so the floor is the uncapped cheapest basket instead.
+    priced = assignmentSolver(store_item_prices, item_requirements, max_stores, warm_stores=warm_stores)
+    if not priced["plan"]:
+        return infeasible
+    proven = priced["gap"] is not None
+    if proven:
+        cost_floor = float(priced["total_cost"]) * (1 - priced["gap"])
+    else:
+        cost_floor = float(fill_cheapest(prices, stock, required)[1])
+    priced_stores = {s for s, _, _ in priced["plan"]}
+
+    position = {sid: k for k, sid in enumerate(store_ids)}
+    rows = np.array([position[s] for s in store_list], dtype=np.int64)
+    start_row = np.asarray(from_start, dtype=np.float64)[rows]
+    lower_bound = cost_floor + weight * float(start_row.min())
+
+    # columns ordered nearest-first: good plans are found early, and the distance
+    # to a store bounds every route through it
+    complete = len(store_list) <= config.JOINT_MAX_CANDIDATES
+    if complete:
+        order = np.argsort(start_row, kind="stable")
+    else:
+        seed = [k for k, s in enumerate(store_list) if s in priced_stores]
+        order = np.array(_shortlist(prices, start_row, seed, config.JOINT_MAX_CANDIDATES))
+    store_list = [store_list[k] for k in order]
+    prices, stock, rows, start_row = prices[:, order], stock[:, order], rows[order], start_row[order]
+    between = np.asarray(store_distances, dtype=np.float64)[np.ix_(rows, rows)]
+    n = len(store_list)
+    seed = tuple(k for k, s in enumerate(store_list) if s in priced_stores)
+
+    routes = {}
+
+    def route_of(subset):
+        if subset not in routes:
+            nodes = list(subset)
+            matrix = [[0.0] + start_row[nodes].tolist()]
+            for a in nodes:
+                matrix.append([start_row[a]] + between[a, nodes].tolist())
+            path, length, _ = held_karp(matrix)
+            routes[subset] = ([nodes[p - 1] for p in path], length)
+        return routes[subset]
+
+    best = {"objective": float(priced["total_cost"]) + weight * route_of(seed)[1], "subset": seed}
+    visited = 0
+
+    def search(subset, last, parent_route):
+        nonlocal visited, complete
+        visited += 1
+        if visited > config.JOINT_NODE_LIMIT:
+            complete = False
+            return
+        reachable = list(subset) + list(range(last + 1, n))
+        short, reach_cost, _ = fill_cheapest(prices[:, reachable], stock[:, reachable], required)
+        if short > 0:
+            return
+        reach_cost = max(float(reach_cost), cost_floor)
+        # cheap bound first: the route is at least the parent's and the trip to `last`
+        if subset and reach_cost + weight * max(parent_route, start_row[last]) >= best["objective"] - 1e-9:
+            return
+
+        route = 0.0
+        if subset:
+            route = route_of(subset)[1]
+            if reach_cost + weight * route >= best["objective"] - 1e-9:
+                return
+            short, cost, _ = fill_cheapest(prices[:, list(subset)], stock[:, list(subset)], required)
+            if short == 0 and cost + weight * route < best["objective"] - 1e-9:
+                best["objective"], best["subset"] = float(cost + weight * route), subset
+            if len(subset) == max_stores:
+                return
+        for j in range(last + 1, n):
+            # no later store is closer to the start than j
+            if reach_cost + weight * max(route, start_row[j]) >= best["objective"] - 1e-9:
+                break
+            search(subset + (j,), j, route)
+
+    search((), -1, 0.0)
+
+    plan, cost = plan_for(prices, stock, required, np.array(best["subset"]), store_list, item_list)
+    # a store that ends up buying nothing only lengthens the route
+    used = {s for s, _, _ in plan}
+    path, length = route_of(tuple(k for k in best["subset"] if store_list[k] in used))
+    best["objective"] = min(best["objective"], cost + weight * length)
+    exact = complete and proven
+    gap = 0.0 if exact else max(0.0, (best["objective"] - lower_bound) / best["objective"])
+    return {
+        "plan": plan,
+        "total_cost": cost,
+        "route": [store_list[k] for k in path],
+        "distance": length,
+        "objective": best["objective"],
+        "status": "Optimal" if exact else "Feasible",
+        "engine": "joint",
+        "gap": gap
+    }
@@ -0,0 +1,179 @@
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+import pulp
+
+from app import config
+from app.logs import get_logger
+from app.metrics import span
+
+# Minimization MILPs held as arrays and handed to CBC as an MPS file written
+# straight from them, without a PuLP variable or constraint object per term.
+# PuLP is still needed for the path of the CBC binary it bundles, and the
+# model, start and solution files go through a temporary directory (under
+# SOLVER_TMP_DIR when set) since CBC only reads and writes files.
+
+logger = get_logger(__name__)
+
+
+class SparseModel:
+    """
+    min c·x  s.t.  A x (sense) rhs,  lower <= x <= upper,  x[integer] integral.
+
+    A is CSR (indptr, indices, data) with one row per constraint; sense holds
+    'G', 'L' or 'E' per row.
+    """
+
+    def __init__(self, c, indptr, indices, data, sense, rhs, lower, upper, integer):
+        self.c = np.asarray(c, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.sense = np.asarray(sense)
+        self.rhs = np.asarray(rhs, dtype=np.float64)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.integer = np.asarray(integer, dtype=bool)
+
+    @property
+    def shape(self):
+        return len(self.rhs), len(self.c)
+
+
+def assignment_model(prices, stock, required, max_stores):
+    """
+    The store-capped basket MILP over dense item × store arrays (see dense_offers).
+
+    Columns are one x per (item, store) offer with stock, bounded by
+    min(stock, required) instead of a separate inventory row, then one binary v
+    per store. Rows are one covering row per item, one link row x - ub·v <= 0
+    per offer and the store cap. Returns (model, offer_items, offer_stores), the
+    last two giving the item row and store column of each x.
+    """
+    n_items, n_stores = prices.shape
+    offer_items, offer_stores = np.nonzero(np.isfinite(prices) & (stock > 0))
+    n_offers = len(offer_items)
+    ub = np.minimum(stock[offer_items, offer_stores], required[offer_items]).astype(np.float64)
+    offers = np.arange(n_offers)
+    store_cols = n_offers + np.arange(n_stores)
+
+    # np.nonzero is row-major, so each item's offers are already contiguous
+    cover_indptr = np.concatenate([[0], np.cumsum(np.bincount(offer_items, minlength=n_items))])
+    link_indices = np.column_stack([offers, n_offers + offer_stores]).ravel()
+    link_data = np.column_stack([np.ones(n_offers), -ub]).ravel()
+
+    indptr = np.concatenate([
+        cover_indptr,
+        n_offers + 2 * np.arange(1, n_offers + 1),
+        [3 * n_offers + n_stores]
+    ])
+    indices = np.concatenate([offers, link_indices, store_cols])
+    data = np.concatenate([np.ones(n_offers), link_data, np.ones(n_stores)])
+    sense = np.array(['G'] * n_items + ['L'] * (n_offers + 1))
+    rhs = np.concatenate([required.astype(np.float64), np.zeros(n_offers), [max_stores]])
+
+    model = SparseModel(
+        c=np.concatenate([prices[offer_items, offer_stores], np.zeros(n_stores)]),
+        indptr=indptr, indices=indices, data=data, sense=sense, rhs=rhs,
+        lower=np.zeros(n_offers + n_stores),
+        upper=np.concatenate([ub, np.ones(n_stores)]),
+        integer=np.ones(n_offers + n_stores, dtype=bool)
+    )
+    return model, offer_items, offer_stores
+
+
+def write_mps(model, path):
+    """Write the model as free-format MPS with rows R<k> and columns C<j>."""
+    n_rows, n_cols = model.shape
+    counts = np.diff(model.indptr)
+    row_of = np.repeat(np.arange(n_rows), counts)
+    # column-major entries, objective first within each column
+    objective = np.flatnonzero(model.c)
+    cols = np.concatenate([objective, model.indices])
+    rows = np.concatenate([np.full(len(objective), -1), row_of])
+    values = np.concatenate([model.c[objective], model.data])
+    order = np.lexsort((rows, cols))
+    cols, rows, values = cols[order].tolist(), rows[order].tolist(), values[order].tolist()
+
+    lines = ['NAME BASKET', 'ROWS', ' N OBJ']
+    lines += [f' {s} R{k}' for k, s in enumerate(model.sense.tolist())]
+    lines.append('COLUMNS')
+    integer = model.integer.tolist()
+    in_marker = False
+    previous = -1
+    for col, row, value in zip(cols, rows, values):
+        if col != previous:
+            if integer[col] != in_marker:
+                lines.append(" MARKER 'MARKER' 'INTORG'" if integer[col] else " MARKER 'MARKER' 'INTEND'")
+                in_marker = integer[col]
+            previous = col
+        lines.append(f' C{col} {"OBJ" if row < 0 else f"R{row}"} {value!r}')
+    if in_marker:
+        lines.append(" MARKER 'MARKER' 'INTEND'")
+
+    lines.append('RHS')
+    lines += [f' RHS R{k} {value!r}' for k, value in zip(np.flatnonzero(model.rhs).tolist(), model.rhs[model.rhs != 0].tolist())]
+    lines.append('BOUNDS')
+    lower, upper = model.lower.tolist(), model.upper.tolist()
+    for j in range(n_cols):
+        if lower[j] != 0:
+            lines.append(f' LO BND C{j} {lower[j]!r}')
+        lines.append(f' UP BND C{j} {upper[j]!r}' if upper[j] != np.inf else f' PL BND C{j}')
+    lines.append('ENDATA')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _read_solution(path, n_cols):
+    x = np.zeros(n_cols)
+    with open(path) as f:
+        header = f.readline()
+        for line in f:
+            fields = line.split()
+            if fields and fields[0] == '**':
+                fields = fields[1:]
+            if len(fields) >= 3 and fields[1].startswith('C'):
+                x[int(fields[1][1:])] = float(fields[2])
+    if header.startswith('Optimal'):
+        status = 'Optimal'
+    elif header.startswith('Stopped') and 'objective value' in header and x.any():
+        status = 'Feasible'
+    elif 'nfeasible' in header:
+        status = 'Infeasible'
+    else:
+        status = 'Not Solved'
+    return status, x
+
+
+def solve_model(model, time_limit=None, start=None):
+    """
+    Solve a SparseModel with CBC. `start` is an optional feasible x handed to CBC
+    as its initial solution. Returns (status, x) where status is 'Optimal',
+    'Feasible' (stopped at the time limit with a solution), 'Infeasible' or
+    'Not Solved' (also when CBC cannot be run or exits with an error).
+    """
+    if time_limit is None:
+        time_limit = config.SOLVER_TIME_LIMIT * 0.8
+    with tempfile.TemporaryDirectory(dir=config.SOLVER_TMP_DIR or None) as tmp:
+        mps, sol, mst = (os.path.join(tmp, name) for name in ('model.mps', 'model.sol', 'model.mst'))
+        with span('milp_build'):
+            write_mps(model, mps)
+        args = [pulp.PULP_CBC_CMD().path, mps]
+        if start is not None:
+            with open(mst, 'w') as f:
+                f.write('Stopped on time - objective value 0\n')
+                f.writelines(f'{j:>7} C{j} {value:>15} {0:>23}\n' for j, value in enumerate(np.asarray(start).tolist()))
+            args += ['-mips', mst]
+        args += ['-sec', str(time_limit), '-branch', '-printingOptions', 'normal', '-solution', sol]
+        with span('cbc_solve'):
+            try:
+                subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, check=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.warning('CBC failed: %s', e)
+                return 'Not Solved', np.zeros(model.shape[1])
+        if not os.path.exists(sol):
+            # CBC exits 0 even when it rejects the model
+            return 'Not Solved', np.zeros(model.shape[1])
+        return _read_solution(sol, model.shape[1])
@@ -1,21 +1,25 @@
+import itertools
+import logging
+import math
+
+import numpy as np
 import pulp
-import re
-import sqlite3
-import os
 
-DATABASE = 'db/fake_basketroute.db'
+from app import config
+from app.calculator.milp import assignment_model, solve_model
+from app.calculator.prices import PriceMatrix
+from app.logs import get_logger, payload
+from app.metrics import span
 
-def create_connection():
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), DATABASE)
-    conn = sqlite3.connect(db_path)
-    return conn
+logger = get_logger(__name__)
 
-def translate_ip_result_to_plan(result, items, stores):
+def translate_ip_result_to_plan(result, items, stores, matrix=None):
     """
     Translate the integer programming result into a human-readable shopping plan.
     :param result: Dictionary with keys 'plan' (list of tuples (store_id, item_id, quantity)) and 'total_cost'
     :param items: List of item details (dicts with 'id' and 'name')
     :param stores: List of store details (dicts with 'id' and 'name')
+    :param matrix: PriceMatrix the plan was solved over; when given each purchase carries its unit 'price'
     :return: dictionary by store with items and quantities to buy and total cost 
     """
     plan = {}
@@ -23,44 +27,161 @@ def translate_ip_result_to_plan(result, items, stores):
     store_dict = {store['id']: store['name'] for store in stores}
     for store_id, item_id, quantity in result['plan']:
         plan[store_dict[store_id]] = plan.get(store_dict[store_id], [])
-        plan[store_dict[store_id]].append({
+        purchase = {
             'item': item_dict[item_id],
             'quantity': quantity
-        })
+        }
+        if matrix is not None:
+            purchase['price'] = matrix.price(store_id, item_id)
+        plan[store_dict[store_id]].append(purchase)
     return {
         'plan': plan,
         'cost': result['total_cost'],
-        'status': result['status']
+        'status': result['status'],
+        'engine': result.get('engine'),
+        'gap': result.get('gap')
     }
 
-def optimize(store_item_prices, item_requirements, max_stores=5):
+def optimize(store_item_prices, item_requirements, max_stores=5, gap_threshold=None, warm_stores=None):
     """
     Optimize the shopping plan to minimize cost while ensuring each item is bought from exactly one store.
     
-    :param store_item_prices: List of tuples (store_id, item_id, price, inventory)
+    :param store_item_prices: PriceMatrix, or a list of tuples (store_id, item_id, price, inventory),
+                              or the columnar arrays of query.item_store_offers
     :param item_requirements: List of integers corresponding to the required quantity for each item
-    :return: Dictionary with the optimal shopping plan and total cost
+    :param gap_threshold: Relative gap below which a heuristic plan is accepted without the MILP
+    :param warm_stores: Stores of a previous plan to start the search from
+    :return: Dictionary with the optimal shopping plan, total cost, solving engine and optimality gap
 
     requires:
         len(store_item_prices) == len(item_requirements)
     """
     
     # Validate inputs
-    if not isinstance(store_item_prices, list) or not all(isinstance(x, tuple) for x in store_item_prices):
-        raise ValueError("store_item_prices must be a list of tuples (store, item, price, inventory)")
+    if isinstance(store_item_prices, list):
+        if not all(isinstance(x, tuple) for x in store_item_prices):
+            raise ValueError("store_item_prices must be a list of tuples (store, item, price, inventory)")
+    elif isinstance(store_item_prices, tuple):
+        if len(store_item_prices) != 4 or len({len(c) for c in store_item_prices}) > 1:
+            raise ValueError("store_item_prices must be columns (store_ids, item_ids, prices, inventory) of equal length")
+    elif not isinstance(store_item_prices, PriceMatrix):
+        raise ValueError("store_item_prices must be a PriceMatrix, a list of tuples or columns of offers")
     
-    return assignmentSolver(store_item_prices, item_requirements, max_stores)
+    return assignmentSolver(store_item_prices, item_requirements, max_stores, gap_threshold, warm_stores)
+
+def fill_cheapest(prices, stock, required):
+    """
+    Cheapest way to cover `required` from a handful of stores, batched.
+
+    :param prices: array (..., items, m) of unit prices, inf where a store has no offer
+    :param stock: array (..., items, m) of available inventory
+    :param required: array (items,) of required quantities
+    :return: (shortfall, cost, take) where take has the shape of prices and holds the
+             units bought at each store, filling from the cheapest store first
+    """
+    order = np.argsort(prices, axis=-1, kind="stable")
+    p = np.take_along_axis(prices, order, -1)
+    v = np.take_along_axis(stock, order, -1)
+    before = np.cumsum(v, axis=-1) - v
+    take_sorted = np.clip(required[:, None] - before, 0, v)
+    cost = (np.where(take_sorted > 0, p, 0.0) * take_sorted).sum(axis=(-2, -1))
+    shortfall = np.clip(required - v.sum(axis=-1), 0, None).sum(axis=-1)
+    take = np.empty_like(take_sorted)
+    np.put_along_axis(take, order, take_sorted, -1)
+    return shortfall, cost, take
+
+
+def dense_offers(store_item_prices, item_requirements):
+    """
+    Dense item × store price/inventory arrays over the stores that stock something
+    we need. Offers are a PriceMatrix, a list of (store_id, item_id, price, inventory)
+    tuples or the columns of query.item_store_offers.
+    Returns (item_list, store_list, prices, stock, required).
+    """
+    item_list = sorted(i for i, qty in item_requirements.items() if qty > 0)
+    matrix = PriceMatrix.of(store_item_prices).for_items(item_list)
+    matrix = matrix.select(columns=np.flatnonzero(matrix.stock.any(axis=0)))
+    required = np.array([item_requirements[i] for i in item_list], dtype=np.int64)
+    return item_list, matrix.store_ids.tolist(), matrix.prices, matrix.stock, required
+
+
+def _evaluate(prices, stock, required, subsets):
+    """(shortfall, cost) of each row of `subsets` (array (n, m) of store columns)."""
+    shortfall = np.empty(len(subsets), dtype=np.int64)
+    cost = np.empty(len(subsets))
+    for lo in range(0, len(subsets), 1024):
+        chunk = subsets[lo:lo + 1024]
+        short, c, _ = fill_cheapest(prices[:, chunk].transpose(1, 0, 2), stock[:, chunk].transpose(1, 0, 2), required)
+        shortfall[lo:lo + 1024] = short
+        cost[lo:lo + 1024] = c
+    return shortfall, cost
+
+
+def _best(shortfall, cost):
+    """Index of the cheapest candidate, preferring ones that cover every item."""
+    return int(np.lexsort((cost, shortfall))[0])
+
+
+def plan_for(prices, stock, required, columns, store_list, item_list):
+    _, cost, take = fill_cheapest(prices[:, columns], stock[:, columns], required)
+    plan = []
+    for row, col in zip(*np.nonzero(take)):
+        plan.append((store_list[columns[col]], item_list[row], int(take[row, col])))
+    return plan, float(cost)
+
+
+def _local_search(prices, stock, required, chosen, iterations):
+    """Best-improvement swap search: replace one chosen store with one unchosen store."""
+    n_stores = prices.shape[1]
+    best_short, best_cost = _evaluate(prices, stock, required, np.array([chosen]))
+    best = (int(best_short[0]), float(best_cost[0]))
+    for _ in range(iterations):
+        outside = np.setdiff1d(np.arange(n_stores), chosen)
+        if not len(outside):
+            break
+        move = None
+        for pos in range(len(chosen)):
+            subsets = np.repeat(np.array([chosen]), len(outside), axis=0)
+            subsets[:, pos] = outside
+            short, cost = _evaluate(prices, stock, required, subsets)
+            k = _best(short, cost)
+            candidate = (int(short[k]), float(cost[k]))
+            if candidate[0] < best[0] or (candidate[0] == best[0] and candidate[1] < best[1] - 1e-9):
+                best, move = candidate, (pos, int(outside[k]))
+        if move is None:
+            break
+        chosen = list(chosen)
+        chosen[move[0]] = move[1]
+    return chosen, best
+
+
+def _heuristic(prices, stock, required, k, iterations, seed=()):
+    """
+    Greedily add the store that helps most until k are chosen, then improve by swaps.
+    `seed` columns (e.g. the stores of a previous plan) are chosen first.
+    """
+    n_stores = prices.shape[1]
+    chosen = list(dict.fromkeys(seed))[:k]
+    for _ in range(k - len(chosen)):
+        outside = np.setdiff1d(np.arange(n_stores), chosen)
+        subsets = np.column_stack([np.repeat(np.array([chosen], dtype=np.int64), len(outside), axis=0), outside])
+        short, cost = _evaluate(prices, stock, required, subsets)
+        chosen.append(int(outside[_best(short, cost)]))
+    return _local_search(prices, stock, required, chosen, iterations)
 
-def assignmentSolver(store_item_prices, item_requirements, max_stores=5):
-    # store_item_prices: [(store_id, item_id, price, inventory), …]
-    # item_requirements: { item_id: required_qty, … }
-    # max_stores: maximum distinct stores you may visit
 
-    # 1) debug prints
-    print(f"Store_item_prices: {store_item_prices}")
-    print(f"Item requirements: {item_requirements}")
-    print(f"Max stores: {max_stores}")
+def cbc_solver(time_limit=None, warm_start=False):
+    """Quiet CBC whose model and solution files go to SOLVER_TMP_DIR."""
+    if time_limit is None:
+        time_limit = config.SOLVER_TIME_LIMIT * 0.8
+    solver = pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, warmStart=warm_start)
+    if config.SOLVER_TMP_DIR:
+        solver.tmpDir = config.SOLVER_TMP_DIR
+    return solver
 
+
+def pulp_model(store_item_prices, item_requirements, max_stores):
+    """The basket MILP as a PuLP problem. Returns (prob, x, v, valid_pairs, store_list)."""
     # 2) collect distinct stores & items
     store_list = sorted({s for s, _, _, _ in store_item_prices})
     item_list  = sorted(item_requirements.keys())
@@ -70,7 +191,7 @@ def assignmentSolver(store_item_prices, item_requirements, max_stores=5):
     inventory = {(s,i): inv for s,i,p,inv in store_item_prices}
 
     # 4) only consider store-item pairs with positive inventory
-    valid_pairs = [(s,i) for (s,i), inv in inventory.items() if inv > 0]
+    valid_pairs = [(s,i) for (s,i), inv in inventory.items() if inv > 0 and i in item_requirements]
 
     # 5) set up LP
     prob = pulp.LpProblem("GroceryAssignment", pulp.LpMinimize)
@@ -90,7 +211,7 @@ def assignmentSolver(store_item_prices, item_requirements, max_stores=5):
 
     # 8) satisfy item requirements (allow splitting across stores)
     for i in item_list:
-        supply_vars = [x[(s,i)] for s in store_list if (s,i) in inventory]
+        supply_vars = [x[(s,i)] for s in store_list if (s,i) in x]
         prob += pulp.lpSum(supply_vars) >= item_requirements[i], f"Req_{i}"
 
     # 9) link quantity → store used
@@ -100,40 +221,172 @@ def assignmentSolver(store_item_prices, item_requirements, max_stores=5):
 
     # 10) cap the number of stores
     prob += pulp.lpSum(v[s] for s in store_list) <= max_stores, "MaxStores"
+    return prob, x, v, valid_pairs, store_list
+
+
+def _milp_solve(store_item_prices, item_requirements, max_stores, incumbent=None):
+    # incumbent: a feasible plan [(store_id, item_id, qty), …] handed to CBC as its starting solution
+    with span('milp_build'):
+        prob, x, v, valid_pairs, store_list = pulp_model(store_item_prices, item_requirements, max_stores)
 
-    # 11) solve quietly
-    prob.solve(pulp.PULP_CBC_CMD(msg=False))
+    # 11) solve quietly, from the incumbent when there is one
+    if incumbent:
+        start = {(s,i): q for s,i,q in incumbent}
+        for pair in valid_pairs:
+            x[pair].setInitialValue(start.get(pair, 0))
+        used = {s for s,_,_ in incumbent}
+        for s in store_list:
+            v[s].setInitialValue(1 if s in used else 0)
+    with span('cbc_solve'):
+        prob.solve(cbc_solver(warm_start=bool(incumbent)))
 
     # 12) extract plan
     status = pulp.LpStatus[prob.status]
+    if status == "Optimal" and prob.sol_status != pulp.LpSolutionOptimal:
+        # CBC stopped at the time limit holding a solution it has not proven optimal
+        status = "Feasible"
     plan = []
-    if status == "Optimal":
+    if status in ("Optimal", "Feasible"):
         for (s,i) in valid_pairs:
             qty = pulp.value(x[(s,i)])
             if qty and qty > 0.5:
-                plan.append((s, i, int(qty)))
+                plan.append((s, i, int(round(qty))))
 
     total_cost = pulp.value(prob.objective)
     return {
         "plan":       plan,        # e.g. [(2, 49, 2), (8, 49, 1), (5,  2, 1), …]
         "total_cost": total_cost, # float
-        "status":     status      # e.g. "Optimal"
+        "status":     status,     # e.g. "Optimal"
+        "engine":     "milp",
+        "gap":        0.0 if status == "Optimal" else None
     }
 
+def _matrix_milp_solve(prices, stock, required, max_stores, store_list, item_list, incumbent=None):
+    """The MILP tier through the array-built model (milp.assignment_model) instead of PuLP objects."""
+    with span('milp_build'):
+        model, offer_items, offer_stores = assignment_model(prices, stock, required, max_stores)
+    start = None
+    if incumbent:
+        store_col = {s: col for col, s in enumerate(store_list)}
+        item_row = {i: row for row, i in enumerate(item_list)}
+        take = np.zeros(prices.shape)
+        for s, i, q in incumbent:
+            take[item_row[i], store_col[s]] = q
+        start = np.concatenate([take[offer_items, offer_stores], take.any(axis=0).astype(np.float64)])
+    status, x = solve_model(model, start=start)
+    if status not in ("Optimal", "Feasible"):
+        return {"plan": [], "total_cost": None, "status": status, "engine": "milp", "gap": None}
+    qty = np.rint(x[:len(offer_items)]).astype(np.int64)
+    bought = np.flatnonzero(qty > 0)
+    plan = [(store_list[offer_stores[k]], item_list[offer_items[k]], int(qty[k])) for k in bought]
+    cost = float((prices[offer_items[bought], offer_stores[bought]] * qty[bought]).sum())
+    return {"plan": plan, "total_cost": cost, "status": status, "engine": "milp",
+            "gap": 0.0 if status == "Optimal" else None}
+
+def assignmentSolver(store_item_prices, item_requirements, max_stores=5, gap_threshold=None, warm_stores=None):
+    # store_item_prices: PriceMatrix, or [(store_id, item_id, price, inventory), …],
+    #                    or the same as columns (store_ids, item_ids, prices, inventory)
+    # item_requirements: { item_id: required_qty, … }
+    # max_stores: maximum distinct stores you may visit
+    # gap_threshold: largest relative gap between the heuristic plan and the lower
+    #                bound that is accepted without running the MILP
+    # warm_stores: stores of a previous plan for a similar basket; the heuristic
+    #              starts from them and its plan seeds the MILP
+    #
+    # Tiers, cheapest first:
+    #   relaxation  - the cheapest-per-item plan already uses <= max_stores stores
+    #   enumeration - every max_stores-subset of the candidate stores is scored
+    #   heuristic   - greedy + swap local search, accepted if within gap_threshold
+    #   milp        - the full PuLP/CBC model
+    # The result reports the engine and the relative gap to the lower bound.
+
+    store_item_prices = PriceMatrix.of(store_item_prices)
+    logger.debug('assignment: %d offers, requirements %s, max_stores %s', store_item_prices.offer_count,
+                 payload(item_requirements), max_stores)
+    if logger.isEnabledFor(logging.DEBUG):
+        # the matrix's repr is only its shape; dumped requests get every offer
+        logger.debug('offers: %s', payload(store_item_prices.rows()))
+
+    if gap_threshold is None:
+        gap_threshold = config.SOLVER_GAP_THRESHOLD
+
+    item_list, store_list, prices, stock, required = dense_offers(store_item_prices, item_requirements)
+
+    if not item_list:
+        return {"plan": [], "total_cost": 0.0, "status": "Optimal", "engine": "relaxation", "gap": 0.0}
+
+    # lower bound: buy everything at the cheapest stores, ignoring the store cap
+    shortfall, lower_bound, take = fill_cheapest(prices, stock, required)
+    if shortfall > 0:
+        return {"plan": [], "total_cost": None, "status": "Infeasible", "engine": "relaxation", "gap": None}
+    lower_bound = float(lower_bound)
+    used = np.flatnonzero(take.any(axis=0))
+    if len(used) <= max_stores:
+        plan, cost = plan_for(prices, stock, required, used, store_list, item_list)
+        return {"plan": plan, "total_cost": cost, "status": "Optimal", "engine": "relaxation", "gap": 0.0}
+
+    if max_stores < 1:
+        return {"plan": [], "total_cost": None, "status": "Infeasible", "engine": "relaxation", "gap": None}
+    # more than max_stores stores are needed at the bound, so exactly max_stores are used
+    k = max_stores
+
+    if math.comb(len(store_list), k) <= config.SOLVER_ENUMERATION_LIMIT:
+        subsets = np.array(list(itertools.combinations(range(len(store_list)), k)), dtype=np.int64)
+        short, cost = _evaluate(prices, stock, required, subsets)
+        best = _best(short, cost)
+        if short[best] > 0:
+            return {"plan": [], "total_cost": None, "status": "Infeasible", "engine": "enumeration", "gap": None}
+        plan, cost = plan_for(prices, stock, required, subsets[best], store_list, item_list)
+        return {"plan": plan, "total_cost": cost, "status": "Optimal", "engine": "enumeration", "gap": 0.0}
+
+    seed = [store_list.index(s) for s in (warm_stores or ()) if s in store_list]
+    with span('heuristic'):
+        chosen, (short, cost) = _heuristic(prices, stock, required, k, config.SOLVER_LOCAL_SEARCH_ITERATIONS, seed)
+    incumbent = None
+    heuristic = None
+    if short == 0:
+        gap = max(0.0, (cost - lower_bound) / cost) if cost > 0 else 0.0
+        plan, cost = plan_for(prices, stock, required, np.array(chosen), store_list, item_list)
+        incumbent = plan
+        heuristic = {
+            "plan": plan,
+            "total_cost": cost,
+            "status": "Optimal" if gap < 1e-9 else "Feasible",
+            "engine": "heuristic",
+            "gap": gap
+        }
+        if gap <= gap_threshold:
+            return heuristic
+
+    if config.SOLVER_MILP_BACKEND == "pulp":
+        result = _milp_solve(store_item_prices.rows(), item_requirements, max_stores, incumbent)
+    else:
+        result = _matrix_milp_solve(prices, stock, required, k, store_list, item_list, incumbent)
+    if result["status"] not in ("Optimal", "Feasible") and heuristic is not None:
+        # CBC failed or found nothing in time; the heuristic plan still stands
+        logger.warning('MILP %s, falling back to the heuristic plan', result["status"])
+        return heuristic
+    return result
+
 if __name__ == "__main__":
+    import sqlite3
+
+    from app.db.query import get_all_products, get_all_stores, price_matrix
+
     # Query database for store_item_prices, item_names, and store_names
     num = 5
-    conn = create_connection()
+    conn = sqlite3.connect(config.DATABASE_PATH)
     items = get_all_products(conn)[:num]
     requirements = [81, 2, 2, 2, 2]  # Example requirements for the first 5 items
-    conn = create_connection()
     stores = get_all_stores(conn)
 
     # Use first 5 items and stores for testing
-    conn = create_connection()
-    store_item_prices = build_item_store_matrix(conn, items, stores)
+    store_item_prices = price_matrix(conn, [item['id'] for item in items], [store['id'] for store in stores])
     # Call the optimizer
-    result = translate_ip_result_to_plan(optimize(store_item_prices, requirements), items, stores)
+    result = translate_ip_result_to_plan(
+        optimize(store_item_prices, {item['id']: qty for item, qty in zip(items, requirements)}),
+        items, stores, store_item_prices
+    )
 
     print("We need to buy:")
     for i in range(num):
@@ -146,7 +399,7 @@ if __name__ == "__main__":
             # X of Y for $Z Each for a total of $W
             item = purchase['item']
             quantity = purchase['quantity']
-            price_per_item = next((p for (s, i, p, inv) in store_item_prices if s == next(sid for sid, sname in [(st['id'], st['name']) for st in stores] if sname == store) and i == next(iid for iid, iname in [(it['id'], it['name']) for it in items] if iname == item)), None)
+            price_per_item = purchase['price']
             total_price = price_per_item * quantity
             print(f"  - {quantity} of {item} for ${price_per_item:.2f} each, total ${total_price:.2f}")
-    print(f"\nTotal cost: ${result['total_cost']:.2f}")
\ No newline at end of file
+    print(f"\nTotal cost: ${result['cost']:.2f}")
\ No newline at end of file
@@ -1,113 +1,46 @@
-import pulp
-from geopy.distance import geodesic
-
-def optimize_path(stores, starting_point=None):
+import numpy as np
+
+from app.calculator.distance import distance_matrix as compute_distances
+from app.calculator.routing import solve_route
+
+def optimize_path(stores, starting_point=None, strategy=None, store_distances=None):
+    """
+    Order stores into the shortest open walk from the starting point.
+    :param stores: list of dicts with 'lat' and 'lon'
+    :param starting_point: (lat, lon), defaults to the first store
+    :param strategy: routing strategy name, see routing.ROUTING_STRATEGIES
+    :param store_distances: optional precomputed store × store meters in `stores` order,
+                            so only the row from the starting point is computed here
+    :return: dict with 'ordered_stores', 'total_distance_meters' and 'status'
+    """
     if not stores:
-        return []
+        return {
+            'ordered_stores': [],
+            'total_distance_meters': 0.0,
+            'status': 'Optimal'
+        }
 
     # if no explicit start, use the first store
     if starting_point is None:
         starting_point = (stores[0]['lat'], stores[0]['lon'])
 
-    # build locations list: 0 = start, 1..n-1 = stores
-    num_locations = len(stores) + 1
-    locations = [starting_point] + [(s['lat'], s['lon']) for s in stores]
-
-    # distance matrix
-    distance_matrix = [[0.0]*num_locations for _ in range(num_locations)]
-    for i in range(num_locations):
-        for j in range(num_locations):
-            if i != j:
-                distance_matrix[i][j] = geodesic(locations[i], locations[j]).meters
-
-    # set up the LP
-    prob = pulp.LpProblem("Open_TSP", pulp.LpMinimize)
-    x = pulp.LpVariable.dicts(
-        "x",
-        ((i, j)
-         for i in range(num_locations)
-         for j in range(num_locations)
-         if i != j),
-        cat="Binary"
-    )
-    # only one u‐var per store (1..n-1), domain [1..n-1]
-    u = pulp.LpVariable.dicts(
-        "u",
-        (i for i in range(1, num_locations)),
-        lowBound=1,
-        upBound=num_locations - 1,
-        cat="Continuous"
-    )
-
-    # objective: total travel distance
-    prob += pulp.lpSum(distance_matrix[i][j] * x[i, j]
-                       for (i, j) in x)
-
-    # ---- start‐node constraints ----
-    # exactly one arc out of start
-    prob += pulp.lpSum(x[0, j] for j in range(1, num_locations)) == 1
-    # no arcs back into start
-    prob += pulp.lpSum(x[j, 0] for j in range(1, num_locations)) == 0
-
-    # ---- store‐node constraints ----
-    for i in range(1, num_locations):
-        # exactly one incoming arc to each store
-        prob += pulp.lpSum(x[j, i]
-                           for j in range(num_locations) if j != i) == 1
-        # at most one outgoing arc from each store
-        prob += pulp.lpSum(x[i, j]
-                           for j in range(num_locations) if i != j) <= 1
-
-    # force exactly (n-2) total outgoing arcs from stores,
-    # so exactly one store ends the path
-    prob += (
-        pulp.lpSum(x[i, j]
-                   for i in range(1, num_locations)
-                   for j in range(num_locations)
-                   if i != j)
-        == num_locations - 2
-    )
-
-    # ---- MTZ subtour‐elimination (only among stores) ----
-    for i in range(1, num_locations):
-        for j in range(1, num_locations):
-            if i != j:
-                prob += (
-                    u[i]
-                    - u[j]
-                    + (num_locations - 1) * x[i, j]
-                    <= num_locations - 2
-                )
-
-    # solve
-    prob.solve()
-
-    # check status
-    status = pulp.LpStatus[prob.status]
-    if status != "Optimal":
-        return []
+    # distance matrix: 0 = start, 1..n = stores
+    store_points = [(s['lat'], s['lon']) for s in stores]
+    if store_distances is None:
+        store_distances = compute_distances(store_points)
+    from_start = compute_distances([starting_point], store_points)[0]
+    matrix = np.zeros((len(stores) + 1, len(stores) + 1))
+    matrix[0, 1:] = from_start
+    matrix[1:, 0] = from_start
+    matrix[1:, 1:] = store_distances
+    distance_matrix = matrix.tolist()
 
-    # rebuild the path
-    path = []
-    current = 0
-    while True:
-        # find the one arc out of current
-        nxt = next(
-            (j for j in range(num_locations)
-             if j != current
-             and (current, j) in x
-             and pulp.value(x[current, j]) > 0.5),
-            None
-        )
-        if nxt is None or nxt == 0:
-            break
-        path.append(nxt)
-        current = nxt
+    path, distance, status = solve_route(distance_matrix, strategy)
 
     # map back to stores (skip index 0)
     ordered = [stores[idx - 1] for idx in path]
     return {
         'ordered_stores': ordered,
-        'total_distance_meters': pulp.value(prob.objective),
+        'total_distance_meters': distance,
         'status': status
     }
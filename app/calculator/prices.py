@@ -0,0 +1,153 @@
+import numpy as np
+
+# The item-store offers a basket is solved over, as arrays shared by the DB layer
+# (query.price_matrix, CatalogSnapshot.item_store_matrix), the planner and the solvers.
+
+
+def _positions(ids, wanted):
+    """Positions in the sorted array ids of the wanted ids that are present, in id order."""
+    wanted = np.unique(np.asarray(wanted, dtype=np.int64))
+    pos = np.searchsorted(ids, wanted)
+    found = pos < len(ids)
+    found[found] = ids[pos[found]] == wanted[found]
+    return pos[found]
+
+
+def _index(positions):
+    """A slice when positions are one contiguous run (so numpy returns views), else the positions."""
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        return slice(int(positions[0]), int(positions[-1]) + 1)
+    return positions
+
+
+class PriceMatrix:
+    """
+    Dense item × store offers. Row r is the product item_ids[r], column c the store
+    store_ids[c] (both ascending); prices[r, c] is its unit price there, inf when
+    the store has no stock, and stock[r, c] the units available (0 when none).
+
+    Ids map to positions by binary search over item_ids / store_ids, so no dicts
+    are built per request. take() and select() return views of the same arrays
+    whenever the rows and columns kept are contiguous runs.
+    """
+
+    def __init__(self, item_ids, store_ids, prices, stock):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.store_ids = np.asarray(store_ids, dtype=np.int64)
+        self.prices = prices
+        self.stock = stock
+
+    @classmethod
+    def from_columns(cls, store_ids, item_ids, prices, inventory):
+        """From parallel arrays of offers (query.item_store_offers); offers without stock are dropped."""
+        store_ids, item_ids = np.asarray(store_ids, dtype=np.int64), np.asarray(item_ids, dtype=np.int64)
+        prices, inventory = np.asarray(prices, dtype=np.float64), np.asarray(inventory, dtype=np.int64)
+        keep = inventory > 0
+        items, stores = np.unique(item_ids[keep]), np.unique(store_ids[keep])
+        matrix = cls.empty(items, stores)
+        rows, cols = np.searchsorted(items, item_ids[keep]), np.searchsorted(stores, store_ids[keep])
+        matrix.prices[rows, cols] = prices[keep]
+        matrix.stock[rows, cols] = inventory[keep]
+        return matrix
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From a list of (store_id, item_id, price, inventory) tuples."""
+        columns = list(zip(*((s, i, p, inv or 0) for s, i, p, inv in rows))) or [(), (), (), ()]
+        return cls.from_columns(*columns)
+
+    @classmethod
+    def of(cls, offers):
+        """offers as a PriceMatrix: passed through, or built from rows or columns."""
+        if isinstance(offers, cls):
+            return offers
+        if isinstance(offers, list):
+            return cls.from_rows(offers)
+        return cls.from_columns(*offers)
+
+    @classmethod
+    def empty(cls, item_ids, store_ids):
+        shape = (len(item_ids), len(store_ids))
+        return cls(item_ids, store_ids, np.full(shape, np.inf), np.zeros(shape, dtype=np.int64))
+
+    @property
+    def shape(self):
+        return self.prices.shape
+
+    @property
+    def offer_count(self):
+        return int(np.count_nonzero(self.stock))
+
+    def __bool__(self):
+        return bool(self.stock.any())
+
+    def __repr__(self):
+        return f'PriceMatrix({len(self.item_ids)} items × {len(self.store_ids)} stores, {self.offer_count} offers)'
+
+    def __getstate__(self):
+        # sent to solver workers as the offer cells alone, so sparse matrices (and
+        # views, which would otherwise carry their whole base array) stay small
+        offers = np.flatnonzero(self.stock)
+        return {'item_ids': self.item_ids, 'store_ids': self.store_ids,
+                'offers': offers.astype(np.min_scalar_type(self.stock.size)),
+                'prices': self.prices.ravel()[offers], 'stock': self.stock.ravel()[offers].astype(np.int32)}
+
+    def __setstate__(self, state):
+        self.item_ids, self.store_ids = state['item_ids'], state['store_ids']
+        shape = (len(self.item_ids), len(self.store_ids))
+        self.prices, self.stock = np.full(shape, np.inf), np.zeros(shape, dtype=np.int64)
+        self.prices.ravel()[state['offers']] = state['prices']
+        self.stock.ravel()[state['offers']] = state['stock']
+
+    def item_positions(self, item_ids):
+        return _positions(self.item_ids, item_ids)
+
+    def store_positions(self, store_ids):
+        return _positions(self.store_ids, store_ids)
+
+    def select(self, rows=None, columns=None):
+        """The matrix restricted to row and column positions (ascending); views when they are contiguous."""
+        rows = slice(None) if rows is None else _index(np.asarray(rows, dtype=np.int64))
+        columns = slice(None) if columns is None else _index(np.asarray(columns, dtype=np.int64))
+        if isinstance(rows, slice) or isinstance(columns, slice):
+            prices, stock = self.prices[rows, columns], self.stock[rows, columns]
+        else:
+            prices, stock = self.prices[np.ix_(rows, columns)], self.stock[np.ix_(rows, columns)]
+        return PriceMatrix(self.item_ids[rows], self.store_ids[columns], prices, stock)
+
+    def take(self, item_ids=None, store_ids=None):
+        """The offers of the given items at the given stores (None keeps all); unknown ids are skipped."""
+        return self.select(None if item_ids is None else self.item_positions(item_ids),
+                           None if store_ids is None else self.store_positions(store_ids))
+
+    def merge(self, other):
+        """Both matrices' offers over the union of their items and stores; other's win where both have one."""
+        items, stores = np.union1d(self.item_ids, other.item_ids), np.union1d(self.store_ids, other.store_ids)
+        merged = PriceMatrix.empty(items, stores)
+        for part in (self, other):
+            at = np.ix_(np.searchsorted(items, part.item_ids), np.searchsorted(stores, part.store_ids))
+            offered = part.stock > 0
+            merged.prices[at] = np.where(offered, part.prices, merged.prices[at])
+            merged.stock[at] = np.where(offered, part.stock, merged.stock[at])
+        return merged
+
+    def for_items(self, item_ids):
+        """Rows for exactly item_ids (sorted), with empty rows for items nobody stocks."""
+        item_ids = np.unique(np.asarray(item_ids, dtype=np.int64))
+        rows = self.item_positions(item_ids)
+        if len(rows) == len(item_ids):
+            return self.select(rows)
+        return PriceMatrix.empty(item_ids, self.store_ids).merge(self.select(rows))
+
+    def price(self, store_id, item_id):
+        """Unit price of item_id at store_id, or None without an offer."""
+        row, col = self.item_positions([item_id]), self.store_positions([store_id])
+        if not len(row) or not len(col) or not self.stock[row[0], col[0]]:
+            return None
+        return float(self.prices[row[0], col[0]])
+
+    def rows(self):
+        """The offers as (store_id, item_id, price, inventory) tuples, by item then store."""
+        rows, cols = np.nonzero(self.stock)
+        return list(zip(self.store_ids[cols].tolist(), self.item_ids[rows].tolist(),
+                        self.prices[rows, cols].tolist(), self.stock[rows, cols].tolist()))
@@ -0,0 +1,251 @@
+import time
+
+import pulp
+
+from app import config
+from app.calculator.optimizer import cbc_solver
+
+# Open-path routing over a distance matrix where node 0 is the starting point and
+# nodes 1..n are stores. Every strategy returns (order, distance, status) where
+# order lists the store nodes in visiting order.
+
+
+def path_length(distance_matrix, order):
+    total = 0.0
+    prev = 0
+    for node in order:
+        total += distance_matrix[prev][node]
+        prev = node
+    return total
+
+
+def held_karp(distance_matrix, time_budget=None):
+    """Exact bitmask DP, O(2^n * n^2). Only meant for small n."""
+    n = len(distance_matrix) - 1
+    if n == 0:
+        return [], 0.0, "Optimal"
+    full = (1 << n) - 1
+    # cost[mask][j]: shortest path from the start through exactly `mask`, ending at store j
+    cost = [[float("inf")] * n for _ in range(full + 1)]
+    parent = [[-1] * n for _ in range(full + 1)]
+    for j in range(n):
+        cost[1 << j][j] = distance_matrix[0][j + 1]
+    for mask in range(1, full + 1):
+        row = cost[mask]
+        for j in range(n):
+            base = row[j]
+            if base == float("inf"):
+                continue
+            dist_j = distance_matrix[j + 1]
+            for k in range(n):
+                bit = 1 << k
+                if mask & bit:
+                    continue
+                candidate = base + dist_j[k + 1]
+                if candidate < cost[mask | bit][k]:
+                    cost[mask | bit][k] = candidate
+                    parent[mask | bit][k] = j
+
+    last = min(range(n), key=lambda j: cost[full][j])
+    best = cost[full][last]
+    order = []
+    mask = full
+    while last != -1:
+        order.append(last + 1)
+        prev = parent[mask][last]
+        mask &= ~(1 << last)
+        last = prev
+    order.reverse()
+    return order, best, "Optimal"
+
+
+def _nearest_neighbour(distance_matrix):
+    unvisited = set(range(1, len(distance_matrix)))
+    order = []
+    current = 0
+    while unvisited:
+        current = min(unvisited, key=lambda j: (distance_matrix[current][j], j))
+        unvisited.remove(current)
+        order.append(current)
+    return order
+
+
+def _two_opt(distance_matrix, path, deadline):
+    """Reverse path[i..j] while it shortens the route. path[0] is the fixed start."""
+    d = distance_matrix
+    n = len(path)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                before = d[path[i - 1]][path[i]]
+                after = d[path[i - 1]][path[j]]
+                if j + 1 < n:
+                    before += d[path[j]][path[j + 1]]
+                    after += d[path[i]][path[j + 1]]
+                if after < before - 1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+    return path
+
+
+def _or_opt(distance_matrix, path, deadline):
+    """Move segments of 1-3 stores to a better position while it shortens the route."""
+    improved = True
+    best = path_length(distance_matrix, path[1:])
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in (1, 2, 3):
+            for i in range(1, len(path) - length + 1):
+                segment = path[i:i + length]
+                rest = path[:i] + path[i + length:]
+                for pos in range(1, len(rest) + 1):
+                    if pos == i:
+                        continue
+                    for seg in (segment, segment[::-1]):
+                        candidate = rest[:pos] + seg + rest[pos:]
+                        length_candidate = path_length(distance_matrix, candidate[1:])
+                        if length_candidate < best - 1e-9:
+                            path, best, improved = candidate, length_candidate, True
+                            break
+                    if improved:
+                        break
+                if improved or time.perf_counter() >= deadline:
+                    break
+            if improved or time.perf_counter() >= deadline:
+                break
+    return path
+
+
+def local_search(distance_matrix, time_budget=None):
+    """Nearest neighbour construction improved by 2-opt and Or-opt until the time budget runs out."""
+    if time_budget is None:
+        time_budget = config.ROUTING_TIME_BUDGET
+    deadline = time.perf_counter() + time_budget
+    path = [0] + _nearest_neighbour(distance_matrix)
+    best = path_length(distance_matrix, path[1:])
+    while time.perf_counter() < deadline:
+        path = _two_opt(distance_matrix, path, deadline)
+        path = _or_opt(distance_matrix, path, deadline)
+        length = path_length(distance_matrix, path[1:])
+        if length >= best - 1e-9:
+            break
+        best = length
+    return path[1:], path_length(distance_matrix, path[1:]), "Feasible"
+
+
+def mtz_milp(distance_matrix, time_budget=None):
+    """Open TSP as an MTZ MILP solved with CBC."""
+    num_locations = len(distance_matrix)
+    if num_locations == 1:
+        return [], 0.0, "Optimal"
+
+    # set up the LP
+    prob = pulp.LpProblem("Open_TSP", pulp.LpMinimize)
+    x = pulp.LpVariable.dicts(
+        "x",
+        ((i, j)
+         for i in range(num_locations)
+         for j in range(num_locations)
+         if i != j),
+        cat="Binary"
+    )
+    # only one u‐var per store (1..n-1), domain [1..n-1]
+    u = pulp.LpVariable.dicts(
+        "u",
+        (i for i in range(1, num_locations)),
+        lowBound=1,
+        upBound=num_locations - 1,
+        cat="Continuous"
+    )
+
+    # objective: total travel distance
+    prob += pulp.lpSum(distance_matrix[i][j] * x[i, j]
+                       for (i, j) in x)
+
+    # ---- start‐node constraints ----
+    # exactly one arc out of start
+    prob += pulp.lpSum(x[0, j] for j in range(1, num_locations)) == 1
+    # no arcs back into start
+    prob += pulp.lpSum(x[j, 0] for j in range(1, num_locations)) == 0
+
+    # ---- store‐node constraints ----
+    for i in range(1, num_locations):
+        # exactly one incoming arc to each store
+        prob += pulp.lpSum(x[j, i]
+                           for j in range(num_locations) if j != i) == 1
+        # at most one outgoing arc from each store
+        prob += pulp.lpSum(x[i, j]
+                           for j in range(num_locations) if i != j) <= 1
+
+    # force exactly (n-2) total outgoing arcs from stores,
+    # so exactly one store ends the path
+    prob += (
+        pulp.lpSum(x[i, j]
+                   for i in range(1, num_locations)
+                   for j in range(num_locations)
+                   if i != j)
+        == num_locations - 2
+    )
+
+    # ---- MTZ subtour‐elimination (only among stores) ----
+    for i in range(1, num_locations):
+        for j in range(1, num_locations):
+            if i != j:
+                prob += (
+                    u[i]
+                    - u[j]
+                    + (num_locations - 1) * x[i, j]
+                    <= num_locations - 2
+                )
+
+    # solve quietly
+    prob.solve(cbc_solver(time_budget))
+
+    # check status
+    status = pulp.LpStatus[prob.status]
+    if status != "Optimal":
+        return [], None, status
+
+    # rebuild the path
+    path = []
+    current = 0
+    while True:
+        # find the one arc out of current
+        nxt = next(
+            (j for j in range(num_locations)
+             if j != current
+             and (current, j) in x
+             and pulp.value(x[current, j]) > 0.5),
+            None
+        )
+        if nxt is None or nxt == 0:
+            break
+        path.append(nxt)
+        current = nxt
+    return path, pulp.value(prob.objective), status
+
+
+ROUTING_STRATEGIES = {
+    "held_karp": held_karp,
+    "local_search": local_search,
+    "milp": mtz_milp,
+}
+
+
+def select_strategy(num_stores):
+    return "held_karp" if num_stores <= config.ROUTING_EXACT_MAX_STORES else "local_search"
+
+
+def solve_route(distance_matrix, strategy=None, time_budget=None):
+    """
+    Order the stores of `distance_matrix` (node 0 = start) into the shortest open path.
+    :param strategy: name from ROUTING_STRATEGIES, picked by store count when None
+    :return: (order, total_distance, status)
+    """
+    if strategy is None:
+        strategy = select_strategy(len(distance_matrix) - 1)
+    if strategy not in ROUTING_STRATEGIES:
+        raise ValueError(f"Unknown routing strategy {strategy!r}")
+    return ROUTING_STRATEGIES[strategy](distance_matrix, time_budget)
@@ -0,0 +1,102 @@
+import os
+
+APP_DIR = os.path.dirname(__file__)
+
+# SQLite database served by the API
+DATABASE_PATH = os.environ.get(
+    'BASKETROUTE_DATABASE', os.path.join(APP_DIR, 'db', 'fake_basketroute.db')
+)
+
+# Seconds between checks of the catalog's last_updated fingerprint
+CATALOG_REFRESH_INTERVAL = float(os.environ.get('BASKETROUTE_CATALOG_REFRESH_INTERVAL', 30))
+
+# Read connection pool
+DB_POOL_SIZE = int(os.environ.get('BASKETROUTE_DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('BASKETROUTE_DB_POOL_TIMEOUT', 10))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('BASKETROUTE_DB_STATEMENT_CACHE_SIZE', 128))
+DB_WAL = os.environ.get('BASKETROUTE_DB_WAL', '1') == '1'
+
+# Tiered assignment solver
+SOLVER_ENUMERATION_LIMIT = int(os.environ.get('BASKETROUTE_SOLVER_ENUMERATION_LIMIT', 5000))
+SOLVER_GAP_THRESHOLD = float(os.environ.get('BASKETROUTE_SOLVER_GAP_THRESHOLD', 0.01))
+SOLVER_LOCAL_SEARCH_ITERATIONS = int(os.environ.get('BASKETROUTE_SOLVER_LOCAL_SEARCH_ITERATIONS', 50))
+# 'matrix' builds the MILP as sparse arrays; 'pulp' uses the PuLP model
+SOLVER_MILP_BACKEND = os.environ.get('BASKETROUTE_SOLVER_MILP_BACKEND', 'matrix')
+
+# Routing: exact Held-Karp up to this many stores, heuristics with a time budget above
+ROUTING_EXACT_MAX_STORES = int(os.environ.get('BASKETROUTE_ROUTING_EXACT_MAX_STORES', 8))
+ROUTING_TIME_BUDGET = float(os.environ.get('BASKETROUTE_ROUTING_TIME_BUDGET', 0.05))
+
+# Nearby-store search
+SPATIAL_CELL_DEGREES = float(os.environ.get('BASKETROUTE_SPATIAL_CELL_DEGREES', 0.01))
+NEARBY_RADIUS_KM = float(os.environ.get('BASKETROUTE_NEARBY_RADIUS_KM', 5))
+NEARBY_MAX_STORES = int(os.environ.get('BASKETROUTE_NEARBY_MAX_STORES', 20))
+
+# Joint price + travel optimization
+JOINT_DISTANCE_WEIGHT = float(os.environ.get('BASKETROUTE_JOINT_DISTANCE_WEIGHT', 0.5))  # $ per km
+JOINT_NODE_LIMIT = int(os.environ.get('BASKETROUTE_JOINT_NODE_LIMIT', 5000))
+JOINT_MAX_CANDIDATES = int(os.environ.get('BASKETROUTE_JOINT_MAX_CANDIDATES', 15))
+
+# Optimize result caches
+RESULT_CACHE_SIZE = int(os.environ.get('BASKETROUTE_RESULT_CACHE_SIZE', 1024))
+ROUTE_CACHE_SIZE = int(os.environ.get('BASKETROUTE_ROUTE_CACHE_SIZE', 4096))
+RESULT_CACHE_TTL = float(os.environ.get('BASKETROUTE_RESULT_CACHE_TTL', 300))
+# Baskets kept for editing by plan_id
+PLAN_STORE_SIZE = int(os.environ.get('BASKETROUTE_PLAN_STORE_SIZE', 10000))
+PLAN_STORE_TTL = float(os.environ.get('BASKETROUTE_PLAN_STORE_TTL', 3600))
+# Starting points in the same bucket (~110 m) share candidate stores and price plans
+START_BUCKET_DEGREES = float(os.environ.get('BASKETROUTE_START_BUCKET_DEGREES', 0.001))
+
+# Batch optimization
+BATCH_MAX_BASKETS = int(os.environ.get('BASKETROUTE_BATCH_MAX_BASKETS', 200))
+
+# Solver worker processes (0 solves in the request thread)
+SOLVER_WORKERS = int(os.environ.get('BASKETROUTE_SOLVER_WORKERS', os.cpu_count() or 1))
+# Jobs allowed to wait for a worker before new ones are refused
+SOLVER_QUEUE_DEPTH = int(os.environ.get('BASKETROUTE_SOLVER_QUEUE_DEPTH', 64))
+# Seconds a job may run before its worker is replaced; CBC is asked to stop a little earlier
+SOLVER_TIME_LIMIT = float(os.environ.get('BASKETROUTE_SOLVER_TIME_LIMIT', 10))
+# Where CBC writes its model and solution files; tmpfs keeps them off disk
+SOLVER_TMP_DIR = os.environ.get('BASKETROUTE_SOLVER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else '')
+
+# Asynchronous /api/optimize jobs
+ASYNC_WORKERS = int(os.environ.get('BASKETROUTE_ASYNC_WORKERS', 4))
+ASYNC_MAX_PENDING = int(os.environ.get('BASKETROUTE_ASYNC_MAX_PENDING', 256))
+# Seconds a finished job's result stays available for polling
+ASYNC_JOB_TTL = float(os.environ.get('BASKETROUTE_ASYNC_JOB_TTL', 300))
+
+# Requests slower than this many seconds are appended to SLOW_REQUEST_LOG (unset disables)
+SLOW_REQUEST_SECONDS = float(os.environ.get('BASKETROUTE_SLOW_REQUEST_SECONDS', 1.0))
+SLOW_REQUEST_LOG = os.environ.get('BASKETROUTE_SLOW_REQUEST_LOG', '')
+# Largest request body kept in a slow-request entry, in characters
+SLOW_REQUEST_BODY_LIMIT = int(os.environ.get('BASKETROUTE_SLOW_REQUEST_BODY_LIMIT', 4096))
+
+# Logging
+LOG_LEVEL = os.environ.get('BASKETROUTE_LOG_LEVEL', 'INFO').upper()
+# Share of requests logged at DEBUG regardless of LOG_LEVEL
+LOG_SAMPLE_RATE = float(os.environ.get('BASKETROUTE_LOG_SAMPLE_RATE', 0))
+# Longest payload repr in a log record, in characters
+LOG_PAYLOAD_LIMIT = int(os.environ.get('BASKETROUTE_LOG_PAYLOAD_LIMIT', 512))
+# Comma-separated X-Request-ID values logged at DEBUG with payloads in full
+LOG_DEBUG_REQUEST_IDS = frozenset(filter(None, os.environ.get('BASKETROUTE_LOG_DEBUG_REQUEST_IDS', '').split(',')))
+
+# Price feed ingestion: rows per write transaction, and seconds to wait for the write lock
+INGEST_BATCH_SIZE = int(os.environ.get('BASKETROUTE_INGEST_BATCH_SIZE', 5000))
+INGEST_BUSY_TIMEOUT = float(os.environ.get('BASKETROUTE_INGEST_BUSY_TIMEOUT', 30))
+
+# Distinct product names remembered by the canonical item matcher
+ITEM_MATCH_CACHE_SIZE = int(os.environ.get('BASKETROUTE_ITEM_MATCH_CACHE_SIZE', 65536))
+
+# Product and store search
+SEARCH_MAX_LIMIT = int(os.environ.get('BASKETROUTE_SEARCH_MAX_LIMIT', 100))
+# Words shorter than this are never typo-corrected
+SEARCH_FUZZY_MIN_LENGTH = int(os.environ.get('BASKETROUTE_SEARCH_FUZZY_MIN_LENGTH', 3))
+# Corrections tried per misspelled word
+SEARCH_FUZZY_ALTERNATIVES = int(os.environ.get('BASKETROUTE_SEARCH_FUZZY_ALTERNATIVES', 5))
+
+# Catalog listing endpoints: largest page a client may ask for, and rows fetched per batch when streaming
+CATALOG_PAGE_MAX = int(os.environ.get('BASKETROUTE_CATALOG_PAGE_MAX', 1000))
+CATALOG_STREAM_BATCH = int(os.environ.get('BASKETROUTE_CATALOG_STREAM_BATCH', 500))
+
+# Item-store matrix queries bind id lists longer than this as one JSON array instead of an IN (?, ...) list
+MATRIX_INLINE_IDS = int(os.environ.get('BASKETROUTE_MATRIX_INLINE_IDS', 200))
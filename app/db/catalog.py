@@ -0,0 +1,269 @@
+import itertools
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from app import config
+from app.calculator.distance import bounding_box, distance_matrix
+from app.calculator.prices import PriceMatrix
+from app.db.init_db import get_meta, stores_version
+from app.db.pool import get_pool
+
+# Write counters (init_db.add_change_counters) catch every insert, update and
+# delete; the MAX(last_updated) columns give listings their Last-Modified.
+VERSION_QUERY = '''
+    SELECT
+        (SELECT changes FROM CatalogChanges WHERE tbl = 'Stores'),
+        (SELECT MAX(last_updated) FROM Stores),
+        (SELECT changes FROM CatalogChanges WHERE tbl = 'Products'),
+        (SELECT changes FROM CatalogChanges WHERE tbl = 'StoreProducts'),
+        (SELECT MAX(last_updated) FROM StoreProducts),
+        (SELECT MAX(last_updated) FROM Products)
+'''
+
+
+# load order of snapshots in this process
+_generations = itertools.count(1)
+
+
+def catalog_version(conn):
+    """
+    Cheap fingerprint of the catalog tables. It changes with every committed
+    insert, update or delete on Stores, Products or StoreProducts.
+    """
+    return tuple(conn.execute(VERSION_QUERY).fetchone())
+
+
+class CatalogSnapshot:
+    """
+    Immutable in-memory copy of Stores, Products and StoreProducts.
+
+    Offers are held per product in CSR form: the offers for the product at index p
+    are offer_store[offer_indptr[p]:offer_indptr[p + 1]] (store indices) with the
+    matching offer_price / offer_inventory entries.
+    """
+
+    def __init__(self, version, stores, products, offers, store_distances=None):
+        self.version = version
+        self.generation = next(_generations)
+        self.loaded_at = time.time()
+
+        self.stores = stores
+        self.products = products
+        self.store_ids = np.array([s['id'] for s in stores], dtype=np.int64)
+        self.store_lat = np.array([s['lat'] for s in stores], dtype=np.float64)
+        self.store_lon = np.array([s['lon'] for s in stores], dtype=np.float64)
+        self.product_ids = np.array([p['id'] for p in products], dtype=np.int64)
+        self.store_index = {sid: idx for idx, sid in enumerate(self.store_ids.tolist())}
+        self.product_index = {pid: idx for idx, pid in enumerate(self.product_ids.tolist())}
+
+        # dense store × store meters, in store_ids order
+        if store_distances is None:
+            store_distances = distance_matrix(np.column_stack([self.store_lat, self.store_lon]))
+        self.store_distances = store_distances
+
+        # grid buckets of store indices for nearby-store search
+        self.cell_degrees = config.SPATIAL_CELL_DEGREES
+        self.grid = {}
+        cells = zip(np.floor(self.store_lat / self.cell_degrees).astype(np.int64).tolist(),
+                    np.floor(self.store_lon / self.cell_degrees).astype(np.int64).tolist())
+        for idx, cell in enumerate(cells):
+            self.grid.setdefault(cell, []).append(idx)
+
+        # offers: rows of (store_id, product_id, price, inventory) ordered by product_id
+        offer_store = np.empty(len(offers), dtype=np.int32)
+        offer_product = np.empty(len(offers), dtype=np.int32)
+        offer_price = np.empty(len(offers), dtype=np.float64)
+        offer_inventory = np.empty(len(offers), dtype=np.int64)
+        n = 0
+        for store_id, product_id, price, inventory in offers:
+            s = self.store_index.get(store_id)
+            p = self.product_index.get(product_id)
+            if s is None or p is None:
+                continue
+            offer_store[n] = s
+            offer_product[n] = p
+            offer_price[n] = price
+            offer_inventory[n] = inventory or 0
+            n += 1
+        self.offer_store = offer_store[:n]
+        self.offer_price = offer_price[:n]
+        self.offer_inventory = offer_inventory[:n]
+        counts = np.bincount(offer_product[:n], minlength=len(products))
+        self.offer_indptr = np.zeros(len(products) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offer_indptr[1:])
+
+    def get_products(self, product_ids):
+        """Products for the given ids, in request order, skipping unknown and repeated ids."""
+        seen = set()
+        products = []
+        for pid in product_ids:
+            idx = self.product_index.get(pid)
+            if idx is None or pid in seen:
+                continue
+            seen.add(pid)
+            products.append(self.products[idx])
+        return products
+
+    def get_stores(self, store_ids=None):
+        if store_ids is None:
+            return self.stores
+        return [self.stores[self.store_index[sid]] for sid in store_ids if sid in self.store_index]
+
+    def store_distance_matrix(self, store_ids):
+        """Meters between the given stores, rows and columns in the given order."""
+        idx = [self.store_index[sid] for sid in store_ids]
+        return self.store_distances[np.ix_(idx, idx)]
+
+    def distances_from(self, lat, lon, store_ids=None):
+        """Meters from (lat, lon) to the given stores (all stores by default)."""
+        if store_ids is None:
+            lats, lons = self.store_lat, self.store_lon
+        else:
+            idx = [self.store_index[sid] for sid in store_ids]
+            lats, lons = self.store_lat[idx], self.store_lon[idx]
+        return distance_matrix([(lat, lon)], np.column_stack([lats, lons]))[0]
+
+    def _cells_within(self, min_lat, max_lat, min_lon, max_lon):
+        lat_cells = range(int(np.floor(min_lat / self.cell_degrees)), int(np.floor(max_lat / self.cell_degrees)) + 1)
+        lon_cells = range(int(np.floor(min_lon / self.cell_degrees)), int(np.floor(max_lon / self.cell_degrees)) + 1)
+        if len(lat_cells) * len(lon_cells) > len(self.grid):
+            return [idx for (a, b), members in self.grid.items()
+                    if a in lat_cells and b in lon_cells for idx in members]
+        return [idx for a in lat_cells for b in lon_cells for idx in self.grid.get((a, b), ())]
+
+    def nearby(self, lat, lon, radius_km=None, limit=None):
+        """
+        k-nearest stores to (lat, lon) using the grid buckets, nearest first.
+        Only stores in cells overlapping the search circle are measured. Without a
+        radius the circle widens until `limit` stores are inside it.
+        Returns (store indices, distances in meters) as arrays.
+        """
+        if radius_km is None and limit is None:
+            radius_km = config.NEARBY_RADIUS_KM
+        search_m = radius_km * 1000 if radius_km is not None else self.cell_degrees * 111000
+        while True:
+            candidates = np.array(self._cells_within(*bounding_box(lat, lon, search_m)), dtype=np.int64)
+            distances = distance_matrix([(lat, lon)], np.column_stack([self.store_lat[candidates], self.store_lon[candidates]]))[0]
+            within = distances <= search_m
+            if radius_km is not None or within.sum() >= limit:
+                break
+            if len(candidates) >= len(self.stores):
+                within[:] = True
+                break
+            search_m *= 2
+        candidates, distances = candidates[within], distances[within]
+        order = np.argsort(distances, kind="stable")[:limit]
+        return candidates[order], distances[order]
+
+    def stores_nearby(self, lat, lon, radius_km=None, limit=None):
+        """Store dicts with 'distance_km', nearest first. See nearby()."""
+        indices, distances = self.nearby(lat, lon, radius_km, limit)
+        return [dict(self.stores[idx], distance_km=float(d) / 1000) for idx, d in zip(indices.tolist(), distances)]
+
+    def item_store_matrix(self, product_ids, store_ids=None):
+        """
+        In-memory equivalent of query.price_matrix.
+        Args:
+            product_ids (list of int): Products to include.
+            store_ids (list of int, optional): Restrict offers to these stores.
+        Returns:
+            PriceMatrix of the in-stock offers
+        """
+        products = np.unique([self.product_index[pid] for pid in product_ids if pid in self.product_index]).astype(np.int64)
+        lo, hi = self.offer_indptr[products], self.offer_indptr[products + 1]
+        counts = hi - lo
+        # offer positions of every product, and the matrix row each belongs to
+        offers = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows = np.repeat(np.arange(len(products)), counts)
+        keep = self.offer_inventory[offers] > 0
+        if store_ids is not None:
+            store_mask = np.zeros(len(self.stores), dtype=bool)
+            store_mask[[self.store_index[sid] for sid in store_ids if sid in self.store_index]] = True
+            keep &= store_mask[self.offer_store[offers]]
+        offers, rows = offers[keep], rows[keep]
+        # store indices follow store_ids order, which is ascending (stores are loaded by id)
+        stores, cols = np.unique(self.offer_store[offers], return_inverse=True)
+        matrix = PriceMatrix.empty(self.product_ids[products], self.store_ids[stores])
+        matrix.prices[rows, cols] = self.offer_price[offers]
+        matrix.stock[rows, cols] = self.offer_inventory[offers]
+        return matrix
+
+
+def load_catalog(conn):
+    version = catalog_version(conn)
+    stores = [{
+        'id': row[0],
+        'name': row[1],
+        'lat': row[2],
+        'lon': row[3],
+        'address': row[4],
+        'phone': row[5],
+        'website': row[6]
+    } for row in conn.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores ORDER BY id')]
+    products = [{
+        'id': row[0],
+        'name': row[1],
+        'category': row[2],
+        'unit': row[3]
+    } for row in conn.execute('SELECT id, name, category, unit FROM Products ORDER BY id')]
+    offers = conn.execute('''
+        SELECT store_id, product_id, price, inventory
+        FROM StoreProducts
+        ORDER BY product_id, store_id
+    ''').fetchall()
+    return CatalogSnapshot(version, stores, products, offers, load_store_distances(conn, stores))
+
+
+def load_store_distances(conn, stores):
+    """
+    Dense matrix from the precomputed StoreDistances table, or None when the table
+    is missing or was built for a different set of stores.
+    """
+    try:
+        if get_meta(conn, 'store_distances_version') != stores_version(conn):
+            return None
+    except sqlite3.OperationalError:
+        return None
+    index = {store['id']: idx for idx, store in enumerate(stores)}
+    matrix = np.zeros((len(stores), len(stores)))
+    for store_a, store_b, meters in conn.execute('SELECT store_a, store_b, meters FROM StoreDistances'):
+        a, b = index[store_a], index[store_b]
+        matrix[a, b] = matrix[b, a] = meters
+    return matrix
+
+
+_snapshot = None
+_last_check = 0.0
+_refresh_lock = threading.Lock()
+
+
+def refresh_catalog(force=False):
+    """
+    Reload the snapshot if the catalog fingerprint changed (or force is set) and
+    swap it in. Readers holding the previous snapshot keep a consistent view.
+    """
+    global _snapshot, _last_check
+    # Only the first load waits; later refreshes are skipped while one is running.
+    if not _refresh_lock.acquire(blocking=_snapshot is None):
+        return _snapshot
+    try:
+        if _snapshot is not None and not force and time.monotonic() - _last_check < config.CATALOG_REFRESH_INTERVAL:
+            return _snapshot
+        with get_pool().connection() as conn:
+            if force or _snapshot is None or catalog_version(conn) != _snapshot.version:
+                _snapshot = load_catalog(conn)
+        _last_check = time.monotonic()
+        return _snapshot
+    finally:
+        _refresh_lock.release()
+
+
+def get_catalog():
+    """Process-wide catalog snapshot, re-validated every CATALOG_REFRESH_INTERVAL seconds."""
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() - _last_check >= config.CATALOG_REFRESH_INTERVAL:
+        snapshot = refresh_catalog()
+    return snapshot
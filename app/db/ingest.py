@@ -0,0 +1,215 @@
+import csv
+import gzip
+import json
+import sqlite3
+import time
+import unicodedata
+from contextlib import closing
+
+from app import config
+from app.db.init_db import migrate
+from app.logs import get_logger
+
+logger = get_logger(__name__)
+
+# Price feeds are streamed into StoreProducts in short transactions so readers of
+# the serving database (WAL mode) keep their snapshot and the WAL stays small.
+
+UPSERT = '''
+INSERT INTO StoreProducts (store_id, product_id, price, inventory, last_updated)
+VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(store_id, product_id) DO UPDATE SET
+    price = excluded.price,
+    inventory = excluded.inventory,
+    last_updated = excluded.last_updated
+WHERE price != excluded.price OR inventory IS NOT excluded.inventory
+'''
+
+
+def normalize_name(name):
+    """Product name as stored: NFKC, surrounding and repeated whitespace removed."""
+    return ' '.join(unicodedata.normalize('NFKC', name).split())
+
+
+def name_key(name):
+    """Key two spellings of the same product name share."""
+    return normalize_name(name).casefold()
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_feed(path):
+    """Stream the records of a .csv or .jsonl/.ndjson file (optionally .gz) as dicts."""
+    base = path[:-3] if path.endswith('.gz') else path
+    with _open_text(path) as f:
+        if base.endswith('.csv'):
+            yield from csv.DictReader(f)
+        elif base.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f'Unsupported feed format: {path}')
+
+
+def _price(value):
+    if isinstance(value, str):
+        value = value.strip().lstrip('$').replace(',', '')
+    price = float(value)
+    if not price >= 0:
+        raise ValueError(f'bad price {value!r}')
+    return round(price, 2)
+
+
+def _inventory(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return max(0, int(float(value)))
+
+
+class Ingester:
+    """
+    Upserts normalized price records {'store_id' or 'store', 'product', 'price',
+    'inventory', 'category', 'unit'} into StoreProducts.
+
+    Stores are matched by id or exact name; records for unknown stores are
+    skipped. Products are matched on name_key and created when new. Only the
+    product and store lookups are held in memory, never the feed.
+    """
+
+    def __init__(self, conn, batch_size=None):
+        self.conn = conn
+        self.batch_size = batch_size or config.INGEST_BATCH_SIZE
+        self.store_ids = set()
+        self.stores_by_name = {}
+        for store_id, name in conn.execute('SELECT id, name FROM Stores'):
+            self.store_ids.add(store_id)
+            self.stores_by_name.setdefault(name, store_id)
+        self.products = {name_key(name): product_id for product_id, name in conn.execute('SELECT id, name FROM Products')}
+        self.stats = {'rows': 0, 'written': 0, 'unchanged': 0, 'skipped': 0, 'new_products': 0,
+                      'seconds': 0.0, 'rows_per_sec': 0.0}
+        self._reported = time.perf_counter()
+
+    def _store(self, record):
+        store_id = record.get('store_id')
+        if store_id not in (None, ''):
+            store_id = int(store_id)
+            return store_id if store_id in self.store_ids else None
+        return self.stores_by_name.get(record.get('store'))
+
+    def _product(self, record):
+        name = normalize_name(record.get('product') or '')
+        if not name:
+            return None
+        key = name.casefold()
+        product_id = self.products.get(key)
+        if product_id is None:
+            product_id = self.conn.execute(
+                'INSERT INTO Products (name, category, unit) VALUES (?, ?, ?)',
+                (name, record.get('category') or None, record.get('unit') or None)
+            ).lastrowid
+            self.products[key] = product_id
+            self.stats['new_products'] += 1
+        return product_id
+
+    def _write(self, records):
+        rows = []
+        with self.conn:
+            for record in records:
+                try:
+                    store_id = self._store(record)
+                    price = _price(record.get('price'))
+                    inventory = _inventory(record.get('inventory'))
+                except (TypeError, ValueError):
+                    store_id = None
+                product_id = self._product(record) if store_id is not None else None
+                if product_id is None:
+                    self.stats['skipped'] += 1
+                    continue
+                rows.append((store_id, product_id, price, inventory))
+            # primary key order keeps the B-tree writes local; the sort is stable so
+            # the feed's last price for a repeated pair still wins
+            rows.sort(key=lambda row: (row[0], row[1]))
+            # rowcount leaves out the rows written by triggers
+            written = self.conn.executemany(UPSERT, rows).rowcount if rows else 0
+        self.stats['written'] += written
+        self.stats['unchanged'] += len(rows) - written
+
+    def ingest(self, records):
+        """Upsert an iterable of records batch by batch. Returns the running stats."""
+        start = time.perf_counter()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._flush(batch, start)
+                batch = []
+        if batch:
+            self._flush(batch, start)
+        return self.stats
+
+    def _flush(self, batch, start):
+        self._write(batch)
+        self.stats['rows'] += len(batch)
+        self.stats['seconds'] = time.perf_counter() - start
+        self.stats['rows_per_sec'] = self.stats['rows'] / self.stats['seconds'] if self.stats['seconds'] else 0.0
+        if time.perf_counter() - self._reported >= 5:
+            self._reported = time.perf_counter()
+            logger.info('ingested %d rows (%.0f rows/s)', self.stats['rows'], self.stats['rows_per_sec'])
+
+
+def secondary_indexes(conn, table):
+    """(name, sql) of the explicitly created indexes on table."""
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    ).fetchall()
+
+
+def connect_writer(db_path):
+    conn = sqlite3.connect(db_path, timeout=config.INGEST_BUSY_TIMEOUT)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=OFF')
+    conn.execute(f'PRAGMA cache_size=-{64 * 1024}')
+    return conn
+
+
+def ingest_feed(records, db_path=None, batch_size=None, defer_indexes=False):
+    """
+    Upsert price records into the catalog at db_path (default DATABASE_PATH).
+
+    With defer_indexes the StoreProducts secondary indexes are dropped for the
+    load and rebuilt once at the end, which is much faster for a full reload but
+    leaves readers without those indexes meanwhile; the default keeps them and
+    relies on sorted batches. Returns stats with rows, written, unchanged,
+    skipped, new_products, seconds and rows_per_sec.
+    """
+    with closing(connect_writer(db_path or config.DATABASE_PATH)) as conn:
+        migrate(conn)
+        dropped = secondary_indexes(conn, 'StoreProducts') if defer_indexes else []
+        with conn:
+            for name, _ in dropped:
+                conn.execute(f'DROP INDEX "{name}"')
+        try:
+            stats = Ingester(conn, batch_size).ingest(records)
+        finally:
+            with conn:
+                for _, sql in dropped:
+                    conn.execute(sql)
+            # refresh the planner's statistics for the new row counts
+            conn.execute('ANALYZE StoreProducts' if dropped else 'PRAGMA optimize')
+            # PASSIVE never waits on readers
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+    logger.info('ingest finished: %s', stats)
+    return stats
+
+
+def map_records(records, columns):
+    """Rename each record's fields with columns = {feed field: record field}, dropping the rest."""
+    for record in records:
+        yield {ours: record.get(theirs) for theirs, ours in columns.items()}
+
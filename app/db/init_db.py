@@ -1,9 +1,11 @@
 import sqlite3
 
+from app.calculator.distance import distance_matrix
+
 def create_stores_table(conn):
     c = conn.cursor()
     c.execute('''
-    CREATE TABLE Stores (
+    CREATE TABLE IF NOT EXISTS Stores (
         id INTEGER PRIMARY KEY,
         name TEXT NOT NULL,
         lat REAL NOT NULL,
@@ -18,7 +20,7 @@ def create_stores_table(conn):
 def create_products_table(conn):
     c = conn.cursor()
     c.execute('''
-    CREATE TABLE Products (
+    CREATE TABLE IF NOT EXISTS Products (
         id INTEGER PRIMARY KEY,
         name TEXT NOT NULL,
         category TEXT,
@@ -29,7 +31,7 @@ def create_products_table(conn):
 def create_store_products_table(conn):
     c = conn.cursor()
     c.execute('''
-    CREATE TABLE StoreProducts (
+    CREATE TABLE IF NOT EXISTS StoreProducts (
         store_id INTEGER,
         product_id INTEGER,
         price REAL NOT NULL,
@@ -41,31 +43,34 @@ def create_store_products_table(conn):
     )
     ''')
 
-from faker import Faker
 import random
 import os
 
-def create_fake_data():
+def create_fake_data(db_path='db/basketroute.db', seed=42, num_stores=20, num_products=50, num_store_products=300):
+    """
+    Fill db_path with a random catalog. The same seed and sizes always give the
+    same catalog, so benchmark runs at a given scale are comparable.
+    """
+    # faker is only needed to generate development data
+    from faker import Faker
+
     faker = Faker()
-    random.seed(42)
+    Faker.seed(seed)
+    random.seed(seed)
 
-    # Paths
-    DB_PATH = 'db/basketroute.db'
-    os.makedirs('db', exist_ok=True)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
 
     # Database connection
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
     cur = conn.cursor()
 
-    NUM_STORES = 20
-    NUM_PRODUCTS = 50
-    NUM_STORE_PRODUCTS = 300
     categories = ["Dairy", "Produce", "Bakery", "Snacks", "Pantry", "Meat", "Frozen"]
     units = ["L", "kg", "unit", "pack"]
 
     # Insert Stores
     stores = []
-    for _ in range(NUM_STORES):
+    for _ in range(num_stores):
         name = faker.company()
         lat = round(random.uniform(40.6, 40.7), 6)
         lon = round(random.uniform(-74.0, -73.9), 6)
@@ -81,7 +86,7 @@ def create_fake_data():
 
     # Insert Products
     products = []
-    for _ in range(NUM_PRODUCTS):
+    for _ in range(num_products):
         name = faker.word().capitalize() + " " + random.choice(["Milk", "Bread", "Apples", "Rice", "Chicken", "Cheese", "Chips"])
         category = random.choice(categories)
         unit = random.choice(units)
@@ -99,19 +104,14 @@ def create_fake_data():
     cur.execute("SELECT id FROM Products")
     product_ids = [row[0] for row in cur.fetchall()]
 
-    # Insert StoreProducts
-    store_products = set()
-    entries = []
-
-    while len(entries) < NUM_STORE_PRODUCTS:
-        store_id = random.choice(store_ids)
-        product_id = random.choice(product_ids)
-        if (store_id, product_id) in store_products:
-            continue
-        store_products.add((store_id, product_id))
-        price = round(random.uniform(0.99, 19.99), 2)
-        inventory = random.randint(0, 100)
-        entries.append((store_id, product_id, price, inventory))
+    # Insert StoreProducts: distinct (store, product) pairs drawn without replacement
+    num_store_products = min(num_store_products, len(store_ids) * len(product_ids))
+    pairs = random.sample(range(len(store_ids) * len(product_ids)), num_store_products)
+    entries = (
+        (store_ids[pair // len(product_ids)], product_ids[pair % len(product_ids)],
+         round(random.uniform(0.99, 19.99), 2), random.randint(0, 100))
+        for pair in pairs
+    )
 
     cur.executemany('''
     INSERT INTO StoreProducts (store_id, product_id, price, inventory)
@@ -119,19 +119,261 @@ def create_fake_data():
     ''', entries)
 
     conn.commit()
+    conn.execute('ANALYZE')
+    refresh_store_distances(conn)
     conn.close()
 
 
 def create_indices(conn):
     c = conn.cursor()
 
-def init_db():
-    conn = sqlite3.connect('db/basketroute.db')
-    
+def create_query_indexes(conn):
+    # Covering indexes for the lookups in db/query.py; see tests/test_query_plans.py
+    c = conn.cursor()
+    # name lookups (get_products_by_names, get_product_prices)
+    c.execute('CREATE INDEX IF NOT EXISTS ProductsByName ON Products (name, category, unit)')
+    c.execute("CREATE INDEX IF NOT EXISTS ProductsByCategory ON Products (COALESCE(category, ''), id)")
+    c.execute('CREATE INDEX IF NOT EXISTS StoresByName ON Stores (name)')
+    # product-driven joins and the catalog load's ORDER BY product_id, store_id
+    c.execute('''
+    CREATE INDEX IF NOT EXISTS StoreProductsByProduct
+    ON StoreProducts (product_id, store_id, price, inventory, last_updated)
+    ''')
+    # the offers a plan can actually use
+    c.execute('''
+    CREATE INDEX IF NOT EXISTS StoreProductsInStock
+    ON StoreProducts (product_id, store_id, price, inventory) WHERE inventory > 0
+    ''')
+    # MAX(last_updated) in the catalog fingerprint
+    c.execute('CREATE INDEX IF NOT EXISTS StoreProductsByUpdate ON StoreProducts (last_updated)')
+    c.execute('ANALYZE')
+
+def create_catalog_meta_table(conn):
+    c = conn.cursor()
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS CatalogMeta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+
+def create_store_distances_table(conn):
+    # Upper triangle only: store_a < store_b
+    c = conn.cursor()
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS StoreDistances (
+        store_a INTEGER NOT NULL,
+        store_b INTEGER NOT NULL,
+        meters REAL NOT NULL,
+        PRIMARY KEY (store_a, store_b)
+    ) WITHOUT ROWID
+    ''')
+
+def create_store_distance_tables(conn):
+    create_catalog_meta_table(conn)
+    create_store_distances_table(conn)
+
+def create_store_spatial_index(conn):
+    # R*Tree over store coordinates, kept in sync with Stores by triggers
+    c = conn.cursor()
+    c.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS StoresSpatial USING rtree(
+        id,
+        min_lat, max_lat,
+        min_lon, max_lon
+    )
+    ''')
+    c.execute('''
+    INSERT OR REPLACE INTO StoresSpatial (id, min_lat, max_lat, min_lon, max_lon)
+    SELECT id, lat, lat, lon, lon FROM Stores
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS StoresSpatialInsert AFTER INSERT ON Stores BEGIN
+        INSERT OR REPLACE INTO StoresSpatial (id, min_lat, max_lat, min_lon, max_lon)
+        VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS StoresSpatialUpdate AFTER UPDATE OF id, lat, lon ON Stores BEGIN
+        DELETE FROM StoresSpatial WHERE id = old.id;
+        INSERT OR REPLACE INTO StoresSpatial (id, min_lat, max_lat, min_lon, max_lon)
+        VALUES (new.id, new.lat, new.lat, new.lon, new.lon);
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS StoresSpatialDelete AFTER DELETE ON Stores BEGIN
+        DELETE FROM StoresSpatial WHERE id = old.id;
+    END
+    ''')
+
+def create_search_index(conn):
+    # FTS5 indexes over product and store names, kept in sync with their tables by
+    # triggers, plus vocabulary views of their terms for typo correction. SQLite
+    # builds without FTS5 get no index; search.search then falls back to LIKE
+    c = conn.cursor()
+    try:
+        c.execute('CREATE VIRTUAL TABLE temp.Fts5Probe USING fts5(x)')
+        c.execute('DROP TABLE temp.Fts5Probe')
+    except sqlite3.OperationalError:
+        return
+    for table, columns in (('Products', ('name', 'category')), ('Stores', ('name',))):
+        search = f'{table}Search'
+        cols = ', '.join(columns)
+        new = ', '.join(f'new.{col}' for col in columns)
+        old = ', '.join(f'old.{col}' for col in columns)
+        c.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5(
+            {cols},
+            content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''')
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {search}Terms USING fts5vocab({search}, 'row')")
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {search}Insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {search} (rowid, {cols}) VALUES (new.id, {new});
+        END
+        ''')
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {search}Update AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {search} ({search}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            INSERT INTO {search} (rowid, {cols}) VALUES (new.id, {new});
+        END
+        ''')
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {search}Delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {search} ({search}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        END
+        ''')
+        c.execute(f"INSERT INTO {search} ({search}) VALUES ('rebuild')")
+
+def add_products_last_updated(conn):
+    # Products had no modification time; triggers stamp inserts and edits so
+    # catalog responses can be validated with ETag / Last-Modified
+    c = conn.cursor()
+    c.execute('ALTER TABLE Products ADD COLUMN last_updated TIMESTAMP')
+    c.execute('UPDATE Products SET last_updated = CURRENT_TIMESTAMP')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS ProductsTouchInsert AFTER INSERT ON Products WHEN new.last_updated IS NULL BEGIN
+        UPDATE Products SET last_updated = CURRENT_TIMESTAMP WHERE id = new.id;
+    END
+    ''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS ProductsTouchUpdate AFTER UPDATE OF name, category, unit ON Products BEGIN
+        UPDATE Products SET last_updated = CURRENT_TIMESTAMP WHERE id = new.id;
+    END
+    ''')
+
+def add_stores_touch_trigger(conn):
+    # Stores.last_updated was only set on insert, so moving a store left
+    # StoreDistances and the catalog snapshot keyed on the old stores_version
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS StoresTouchUpdate
+    AFTER UPDATE OF name, lat, lon, address, phone, website ON Stores BEGIN
+        UPDATE Stores SET last_updated = CURRENT_TIMESTAMP WHERE id = new.id;
+    END
+    ''')
+
+def add_change_counters(conn):
+    # A per-table count of written rows. MAX(last_updated) has one-second
+    # resolution and can be written backwards, so the catalog fingerprint and
+    # stores_version key on these counters instead
+    c = conn.cursor()
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS CatalogChanges (
+        tbl TEXT PRIMARY KEY,
+        changes INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+    for table in ('Stores', 'Products', 'StoreProducts'):
+        c.execute('INSERT OR IGNORE INTO CatalogChanges (tbl) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}Count{event.title()} AFTER {event} ON {table} BEGIN
+                UPDATE CatalogChanges SET changes = changes + 1 WHERE tbl = '{table}';
+            END
+            ''')
+
+def create_base_tables(conn):
     create_stores_table(conn)
     create_products_table(conn)
     create_store_products_table(conn)
     create_indices(conn)
+
+# Applied in order; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    create_base_tables,
+    create_store_distance_tables,
+    create_store_spatial_index,
+    create_search_index,
+    add_products_last_updated,
+    create_query_indexes,
+    add_stores_touch_trigger,
+    add_change_counters,
+]
+
+def migrate(conn):
+    """
+    Apply pending MIGRATIONS. Each one and its user_version bump run in a single
+    BEGIN IMMEDIATE transaction, and the version is read again once the write
+    lock is held, so processes migrating at the same time apply each one once.
+    """
+    conn.commit()
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < len(MIGRATIONS):
+                MIGRATIONS[version](conn)
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if version >= len(MIGRATIONS):
+            return len(MIGRATIONS)
+
+def stores_version(conn):
+    return str(conn.execute("SELECT changes FROM CatalogChanges WHERE tbl = 'Stores'").fetchone()[0])
+
+def get_meta(conn, key):
+    row = conn.execute('SELECT value FROM CatalogMeta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(conn, key, value):
+    conn.execute('''
+    INSERT INTO CatalogMeta (key, value) VALUES (?, ?)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (key, value))
+
+def refresh_store_distances(conn, force=False):
+    """
+    Recompute StoreDistances if Stores changed since the table was last built.
+    Returns True when the table was rebuilt.
+    """
+    conn.commit()
+    # checked under the write lock so processes starting together rebuild it once
+    conn.execute('BEGIN IMMEDIATE')
+    with conn:
+        version = stores_version(conn)
+        if not force and get_meta(conn, 'store_distances_version') == version:
+            return False
+        rows = conn.execute('SELECT id, lat, lon FROM Stores ORDER BY id').fetchall()
+        ids = [row[0] for row in rows]
+        meters = distance_matrix([(row[1], row[2]) for row in rows])
+        conn.execute('DELETE FROM StoreDistances')
+        conn.executemany(
+            'INSERT INTO StoreDistances (store_a, store_b, meters) VALUES (?, ?, ?)',
+            ((ids[a], ids[b], float(meters[a, b])) for a in range(len(ids)) for b in range(a + 1, len(ids)))
+        )
+        set_meta(conn, 'store_distances_version', version)
+    return True
+
+def init_db():
+    conn = sqlite3.connect('db/basketroute.db')
+    
+    migrate(conn)
+    refresh_store_distances(conn)
     
     conn.commit()
     conn.close()
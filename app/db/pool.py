@@ -0,0 +1,105 @@
+import queue
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+from app import config
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite read connections.
+
+    A connection is bound to the borrowing thread until it is released; nested
+    acquire() calls from the same thread get the same connection back. Keeping the
+    connections open lets sqlite3 reuse its prepared statement cache and skip
+    re-parsing the schema on every request.
+    """
+
+    def __init__(self, path, size=None, timeout=None, cached_statements=None, wal=None, readonly=True):
+        self.path = path
+        self.size = size or config.DB_POOL_SIZE
+        self.timeout = config.DB_POOL_TIMEOUT if timeout is None else timeout
+        self.cached_statements = cached_statements or config.DB_STATEMENT_CACHE_SIZE
+        self.readonly = readonly
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+        if config.DB_WAL if wal is None else wal:
+            # journal_mode is persistent, so one writable connection sets it for everyone
+            with closing(sqlite3.connect(path)) as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.cached_statements)
+        if self.readonly:
+            conn.execute('PRAGMA query_only=1')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            return conn
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No database connection available after {self.timeout}s')
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._open()
+            except Exception:
+                self._slots.release()
+                raise
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        if getattr(self._local, 'conn', None) is not conn:
+            raise ValueError('Connection was not borrowed by this thread')
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide read pool for config.DATABASE_PATH."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(config.DATABASE_PATH)
+    return _pool
@@ -1,6 +1,14 @@
-from geopy.distance import geodesic
 import json
-import sqlite3
+
+import numpy as np
+
+from app import config
+from app.calculator.distance import bounding_box, ellipsoid_matrix
+from app.calculator.prices import PriceMatrix
+from app.db.search import search
+from app.logs import get_logger, payload
+
+logger = get_logger(__name__)
 
 def parse_location(location):
     # If location is in 'lat,lon' format, use directly
@@ -10,11 +18,7 @@ def parse_location(location):
     except Exception:
         return None
     
-def get_all_stores(conn):
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores')
-    stores = cursor.fetchall()
-    conn.close()
+def _store_dicts(stores):
     return [{
         'id': store[0],
         'name': store[1],
@@ -25,42 +29,51 @@ def get_all_stores(conn):
         'website': store[6]
     } for store in stores]
 
+def get_all_stores(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores')
+    return _store_dicts(cursor.fetchall())
+
 def get_stores_by_names(conn, store_names):
     cursor = conn.cursor()
     placeholders = ', '.join(['?'] * len(store_names))
     cursor.execute(f'SELECT id, name, lat, lon, address, phone, website FROM Stores WHERE name IN ({placeholders})', store_names)
-    stores = cursor.fetchall()
-    conn.close()
-    return [{
-        'id': store[0],
-        'name': store[1],
-        'lat': store[2],
-        'lon': store[3],
-        'address': store[4],
-        'phone': store[5],
-        'website': store[6]
-    } for store in stores]
+    return _store_dicts(cursor.fetchall())
 
-def get_stores_like(conn, name):
+def get_stores_like(conn, name, limit=None, version=None):
+    """
+    Stores whose name matches name, best first: ranked word and prefix matches,
+    typo-corrected ones when there are none, and substring matches as a last resort.
+    """
+    limit = limit or config.SEARCH_MAX_LIMIT
+    ids = search(conn, 'Stores', ('name',), name, limit, version=version)[0]
     cursor = conn.cursor()
-    cursor.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores WHERE name LIKE ?', (f'%{name}%',))
-    stores = cursor.fetchall()
-    conn.close()
-    return [{
-        'id': store[0],
-        'name': store[1],
-        'lat': store[2],
-        'lon': store[3],
-        'address': store[4],
-        'phone': store[5],
-        'website': store[6]
-    } for store in stores]
+    if ids:
+        cursor.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores WHERE id IN ({})'.format(','.join(['?'] * len(ids))), ids)
+        by_id = {store['id']: store for store in _store_dicts(cursor.fetchall())}
+        return [by_id[store_id] for store_id in ids if store_id in by_id]
+    cursor.execute('SELECT id, name, lat, lon, address, phone, website FROM Stores WHERE name LIKE ? LIMIT ?', (f'%{name}%', limit))
+    return _store_dicts(cursor.fetchall())
+
+def search_products(conn, query, limit=20, offset=0, version=None):
+    """
+    Products whose name or category match query: names starting with it first,
+    then other name matches, then category matches.
+    Returns {'results': [product dicts], 'next_offset', 'fuzzy'}; fuzzy is set when
+    misspelled words were corrected.
+    """
+    ids, has_more, fuzzy = search(conn, 'Products', ('name', 'category'), query, limit, offset, version)
+    by_id = {product['id']: product for product in get_products_by_ids(conn, ids)} if ids else {}
+    return {
+        'results': [by_id[product_id] for product_id in ids if product_id in by_id],
+        'next_offset': offset + limit if has_more else None,
+        'fuzzy': fuzzy
+    }
     
 def get_products_grouped_by_category(conn):
     cursor = conn.cursor()
     cursor.execute('SELECT id, name, category, unit FROM Products')
     products = cursor.fetchall()
-    conn.close()
     grouped_products = {}
     for product in products:
         product_id, name, category, unit = product
@@ -73,9 +86,58 @@ def get_products_grouped_by_category(conn):
         })
     return grouped_products
 
+def _id_filter(column, ids):
+    """SQL condition and parameters restricting column to ids; long lists are bound as one JSON array."""
+    if len(ids) > config.MATRIX_INLINE_IDS:
+        return f'{column} IN (SELECT value FROM json_each(?))', [json.dumps(ids)]
+    return f"{column} IN ({','.join(['?'] * len(ids))})", list(ids)
+
+def item_store_offers(conn, product_ids, store_ids=None):
+    """
+    In-stock offers for the given products at the given stores (every store when
+    store_ids is None), filtered in SQL. Requests are planned from the catalog
+    snapshot (CatalogSnapshot.item_store_matrix); this is the path for code
+    working without one, such as optimizer.py's __main__ and the benchmark.
+    Args:
+        product_ids (list of int): Products to include.
+        store_ids (list of int, optional): Candidate stores.
+    Returns:
+        (store_id, product_id, price, inventory): parallel NumPy arrays, ordered by
+        product then store. price_matrix() holds them as a PriceMatrix.
+    """
+    product_ids = [int(pid) for pid in dict.fromkeys(product_ids)]
+    filters = [('product_id', product_ids)]
+    if store_ids is not None:
+        filters.append(('store_id', [int(sid) for sid in dict.fromkeys(store_ids)]))
+    rows = []
+    if all(ids for _, ids in filters):
+        conditions, params = [], []
+        for column, ids in filters:
+            # a long store list is checked against each product's offers rather than
+            # seeked pair by pair; the unary + keeps SQLite from using it for the seek
+            if column == 'store_id' and len(ids) > config.MATRIX_INLINE_IDS:
+                column = '+store_id'
+            condition, values = _id_filter(column, ids)
+            conditions.append(condition)
+            params += values
+        rows = conn.execute(f'''
+            SELECT store_id, product_id, price, inventory
+            FROM StoreProducts
+            WHERE {' AND '.join(conditions)} AND inventory > 0
+            ORDER BY product_id, store_id
+        ''', params).fetchall()
+    columns = list(zip(*rows)) or [(), (), (), ()]
+    return (np.array(columns[0], dtype=np.int64), np.array(columns[1], dtype=np.int64),
+            np.array(columns[2], dtype=np.float64), np.array(columns[3], dtype=np.int64))
+
+def price_matrix(conn, product_ids, store_ids=None):
+    """The in-stock offers of item_store_offers as a PriceMatrix."""
+    return PriceMatrix.from_columns(*item_store_offers(conn, product_ids, store_ids))
+
 def build_item_store_matrix(conn, items, stores):
     """
     Builds a matrix of items and their corresponding stores with prices and inventory.
+    Only offers with stock are included; price_matrix() returns them as arrays.
     Args:
         items (list of dict): List of item details .
         stores (list of dict): List of store details.
@@ -83,32 +145,15 @@ def build_item_store_matrix(conn, items, stores):
         item_store_matrix (list of tuples (store_id, product_id, price, inventory)): List of tuples where each tuple contains
         the store id, product id, price, and inventory.
     """
-    cursor = conn.cursor()
-    print(items, stores)
-    item_names = [item['name'] for item in items]
-    store_ids = [store['id'] for store in stores]
-    cursor.execute('''
-        SELECT sp.store_id, p.id, sp.price, sp.inventory
-        FROM StoreProducts sp
-        JOIN Products p ON sp.product_id = p.id
-        WHERE p.name IN ({})
-    '''.format(','.join(['?'] * len(items))), item_names)
-    
-    rows = cursor.fetchall()
-
-    item_store_matrix = []
-    for store_id, product_id, price, inventory in rows:
-        if store_id in store_ids:
-            item_store_matrix.append((store_id, product_id, price, inventory))
-
-    conn.close()
-    return item_store_matrix
+    logger.debug('item-store matrix for %d items at %d stores: %s', len(items), len(stores),
+                 payload([item['name'] for item in items]))
+    columns = item_store_offers(conn, [item['id'] for item in items], [store['id'] for store in stores])
+    return list(zip(*(column.tolist() for column in columns)))
     
 def get_all_products(conn):
     cursor = conn.cursor()
     cursor.execute('SELECT id, name, category, unit FROM Products')
     products = cursor.fetchall()
-    conn.close()
     return [{
         'id': product[0],
         'name': product[1],
@@ -120,7 +165,6 @@ def get_products_by_names(conn, product_names):
     cursor = conn.cursor()
     cursor.execute('SELECT id, name, category, unit FROM Products WHERE name IN ({})'.format(','.join(['?'] * len(product_names))), product_names)
     products = cursor.fetchall()
-    conn.close()
     return [{
         'id': product[0],
         'name': product[1],
@@ -132,7 +176,6 @@ def get_products_by_ids(conn, product_ids):
     cursor = conn.cursor()
     cursor.execute('SELECT id, name, category, unit FROM Products WHERE id IN ({})'.format(','.join(['?'] * len(product_ids))), product_ids)
     products = cursor.fetchall()
-    conn.close()
     return [{
         'id': product[0],
         'name': product[1],
@@ -149,7 +192,6 @@ def get_product_prices(conn, product_name):
         WHERE sp.product_id = (SELECT id FROM Products WHERE name = ?)
     ''', (product_name,))
     prices = cursor.fetchall()
-    conn.close()
     return [{
         'store_id': price[0],
         'store_name': price[1],
@@ -158,34 +200,125 @@ def get_product_prices(conn, product_name):
         'last_updated': price[4]
     } for price in prices]
 
-def get_stores_nearby(location, radius_km=5, max_stores=20):
-    lat_lon = parse_location(location)
+def get_stores_nearby(conn, location, radius_km=None, max_stores=None):
+    """
+    k nearest stores to `location` ('lat,lon' or a (lat, lon) tuple), nearest first.
+    Candidates come from the StoresSpatial R*Tree, so only stores inside the
+    radius' bounding box are read. With radius_km=None the search widens until
+    max_stores stores are found or every store has been considered.
+    """
+    lat_lon = parse_location(location) if isinstance(location, str) else location
     if not lat_lon:
         return []
     lat, lon = lat_lon
-    conn = sqlite3.connect('db/basketroute.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, name, lat, lon, address, phone, websit, (
-                   6371 * acos(
-                cos(radians(?)) * cos(radians(lat)) * cos(radians(lon) - radians(?)) +
-                sin(radians(?)) * sin(radians(lat))
-            )
-        ) AS distance_km
-        FROM Stores
-        WHERE distance_km <= ?
-        ORDER BY distance_km ASC
-        LIMIT ?
-    ''', (lat, lon, lat, radius_km, max_stores))
-    stores = cursor.fetchall()
-    conn.close()
+    if max_stores is None:
+        max_stores = config.NEARBY_MAX_STORES
+
+    search_km = radius_km if radius_km is not None else config.SPATIAL_CELL_DEGREES * 111.0
+    total = conn.execute('SELECT COUNT(*) FROM StoresSpatial').fetchone()[0]
+    while True:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, search_km * 1000)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.name, s.lat, s.lon, s.address, s.phone, s.website
+            FROM StoresSpatial r
+            JOIN Stores s ON s.id = r.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+        ''', (min_lat, max_lat, min_lon, max_lon))
+        stores = cursor.fetchall()
+        distances_km = ellipsoid_matrix(lat, lon, [s[2] for s in stores], [s[3] for s in stores])[0] / 1000
+        within = distances_km <= search_km
+        # done when the radius was given, or enough stores lie inside the circle searched
+        if radius_km is not None or within.sum() >= max_stores:
+            break
+        if len(stores) >= total:
+            within[:] = True
+            break
+        search_km *= 2
+
+    order = [idx for idx in distances_km.argsort(kind="stable") if within[idx]][:max_stores]
     return [{
-        'id': store[0],
-        'name': store[1],
-        'lat': store[2],
-        'lon': store[3],
-        'address': store[4],
-        'phone': store[5],
-        'website': store[6],
-        'distance_km': store[7]
-    } for store in stores]
\ No newline at end of file
+        'id': stores[idx][0],
+        'name': stores[idx][1],
+        'lat': stores[idx][2],
+        'lon': stores[idx][3],
+        'address': stores[idx][4],
+        'phone': stores[idx][5],
+        'website': stores[idx][6],
+        'distance_km': float(distances_km[idx])
+    } for idx in order]
+
+# Keyset-paginated listings for the catalog endpoints: rows with the listing's
+# fields ordered by its `order` columns; `key` names the fields holding them.
+LISTINGS = {
+    'products': {
+        'fields': ('id', 'name', 'category', 'unit', 'last_updated'),
+        'select': 'SELECT id, name, category, unit, last_updated FROM Products',
+        'order': ('id',),
+        'key': ('id',),
+    },
+    'stores': {
+        'fields': ('id', 'name', 'lat', 'lon', 'address', 'phone', 'website', 'last_updated'),
+        'select': 'SELECT id, name, lat, lon, address, phone, website, last_updated FROM Stores',
+        'order': ('id',),
+        'key': ('id',),
+    },
+    'products_by_category': {
+        'fields': ('category', 'id', 'name', 'unit', 'last_updated'),
+        'select': "SELECT COALESCE(category, ''), id, name, unit, last_updated FROM Products",
+        'order': ("COALESCE(category, '')", 'id'),
+        'key': ('category', 'id'),
+    },
+    'inventories': {
+        'fields': ('store_id', 'store', 'product_id', 'product', 'price', 'inventory', 'last_updated'),
+        'select': '''
+            SELECT sp.store_id, s.name, sp.product_id, p.name, sp.price, sp.inventory, sp.last_updated
+            FROM StoreProducts sp
+            JOIN Stores s ON sp.store_id = s.id
+            JOIN Products p ON sp.product_id = p.id
+        ''',
+        'order': ('sp.store_id', 'sp.product_id'),
+        'key': ('store_id', 'product_id'),
+    },
+    # the legacy grouped /api/store_inventories body, grouped by store name
+    'inventories_by_store': {
+        'fields': ('store', 'store_id', 'product_id', 'product', 'price', 'inventory', 'last_updated'),
+        'select': '''
+            SELECT s.name, sp.store_id, sp.product_id, p.name, sp.price, sp.inventory, sp.last_updated
+            FROM StoreProducts sp
+            JOIN Stores s ON sp.store_id = s.id
+            JOIN Products p ON sp.product_id = p.id
+        ''',
+        'order': ('s.name', 'sp.store_id', 'sp.product_id'),
+        'key': ('store', 'store_id', 'product_id'),
+    },
+}
+
+def listing_key(listing, row):
+    """The key of a row from iter_listing, to pass back as `after`."""
+    fields = LISTINGS[listing]['fields']
+    return [row[fields.index(field)] for field in LISTINGS[listing]['key']]
+
+def iter_listing(conn, listing, after=None, limit=None):
+    """
+    Rows of a listing after the key `after` (from listing_key, or None for the
+    start), at most limit of them, fetched from the cursor in batches.
+    """
+    spec = LISTINGS[listing]
+    key = ', '.join(spec['order'])
+    sql = spec['select']
+    params = []
+    if after is not None:
+        # the leading column's bound lets SQLite seek the index; the row value does the rest
+        sql += f' WHERE {spec["order"][0]} >= ? AND ({key}) > ({", ".join("?" * len(after))})'
+        params += [after[0]] + list(after)
+    sql += f' ORDER BY {key}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(config.CATALOG_STREAM_BATCH)
+        if not rows:
+            return
+        yield from rows
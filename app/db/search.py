@@ -0,0 +1,183 @@
+import re
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from app import config
+
+# Ranked name search over the FTS5 indexes created by init_db.create_search_index.
+# The last word of a query is matched as a prefix (autocomplete) unless the
+# query ends in a space. Rows whose name starts with the query come first, then
+# other name matches, then matches in the remaining columns. When nothing
+# matches, words missing from the index are replaced by the indexed words one
+# edit away, most common first. Databases built without FTS5 have no index and
+# are searched with LIKE scans in the same rank order.
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Words of text as the unicode61 tokenizer (remove_diacritics 2) indexes them."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return _WORD.findall(''.join(char for char in text if not unicodedata.combining(char)))
+
+
+def _deletions(word):
+    return {word[:k] + word[k + 1:] for k in range(len(word))}
+
+
+class Vocabulary:
+    """The indexed words of one FTS5 table with their document counts."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.words = sorted(docs)
+        self._deletes = None
+        self._lock = threading.Lock()
+
+    def has_prefix(self, prefix):
+        k = bisect_left(self.words, prefix)
+        return k < len(self.words) and self.words[k].startswith(prefix)
+
+    def _deletion_index(self):
+        # built on the first correction: one-character deletion -> words
+        if self._deletes is None:
+            with self._lock:
+                if self._deletes is None:
+                    deletes = {}
+                    for word in self.words:
+                        for deletion in _deletions(word):
+                            deletes.setdefault(deletion, []).append(word)
+                    self._deletes = deletes
+        return self._deletes
+
+    def corrections(self, word, limit):
+        """Indexed words reachable from word by one insertion, deletion, substitution or transposition."""
+        deletes = self._deletion_index()
+        candidates = set(deletes.get(word, ()))
+        for deletion in _deletions(word):
+            if deletion in self.docs:
+                candidates.add(deletion)
+            candidates.update(deletes.get(deletion, ()))
+        candidates.discard(word)
+        return sorted(candidates, key=lambda candidate: (-self.docs[candidate], candidate))[:limit]
+
+
+_vocabularies = {}
+_vocabularies_lock = threading.Lock()
+
+
+def get_vocabulary(conn, table, version):
+    """Vocabulary of table's search index, rebuilt when version (the catalog version) changes."""
+    cached = _vocabularies.get(table)
+    if cached is not None and cached[0] == version and version is not None:
+        return cached[1]
+    # one thread reads the terms, the others wait for its vocabulary
+    with _vocabularies_lock:
+        cached = _vocabularies.get(table)
+        if cached is not None and cached[0] == version and version is not None:
+            return cached[1]
+        vocabulary = Vocabulary(dict(conn.execute(f'SELECT term, doc FROM {table}SearchTerms')))
+        _vocabularies[table] = (version, vocabulary)
+    return vocabulary
+
+
+def has_index(conn, table):
+    """Whether table has its FTS5 search index (not when SQLite was built without FTS5)."""
+    return conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (f'{table}Search',)).fetchone() is not None
+
+
+def _like_ids(conn, table, columns, query, limit, offset):
+    """The query as one substring of any column, ranked in the same tiers as _tiers, by LIKE scans."""
+    escaped = ' '.join(query.split()).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    contains = ' OR '.join(f"{column} LIKE :contains ESCAPE '\\'" for column in columns)
+    first = columns[0]
+    return [row[0] for row in conn.execute(
+        f"""SELECT id FROM {table} WHERE {contains}
+        ORDER BY CASE WHEN {first} LIKE :starts ESCAPE '\\' THEN 0
+                      WHEN {first} LIKE :contains ESCAPE '\\' THEN 1 ELSE 2 END, id
+        LIMIT :limit OFFSET :offset""",
+        {'starts': escaped + '%', 'contains': '%' + escaped + '%', 'limit': limit, 'offset': offset}
+    )]
+
+
+def _match_expression(groups, prefix, anchored=False):
+    terms = []
+    for k, words in enumerate(groups):
+        star = '*' if prefix and k == len(groups) - 1 else ''
+        caret = '^' if anchored and k == 0 else ''
+        alternatives = [f'{caret}"{word}"{star}' for word in words]
+        terms.append(alternatives[0] if len(alternatives) == 1 else '(' + ' OR '.join(alternatives) + ')')
+    return ' AND '.join(terms)
+
+
+def _tiers(columns, groups, prefix):
+    """
+    MATCH expressions in rank order, each excluding the ones before: the first
+    column starts with the query, the first column contains it, any column does.
+    """
+    anywhere = _match_expression(groups, prefix)
+    first = f'{columns[0]} : ({anywhere})'
+    starts = f'{columns[0]} : ({_match_expression(groups, prefix, anchored=True)})'
+    tiers = [starts, f'{first} NOT {starts}']
+    if len(columns) > 1:
+        tiers.append(f'({anywhere}) NOT {first}')
+    return tiers
+
+
+def _ranked_ids(conn, table, columns, groups, prefix, limit, offset):
+    # Within a tier rows come in rowid order, which FTS5 produces incrementally, so
+    # a page costs about offset + limit rows instead of ranking every match.
+    ids = []
+    for expression in _tiers(columns, groups, prefix):
+        rows = [row[0] for row in conn.execute(
+            f'SELECT rowid FROM {table}Search WHERE {table}Search MATCH ? LIMIT ?', (expression, offset + limit)
+        )]
+        if len(rows) <= offset:
+            offset -= len(rows)
+            continue
+        ids += rows[offset:offset + limit]
+        limit -= len(rows) - offset
+        offset = 0
+        if limit <= 0:
+            break
+    return ids
+
+
+def search(conn, table, columns, query, limit, offset=0, version=None):
+    """
+    Ids of table's rows matching query in the indexed columns (the first ranked
+    above the rest), best first. Returns (ids, has_more, fuzzy) where fuzzy is set
+    when misspelled words were corrected.
+    """
+    words = tokenize(query)
+    if not words:
+        return [], False, False
+    # one-letter prefixes would expand to most of the index
+    prefix = not query[-1].isspace() and len(words[-1]) >= 2
+    groups = [[word] for word in words]
+    try:
+        ids = _ranked_ids(conn, table, columns, groups, prefix, limit + 1, offset)
+    except sqlite3.OperationalError:
+        if has_index(conn, table):
+            raise
+        ids = _like_ids(conn, table, columns, query, limit + 1, offset)
+        return ids[:limit], len(ids) > limit, False
+    if ids or (offset and _ranked_ids(conn, table, columns, groups, prefix, 1, 0)):
+        return ids[:limit], len(ids) > limit, False
+
+    vocabulary = get_vocabulary(conn, table, version)
+    corrected = False
+    for k, word in enumerate(words):
+        known = vocabulary.has_prefix(word) if prefix and k == len(words) - 1 else word in vocabulary.docs
+        if known or len(word) < config.SEARCH_FUZZY_MIN_LENGTH:
+            continue
+        alternatives = vocabulary.corrections(word, config.SEARCH_FUZZY_ALTERNATIVES)
+        if alternatives:
+            groups[k] = alternatives
+            corrected = True
+    if not corrected:
+        return [], False, False
+    ids = _ranked_ids(conn, table, columns, groups, prefix, limit + 1, offset)
+    return ids[:limit], len(ids) > limit, True
@@ -1,3 +1,7 @@
+from functools import lru_cache
+
+from app import config
+
 CANONICAL_ITEMS = {
     "milk": ["whole milk", "skim milk", "2% milk", "almond milk", "oat milk"],
     "mozzarella cheese": ["mozzarella", "shredded mozzarella", "mozzarella cheese block"],
@@ -31,11 +35,96 @@ CANONICAL_ITEMS = {
     "mango": ["mango", "mango juice", "mango chunks"],
 }
 
-def normalize_item(store_item_name, canonical_map):
-    name = store_item_name.lower()
-    for general, variants in canonical_map.items():
-        for keyword in variants:
-            if keyword in name:
-                return general
-    return None
+class ItemMatcher:
+    """
+    Aho-Corasick automaton over every variant of a canonical map, so a name is
+    scanned once whatever the number of variants.
+
+    When several variants occur in a name the longest wins; equal lengths go to
+    the variant listed first. Repeated names are answered from an LRU.
+    """
+
+    def __init__(self, canonical_map, cache_size=None):
+        # trie: one dict of char -> node per node; node 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        # per node: (priority, canonical) of the best variant ending here or on its fail chain
+        self._best = [None]
+        order = 0
+        for general, variants in canonical_map.items():
+            for keyword in variants:
+                node = 0
+                for char in keyword.lower():
+                    child = self._goto[node].get(char)
+                    if child is None:
+                        child = len(self._goto)
+                        self._goto[node][char] = child
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._best.append(None)
+                    node = child
+                candidate = ((-len(keyword), order), general)
+                if self._best[node] is None or candidate < self._best[node]:
+                    self._best[node] = candidate
+                order += 1
+
+        # breadth first, so a node's fail target is finished before the node
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+                queue.append(child)
+        # fold the fail links into full transition tables so matching is one lookup per char
+        self._delta = [None] * len(self._goto)
+        self._delta[0] = self._goto[0]
+        for node in queue:
+            self._delta[node] = {**self._delta[self._fail[node]], **self._goto[node]}
+
+        self.match = lru_cache(maxsize=cache_size or config.ITEM_MATCH_CACHE_SIZE)(self._match)
+
+    def _match(self, name):
+        delta, best = self._delta, self._best
+        node = 0
+        found = None
+        for char in name.lower():
+            node = delta[node].get(char, 0)
+            hit = best[node]
+            if hit is not None and (found is None or hit < found):
+                found = hit
+        return found[1] if found is not None else None
+
+    def match_many(self, names):
+        """Canonical item (or None) for each name, each distinct name matched once."""
+        results = {}
+        for name in names:
+            if name not in results:
+                results[name] = self.match(name)
+        return [results[name] for name in names]
+
+
+_matchers = {}
+
+
+def get_matcher(canonical_map=CANONICAL_ITEMS):
+    """Compiled matcher for canonical_map, built on first use. Maps are expected not to change afterwards."""
+    entry = _matchers.get(id(canonical_map))
+    if entry is None or entry[0] is not canonical_map:
+        entry = _matchers[id(canonical_map)] = (canonical_map, ItemMatcher(canonical_map))
+    return entry[1]
+
+
+def normalize_item(store_item_name, canonical_map=CANONICAL_ITEMS):
+    """Canonical item whose longest variant occurs in store_item_name, or None."""
+    return get_matcher(canonical_map).match(store_item_name)
+
 
+def normalize_items(store_item_names, canonical_map=CANONICAL_ITEMS):
+    """normalize_item over a list of names."""
+    return get_matcher(canonical_map).match_many(store_item_names)
@@ -0,0 +1,133 @@
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app import config
+from app.logs import get_logger
+from app.planner import PlanError
+
+logger = get_logger(__name__)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """State of one background job as seen by pollers."""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            self.status = 'running'
+
+    def set_partial(self, partial):
+        with self._lock:
+            self.status = 'priced'
+            self.partial = partial
+
+    def _finish(self, status, result=None, error=None, error_status=None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.error_status = error_status
+            self.finished = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            job = {'id': self.id, 'status': self.status}
+            if self.status == 'done':
+                job['result'] = self.result
+            elif self.status == 'failed':
+                job['error'] = self.error
+                job['error_status'] = self.error_status
+            elif self.partial is not None:
+                job['partial'] = self.partial
+            return job
+
+
+class JobStore:
+    """
+    Runs jobs on a small thread pool and keeps their state for polling.
+
+    A job is fn(job); it may publish intermediate results with job.set_partial()
+    and its return value becomes the result. PlanError marks the job failed with
+    the error's status. At most max_pending jobs may be queued or running; finished
+    jobs are forgotten ttl_seconds after they end.
+    """
+
+    def __init__(self, workers=None, max_pending=None, ttl_seconds=None):
+        self.max_pending = config.ASYNC_MAX_PENDING if max_pending is None else max_pending
+        self.ttl_seconds = config.ASYNC_JOB_TTL if ttl_seconds is None else ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.ASYNC_WORKERS, thread_name_prefix='optimize-job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        # called with the lock held
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished is not None and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, fn):
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f'{self._pending} jobs already pending')
+            self._pending += 1
+            job = Job(uuid.uuid4().hex)
+            self._jobs[job.id] = job
+        # the job logs under the submitting request's id
+        self._executor.submit(contextvars.copy_context().run, self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job._start()
+        try:
+            job._finish('done', result=fn(job))
+        except PlanError as e:
+            job._finish('failed', error=e.message, error_status=e.status)
+        except Exception as e:
+            logger.exception('job %s failed', job.id)
+            job._finish('failed', error=f'Optimization failed: {type(e).__name__}', error_status=500)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {'jobs': len(self._jobs), 'pending': self._pending, 'max_pending': self.max_pending}
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """Process-wide store for asynchronous /api/optimize jobs."""
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                _job_store = JobStore()
+    return _job_store
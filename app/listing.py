@@ -0,0 +1,189 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from flask import Response, jsonify, request, stream_with_context
+
+from app import config
+from app.db.catalog import catalog_version
+from app.db.query import LISTINGS, iter_listing, listing_key
+
+# Catalog listings over HTTP: keyset cursors, ?fields= projection, JSON or NDJSON
+# bodies streamed from the database cursor, and ETag / Last-Modified validators
+# taken from the catalog fingerprint (see db.catalog.VERSION_QUERY). The
+# fingerprint and the rows are read in one transaction on the same connection,
+# so the validators describe exactly the body that is sent.
+
+# Positions in the catalog version of each table's (write counter, ...) and MAX(last_updated)
+TABLE_VERSION = {'Stores': ((0, 1), 1), 'Products': ((2, 5), 5), 'StoreProducts': ((3, 4), 4)}
+LISTING_TABLES = {
+    'products': ('Products',),
+    'stores': ('Stores',),
+    'products_by_category': ('Products',),
+    'inventories': ('Stores', 'Products', 'StoreProducts'),
+    'inventories_by_store': ('Stores', 'Products', 'StoreProducts'),
+}
+
+
+class ListingError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(listing, text):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(text + '=' * (-len(text) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ListingError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != len(LISTINGS[listing]['key']):
+        raise ListingError('Invalid cursor')
+    return key
+
+
+def parse_fields(listing, text, default):
+    if not text:
+        return default
+    fields = [field.strip() for field in text.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in LISTINGS[listing]['fields']]
+    if unknown or not fields:
+        raise ListingError(f"fields must be from {', '.join(LISTINGS[listing]['fields'])}")
+    return fields
+
+
+def validators(listing, version):
+    """(etag, last_modified) of a listing's current representation."""
+    parts = []
+    modified = []
+    for table in LISTING_TABLES[listing]:
+        positions, updated = TABLE_VERSION[table]
+        parts += [version[k] for k in positions]
+        if version[updated]:
+            modified.append(version[updated])
+    digest = hashlib.sha1(repr((listing, parts, request.query_string, request.accept_mimetypes.to_header())).encode())
+    last_modified = None
+    if modified:
+        # SQLite CURRENT_TIMESTAMP is UTC 'YYYY-MM-DD HH:MM:SS'
+        last_modified = datetime.strptime(max(modified)[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return digest.hexdigest()[:20], last_modified
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+
+
+def _with_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+def _wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+
+def _records(listing, rows, fields):
+    positions = [LISTINGS[listing]['fields'].index(field) for field in fields]
+    for row in rows:
+        yield {field: row[k] for field, k in zip(fields, positions)}
+
+
+def _json_array(records):
+    yield '['
+    for k, record in enumerate(records):
+        yield (',' if k else '') + json.dumps(record)
+    yield ']'
+
+
+def _json_groups(listing, rows, group_field, fields):
+    # rows arrive ordered by the group field, so each group is written once
+    group_at = LISTINGS[listing]['fields'].index(group_field)
+    positions = [LISTINGS[listing]['fields'].index(field) for field in fields]
+    yield '{'
+    started = False
+    current = None
+    for row in rows:
+        record = json.dumps({field: row[k] for field, k in zip(fields, positions)})
+        if not started or row[group_at] != current:
+            yield ('],' if started else '') + json.dumps(str(row[group_at])) + ':[' + record
+            started, current = True, row[group_at]
+        else:
+            yield ',' + record
+    yield ']}' if started else '}'
+
+
+def listing_response(conn, listing, legacy_fields, group_by=None, grouped_listing=None):
+    """
+    Respond to a catalog listing request.
+
+    ?limit=N returns one page, {'items', 'next_cursor'} (or NDJSON lines with the
+    cursor in X-Next-Cursor), resumed with ?cursor=. Without a limit the whole
+    listing is streamed: NDJSON with ?format=ndjson or Accept: application/x-ndjson,
+    otherwise the endpoint's original JSON shape (an array, or objects grouped
+    by group_by read from grouped_listing) with legacy_fields per record.
+    ?fields= picks the fields of each record.
+    """
+    try:
+        limit = request.args.get('limit', type=int)
+        if limit is not None and not 1 <= limit <= config.CATALOG_PAGE_MAX:
+            raise ListingError(f'limit must be 1-{config.CATALOG_PAGE_MAX}')
+        ndjson = _wants_ndjson()
+        # pages, NDJSON and resumed listings are flat; only a plain full listing keeps the original shape
+        flat = limit is not None or ndjson or 'cursor' in request.args
+        source = listing if flat or group_by is None else grouped_listing
+        cursor = request.args.get('cursor')
+        after = decode_cursor(source, cursor) if cursor else None
+        fields = parse_fields(source, request.args.get('fields'), list(LISTINGS[source]['fields']) if flat else legacy_fields)
+    except ListingError as e:
+        return jsonify({'error': e.message}), 400
+
+    # a read transaction holds one WAL snapshot until the pool rolls it back on release
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    etag, last_modified = validators(listing, catalog_version(conn))
+    if _not_modified(etag, last_modified):
+        return _with_validators(Response(status=304), etag, last_modified)
+
+    if limit is not None:
+        rows = list(iter_listing(conn, source, after, limit + 1))
+        next_cursor = encode_cursor(listing_key(source, rows[limit - 1])) if len(rows) > limit else None
+        items = list(_records(source, rows[:limit], fields))
+        if ndjson:
+            response = Response(''.join(json.dumps(item) + '\n' for item in items), mimetype='application/x-ndjson')
+        else:
+            response = jsonify({'items': items, 'next_cursor': next_cursor})
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.base_url}?{_next_query(next_cursor)}>; rel="next"'
+        return _with_validators(response, etag, last_modified)
+
+    rows = iter_listing(conn, source, after)
+    if ndjson:
+        body = (json.dumps(record) + '\n' for record in _records(source, rows, fields))
+        mimetype = 'application/x-ndjson'
+    elif group_by is None:
+        body = _json_array(_records(source, rows, fields))
+        mimetype = 'application/json'
+    else:
+        body = _json_groups(source, rows, group_by, fields)
+        mimetype = 'application/json'
+    return _with_validators(Response(stream_with_context(body), mimetype=mimetype), etag, last_modified)
+
+
+def _next_query(next_cursor):
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return urlencode(args)
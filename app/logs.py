@@ -0,0 +1,108 @@
+import contextvars
+import logging
+import random
+import sys
+from contextlib import contextmanager
+
+from app import config
+
+# (request id, dump) for the request being handled. dump is None for ordinary
+# requests, 'sampled' for the LOG_SAMPLE_RATE share logged at DEBUG with capped
+# payloads, and 'full' for LOG_DEBUG_REQUEST_IDS, logged at DEBUG with whole payloads.
+# A plain tuple so it can be shipped to solver workers with the problem.
+_request = contextvars.ContextVar('basketroute_request', default=None)
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+
+class RequestLogger(logging.LoggerAdapter):
+    """A logger that also emits DEBUG records for sampled and debugged requests, whatever LOG_LEVEL says."""
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def isEnabledFor(self, level):
+        context = _request.get()
+        if context is not None and context[1] is not None:
+            return level >= logging.DEBUG
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, msg, *args, **kwargs):
+        if self.isEnabledFor(level):
+            # Logger.log would drop the record again on LOG_LEVEL
+            self.logger._log(level, msg, args, **kwargs)
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        context = _request.get()
+        record.request_id = context[0] if context is not None else '-'
+        return True
+
+
+def get_logger(name):
+    return RequestLogger(logging.getLogger(name))
+
+
+def configure():
+    """Send the app's records to stderr at LOG_LEVEL, once per process."""
+    logger = logging.getLogger('app')
+    if getattr(logger, '_basketroute_configured', False):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    handler.addFilter(_RequestIdFilter())
+    logger.addHandler(handler)
+    logger.setLevel(config.LOG_LEVEL)
+    logger.propagate = False
+    logger._basketroute_configured = True
+
+
+def begin_request(request_id):
+    """Bind request_id to the current context, deciding whether it is dumped. Returns a token for end_request."""
+    if request_id in config.LOG_DEBUG_REQUEST_IDS:
+        dump = 'full'
+    elif config.LOG_SAMPLE_RATE and random.random() < config.LOG_SAMPLE_RATE:
+        dump = 'sampled'
+    else:
+        dump = None
+    return _request.set((request_id, dump))
+
+
+def end_request(token):
+    _request.reset(token)
+
+
+def current():
+    """The current request's logging context, to hand to another thread or process."""
+    return _request.get()
+
+
+@contextmanager
+def bound(context):
+    """Log as the request `context` (from current()) inside the block."""
+    token = _request.set(context)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+class payload:
+    """
+    A value to log, formatted only if the record is emitted. Its repr is cut to
+    LOG_PAYLOAD_LIMIT characters unless the request is dumped in full.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = repr(self.value)
+        context = _request.get()
+        if (context is not None and context[1] == 'full') or len(text) <= config.LOG_PAYLOAD_LIMIT:
+            return text
+        size = f'{len(self.value)} entries, ' if hasattr(self.value, '__len__') else ''
+        return f'{text[:config.LOG_PAYLOAD_LIMIT]}... ({size}{len(text)} chars)'
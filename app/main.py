@@ -1,167 +1,283 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, render_template, g
-import pulp
-import requests
-import random
-import os
+from flask import Flask, request, url_for, jsonify, g, Response, stream_with_context
 import json
-from geopy.distance import geodesic
 from flask_cors import CORS
 import sqlite3
+import time
+import uuid
+from contextlib import closing
 
-from app.calculator.optimizer import optimize, translate_ip_result_to_plan
-from app.calculator.pathOptimize import optimize_path
-from app.db.query import (
-    get_products_by_names, get_stores_by_names, get_products_by_ids,
-    get_all_products, get_product_prices, 
-    get_stores_nearby, get_products_grouped_by_category, 
-    get_all_stores, get_stores_like, build_item_store_matrix
-)
+from app import config
+
+from app.db.query import get_product_prices, get_stores_nearby, get_stores_like, parse_location, search_products
+from app.db.catalog import get_catalog
+from app.db.pool import get_pool
+from app.db.init_db import migrate, refresh_store_distances
+from app import logs, metrics
+from app.planner import PlanError, cache_stats, parse_basket, plan_basket, replan
+from app.batch import plan_batch
+from app.jobs import JobQueueFull, get_job_store
+from app.listing import listing_response
+from app.pages import PageCache
+from app.workers import get_solver_pool
 
 app = Flask(__name__)
 CORS(app)
+logs.configure()
+logger = logs.get_logger(__name__)
 
-DATABASE = 'db/fake_basketroute.db'
 def get_db():
-    if not hasattr(g, 'db'):
-        g.db = sqlite3.connect(DATABASE)
+    """Borrow a pooled connection for the rest of the request."""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
     return g.db
 
+@app.before_request
+def start_timing():
+    g.started = time.perf_counter()
+    metrics.begin_trace()
+    # clients may pass their own X-Request-ID, e.g. one listed in LOG_DEBUG_REQUEST_IDS
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.log_token = logs.begin_request(g.request_id)
+
+@app.after_request
+def record_timing(response):
+    seconds = time.perf_counter() - g.pop('started', time.perf_counter())
+    spans = metrics.end_trace()
+    metrics.REQUEST_SECONDS.observe(seconds, request.endpoint or 'unknown', str(response.status_code))
+    if config.SLOW_REQUEST_LOG and seconds >= config.SLOW_REQUEST_SECONDS:
+        stages = {}
+        for stage, stage_seconds in spans:
+            stages[stage] = stages.get(stage, 0.0) + stage_seconds
+        metrics.log_slow_request({
+            'time': time.time(),
+            'request_id': g.get('request_id'),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'seconds': seconds,
+            'stages': stages,
+            'solver': g.get('solver'),
+            'body': request.get_data(as_text=True)[:config.SLOW_REQUEST_BODY_LIMIT]
+        })
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def end_request_log(error):
+    token = g.pop('log_token', None)
+    if token is not None:
+        logs.end_request(token)
+
 @app.teardown_appcontext
 def close_db(error):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().release(db)
 
-def create_connection():
-    db_path = os.path.join(os.path.dirname(__file__), DATABASE)
-    conn = sqlite3.connect(db_path)
-    return conn
+def prepare_database():
+    """
+    Apply pending migrations and rebuild derived tables. Run once per deploy,
+    before the web workers start: flask --app app.main init-db
+    """
+    with closing(sqlite3.connect(config.DATABASE_PATH)) as conn:
+        migrate(conn)
+        refresh_store_distances(conn)
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=10000)
+@app.cli.command('init-db')
+def init_db_command():
+    """Migrate the database and rebuild the store distance table."""
+    prepare_database()
+
+index_page = PageCache(app)
 
 @app.route('/')
 def index():
-    conn = create_connection()
-    stores = get_all_stores(conn)
-    conn = create_connection()
-    products = get_all_products(conn)
-    conn = create_connection()
-    grouped_products = get_products_grouped_by_category(conn)
-    return render_template('index.html', stores=stores, products=products, grouped_products=grouped_products)
+    """Served from the pre-rendered, precompressed page for the current catalog version."""
+    page = index_page.get()
+    if request.if_none_match.contains(page.etag):
+        response = Response(status=304)
+    else:
+        encoding, body = page.body_for(request.accept_encodings)
+        response = Response(body, mimetype='text/html')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(page.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
 
 @app.route('/api/optimize', methods=['POST'])
 def optimize_shopping():
-    data = request.json
-    item_ids_reqs = data.get('items', [])
-    max_stores = int(data.get('max_stores', 5))
-    print(request.json)
-    max_stores = min(max_stores, 5)
-    print(max_stores)
-    items = get_products_by_ids(create_connection(), [item["product_id"] for item in item_ids_reqs])
-    item_names = [item['name'] for item in items]
-    print("Received item names:", item_names)
-    if not item_names:
-        return jsonify({'error': 'Item names and store names are required'}), 400
-    items = get_products_by_names(create_connection(), item_names)
-    stores = get_all_stores(create_connection())
-    store_names = [store['name'] for store in stores]
-    item_store_matrix = build_item_store_matrix(create_connection(), items, stores)
-    print("Item-Store Matrix:", item_store_matrix)
-    if not item_store_matrix:
-        return jsonify({'error': 'No valid item-store matrix found'}), 400
-
-    if not item_names or not store_names or not item_store_matrix:
-        return jsonify({'error': 'Invalid input data'}), 400
-
-    requirements = {item['product_id']: item['quantity'] for item in item_ids_reqs}
-    result = optimize(item_store_matrix, requirements, max_stores)
-    if not result:
-        return jsonify({'error': 'Optimization failed'}), 500
-    translated = translate_ip_result_to_plan(result, items, stores)
-
-    print(json.dumps(translated))
-    plan = translated.get('plan', {})
-    stores_dict = {store['name']: {"lat" : store['lat'], "lon" : store['lon']} for store in stores}
-    store_list = [{'name': store, 'lat': stores_dict[store]['lat'], 'lon': stores_dict[store]['lon']} for store in plan.keys()]
-    for store in store_list:
-        for s in stores:
-            if s['name'] == store['name']:
-                store['lat'] = s['lat']
-                store['lon'] = s['lon']
-                break
-    optimized_stores = optimize_path(store_list, starting_point=(40.7128, -74.0060))  # Example starting point (New York City)
-    if optimized_stores["status"] != "Optimal":
-        return jsonify({'error': 'Path optimization failed'}), 500
-    optimized_plan = optimized_stores['ordered_stores']
-    distance = optimized_stores['total_distance_meters']
-    print("Optimized path:", [s['name'] for s in optimized_plan])
-    print("plan :", plan)
-    translated['plan'] = [
-        {'store': store['name'], 'items': plan[store['name']]} for store in optimized_plan
-    ]
-    translated['cost'] = result['total_cost']
-    translated['distance'] = distance
-    print("Translated plan:", translated)
-
-    return jsonify(translated)
+    """
+    Body: {'items': [{'product_id', 'quantity'}], 'max_stores', 'lat', 'lon', 'radius_km'}.
+    With lat/lon only stores within radius_km are considered and the route starts there.
+
+    With ?async=1 the plan is computed in the background: the response is 202 with
+    a job id to poll at /api/optimize/jobs/<id>.
+    """
+    logger.debug('optimize request: %s', logs.payload(request.json))
+    try:
+        basket = parse_basket(request.json)
+        catalog = get_catalog()
+        if request.args.get('async') == '1':
+            try:
+                job = get_job_store().submit(lambda job: plan_basket(catalog, basket, on_priced=job.set_partial))
+            except JobQueueFull:
+                return jsonify({'error': 'Too many pending optimizations, try again shortly'}), 503
+            return jsonify({'id': job.id, 'status': job.status, 'poll': url_for('optimize_job', job_id=job.id)}), 202
+        translated = plan_basket(catalog, basket)
+    except PlanError as e:
+        return jsonify({'error': e.message}), e.status
+    g.solver = {key: translated.get(key) for key in ('status', 'engine', 'gap', 'cost', 'distance')}
+    with metrics.span('serialize'):
+        return jsonify(translated)
+
+@app.route('/api/optimize/edit', methods=['POST'])
+def optimize_edit():
+    """
+    Body: {'plan_id': from a previous /api/optimize response, 'items': [{'product_id', 'quantity'}],
+    'max_stores'}. Listed quantities replace the previous ones (0 removes the item).
+    """
+    try:
+        translated = replan(get_catalog(), request.get_json(silent=True))
+    except PlanError as e:
+        return jsonify({'error': e.message}), e.status
+    g.solver = {key: translated.get(key) for key in ('status', 'engine', 'gap', 'cost', 'distance')}
+    with metrics.span('serialize'):
+        return jsonify(translated)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Latency histograms, cache, solver pool and job counters in Prometheus text format."""
+    lines = metrics.STAGE_SECONDS.render() + metrics.REQUEST_SECONDS.render()
+    caches = cache_stats()
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                        ('expirations', 'counter'), ('invalidations', 'counter'), ('stale', 'counter'),
+                        ('size', 'gauge')):
+        name = f'basketroute_cache_{field}' + ('_total' if kind == 'counter' else '')
+        lines += metrics.render_gauges(name, f'Result cache {field}.', kind,
+                                       [({'cache': cache}, stats[field]) for cache, stats in caches.items()])
+    solver = get_solver_pool().stats()
+    lines += metrics.render_gauges('basketroute_solver_jobs', 'Solver jobs waiting or running.', 'gauge',
+                                   [({'state': state}, solver[state]) for state in ('waiting', 'running')])
+    lines += metrics.render_gauges('basketroute_solver_jobs_total', 'Solver jobs by outcome.', 'counter',
+                                   [({'outcome': outcome}, solver[outcome])
+                                    for outcome in ('completed', 'failed', 'rejected', 'timeouts')])
+    lines += metrics.render_gauges('basketroute_solver_restarts_total', 'Solver worker restarts.', 'counter',
+                                   [({}, solver['restarts'])])
+    lines += metrics.render_gauges('basketroute_async_jobs_pending', 'Asynchronous optimizations queued or running.',
+                                   'gauge', [({}, get_job_store().stats()['pending'])])
+    catalog = get_catalog()
+    lines += metrics.render_gauges('basketroute_catalog_size', 'Rows in the in-memory catalog snapshot.', 'gauge', [
+        ({'table': 'stores'}, len(catalog.store_ids)),
+        ({'table': 'products'}, len(catalog.product_ids)),
+        ({'table': 'offers'}, len(catalog.offer_store))
+    ])
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/optimize/jobs/<job_id>')
+def optimize_job(job_id):
+    """
+    State of an asynchronous optimization: 'queued', 'running', 'priced' (with the
+    unrouted price plan as 'partial'), 'done' (with 'result') or 'failed'.
+    """
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/optimize/batch', methods=['POST'])
+def optimize_batch():
+    """
+    Body: {'baskets': [<an /api/optimize body>, ...]}.
+    Streams one JSON line per basket, {'index', ...plan} or {'index', 'error'},
+    in the order the plans finish.
+    """
+    data = request.get_json(silent=True)
+    baskets = data.get('baskets') if isinstance(data, dict) else None
+    if not isinstance(baskets, list):
+        return jsonify({'error': 'baskets must be a list of /api/optimize bodies'}), 400
+    if len(baskets) > config.BATCH_MAX_BASKETS:
+        return jsonify({'error': f'At most {config.BATCH_MAX_BASKETS} baskets per batch'}), 413
+    catalog = get_catalog()
+
+    def generate():
+        for index, result in plan_batch(catalog, baskets):
+            yield json.dumps({'index': index, **result}) + '\n'
+
+    # keep the request (and its logging context) alive while the lines are produced
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/api/all_stores')
 def all_stores():
-    conn = create_connection()
-    stores = get_all_stores(conn)
-    return jsonify(stores)
+    """
+    Every store, streamed. See listing_response for ?limit/?cursor pages,
+    ?fields=, NDJSON and conditional requests.
+    """
+    return listing_response(get_db(), 'stores',
+                            ['id', 'name', 'lat', 'lon', 'address', 'phone', 'website'])
 
 @app.route('/api/store_inventories')
 def store_inventories():
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT s.name, p.name, sp.price, sp.inventory
-        FROM StoreProducts sp
-        JOIN Stores s ON sp.store_id = s.id
-        JOIN Products p ON sp.product_id = p.id
-    ''')
-    rows = cursor.fetchall()
-    conn.close()
-
-    inventories = {}
-    for store_name, product_name, price, inventory in rows:
-        if store_name not in inventories:
-            inventories[store_name] = []
-        inventories[store_name].append({
-            'product': product_name,
-            'price': price,
-            'inventory': inventory
-        })
-    
-    return jsonify(inventories)
+    """
+    {store name: [{'product', 'price', 'inventory'}]}, streamed; pages and NDJSON
+    are flat rows ordered by store id and product id.
+    """
+    return listing_response(get_db(), 'inventories',
+                            ['product', 'price', 'inventory'], group_by='store', grouped_listing='inventories_by_store')
+
+@app.route('/api/stores_nearby')
+def stores_nearby():
+    location = request.args.get('location', '')
+    radius_km = request.args.get('radius_km', type=float)
+    limit = request.args.get('limit', type=int)
+    if not parse_location(location):
+        return jsonify({'error': "location must be 'lat,lon'"}), 400
+    stores = get_stores_nearby(get_db(), location, radius_km, limit)
+    return jsonify(stores)
 
 @app.route('/api/stores_like/<string:name>')
 def stores_like(name):
-    conn = create_connection()
-    stores = get_stores_like(conn, name)
+    conn = get_db()
+    limit = min(request.args.get('limit', config.SEARCH_MAX_LIMIT, type=int), config.SEARCH_MAX_LIMIT)
+    stores = get_stores_like(conn, name, limit, version=get_catalog().version)
     return jsonify(stores)
 
+@app.route('/api/products/search')
+def product_search():
+    """
+    ?q=<words>&limit=&offset=. The last word matches as a prefix unless q ends in a
+    space; misspelled words are corrected when nothing matches as typed.
+    Returns {'results', 'next_offset', 'fuzzy'}.
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 20, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not 1 <= limit <= config.SEARCH_MAX_LIMIT or offset < 0:
+        return jsonify({'error': f'limit must be 1-{config.SEARCH_MAX_LIMIT} and offset >= 0'}), 400
+    return jsonify(search_products(get_db(), query, limit, offset, version=get_catalog().version))
+
 @app.route('/api/products')
 def get_products():
-    conn = create_connection()
-    products = get_all_products(conn)
-    return jsonify(products)
+    return listing_response(get_db(), 'products', ['id', 'name', 'category', 'unit'])
 
 @app.route('/api/products_by_category')
 def get_products_by_category():
-    conn = create_connection()
-    grouped_products = get_products_grouped_by_category(conn)
-    return jsonify(grouped_products)
+    """{category: [{'id', 'name', 'unit'}]}, streamed; pages and NDJSON are flat rows ordered by category."""
+    return listing_response(get_db(), 'products_by_category',
+                            ['id', 'name', 'unit'], group_by='category', grouped_listing='products_by_category')
 
 @app.route('/api/product_prices/<string:product_name>')
 def get_product_prices_by_name(product_name):
-    conn = create_connection()
+    conn = get_db()
     prices = get_product_prices(conn, product_name)
     if prices:
         return jsonify(prices)
     return jsonify({'error': 'Product not found'}), 404
 
-if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+if __name__ == "__main__":
+    prepare_database()
+    # Load the catalog snapshot before serving rather than on the first request
+    get_catalog()
+    app.run(host="0.0.0.0", port=10000)
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from app import config
+
+# Seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for k, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[k] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            base = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{{{",".join(base + [le])}}} {cumulative}')
+            suffix = f'{{{",".join(base)}}}' if base else ''
+            lines.append(f'{self.name}_sum{suffix} {total!r}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_gauges(name, documentation, kind, samples):
+    """Prometheus lines for a gauge or counter from [(labels dict, value), ...]."""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return lines
+
+
+STAGE_SECONDS = Histogram('basketroute_stage_seconds', 'Time spent in each stage of planning a basket.', ('stage',))
+REQUEST_SECONDS = Histogram('basketroute_request_seconds', 'HTTP request latency.', ('endpoint', 'status'))
+
+# Spans recorded on this thread go to the innermost active collector, or straight
+# to STAGE_SECONDS when there is none.
+_local = threading.local()
+
+
+def record(stage, seconds):
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans.append((stage, seconds))
+    else:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def collect():
+    """
+    Gather the spans recorded inside the block into a list instead of the
+    histograms, e.g. in a solver worker whose spans are shipped back to the
+    web process with its result.
+    """
+    previous = getattr(_local, 'spans', None)
+    _local.spans = spans = []
+    try:
+        yield spans
+    finally:
+        _local.spans = previous
+
+
+def begin_trace():
+    """Start collecting this thread's spans for the current request."""
+    _local.spans = []
+
+
+def end_trace():
+    """Stop collecting, move the request's spans into STAGE_SECONDS and return them."""
+    spans = getattr(_local, 'spans', None) or []
+    _local.spans = None
+    for stage, seconds in spans:
+        STAGE_SECONDS.observe(seconds, stage)
+    return spans
+
+
+_slow_log_lock = threading.Lock()
+
+
+def log_slow_request(entry):
+    """Append a JSON line describing a slow request to SLOW_REQUEST_LOG, if configured."""
+    if not config.SLOW_REQUEST_LOG:
+        return
+    line = json.dumps(entry, default=str)
+    with _slow_log_lock:
+        with open(config.SLOW_REQUEST_LOG, 'a') as f:
+            f.write(line + '\n')
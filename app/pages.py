@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import threading
+
+from flask import render_template
+
+from app import config
+from app.db.catalog import get_catalog
+from app.logs import get_logger
+
+try:
+    import brotli
+except ImportError:  # optional: pages are served gzipped or plain without it
+    brotli = None
+
+logger = get_logger(__name__)
+
+
+class RenderedPage:
+    """A page rendered for one catalog version, with precompressed bodies by Content-Encoding."""
+
+    def __init__(self, version, html):
+        self.version = version
+        body = html.encode('utf-8')
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+
+    def body_for(self, accept_encoding):
+        """(encoding, body) of the smallest variant the client accepts."""
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accept_encoding[encoding]:
+                return encoding, self.bodies[encoding]
+        return 'identity', self.bodies['identity']
+
+
+def index_context(catalog):
+    """Template data for index.html, from the catalog snapshot rather than SQLite."""
+    grouped_products = {}
+    for product in catalog.products:
+        grouped_products.setdefault(product['category'], []).append(
+            {'id': product['id'], 'name': product['name'], 'unit': product['unit']}
+        )
+    return {'stores': catalog.get_stores(), 'products': catalog.products, 'grouped_products': grouped_products}
+
+
+class PageCache:
+    """
+    index.html rendered per catalog version. The first request renders it; after
+    that a background thread re-renders whenever the catalog snapshot changes,
+    so page views only read memory.
+    """
+
+    def __init__(self, app, template='index.html', interval=None):
+        self.app = app
+        self.template = template
+        self.interval = config.CATALOG_REFRESH_INTERVAL if interval is None else interval
+        self.page = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    def _render(self, catalog):
+        with self.app.app_context():
+            html = render_template(self.template, **index_context(catalog))
+        return RenderedPage(catalog.version, html)
+
+    def _refresh(self):
+        while not self._stop.wait(self.interval):
+            try:
+                catalog = get_catalog()
+                if catalog.version != self.page.version:
+                    self.page = self._render(catalog)
+                    logger.info('re-rendered %s for catalog %s', self.template, catalog.version)
+            except Exception:
+                logger.exception('re-rendering %s failed', self.template)
+
+    def get(self):
+        page = self.page
+        if page is not None:
+            return page
+        with self._lock:
+            if self.page is None:
+                self.page = self._render(get_catalog())
+                self._refresher = threading.Thread(target=self._refresh, name='page-refresh', daemon=True)
+                self._refresher.start()
+            return self.page
+
+    def close(self):
+        self._stop.set()
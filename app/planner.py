@@ -0,0 +1,421 @@
+import hashlib
+
+from app import config
+from app.cache import ResultCache
+from app.calculator.joint import joint_solve
+from app.calculator.optimizer import optimize, translate_ip_result_to_plan
+from app.calculator.pathOptimize import optimize_path
+from app.db.query import parse_location
+from app.logs import bound, current, get_logger, payload
+from app.metrics import collect, record, span
+from app.workers import SolverBusy, SolverTimeout, get_solver_pool
+
+# Where routes start when the request does not say (New York City)
+DEFAULT_START = (40.7128, -74.0060)
+MAX_STORES = 5
+MODES = ('cost', 'joint')
+
+logger = get_logger(__name__)
+
+
+class PlanError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_basket(data):
+    """
+    Validate an /api/optimize body into
+    {'requirements': {product_id: qty}, 'max_stores': int, 'start': (lat, lon) or None,
+     'radius_km': float, 'mode': 'cost' | 'joint', 'distance_weight': float}.
+
+    The user's position is given as 'lat' and 'lon' (or a 'lat,lon' 'location'
+    string); 'radius_km' bounds how far from it candidate stores may be. In
+    'joint' mode travel is priced into the objective at 'distance_weight'
+    dollars per km.
+    """
+    if not isinstance(data, dict):
+        raise PlanError('Request body must be a JSON object')
+    try:
+        requirements = {}
+        for item in data.get('items', []):
+            product_id, quantity = int(item['product_id']), int(item['quantity'])
+            if quantity < 1:
+                raise ValueError(quantity)
+            requirements[product_id] = requirements.get(product_id, 0) + quantity
+        max_stores = min(int(data.get('max_stores', MAX_STORES)), MAX_STORES)
+    except (KeyError, TypeError, ValueError):
+        raise PlanError("items must be a list of {'product_id', 'quantity'} with quantity at least 1, "
+                        "and max_stores an integer")
+
+    start = None
+    if data.get('lat') is not None or data.get('lon') is not None:
+        try:
+            start = (float(data['lat']), float(data['lon']))
+        except (KeyError, TypeError, ValueError):
+            raise PlanError('lat and lon must both be numbers')
+    elif data.get('location'):
+        start = parse_location(str(data['location']))
+        if not start:
+            raise PlanError("location must be 'lat,lon'")
+    if start is not None and not (-90 <= start[0] <= 90 and -180 <= start[1] <= 180):
+        raise PlanError('lat/lon out of range')
+
+    try:
+        radius_km = float(data.get('radius_km', config.NEARBY_RADIUS_KM))
+    except (TypeError, ValueError):
+        raise PlanError('radius_km must be a number')
+    if radius_km <= 0:
+        raise PlanError('radius_km must be positive')
+
+    mode = data.get('mode', 'cost')
+    if mode not in MODES:
+        raise PlanError(f"mode must be one of {', '.join(MODES)}")
+    try:
+        distance_weight = float(data.get('distance_weight', config.JOINT_DISTANCE_WEIGHT))
+    except (TypeError, ValueError):
+        raise PlanError('distance_weight must be a number')
+    if distance_weight < 0:
+        raise PlanError('distance_weight must not be negative')
+
+    return {
+        'requirements': requirements,
+        'max_stores': max_stores,
+        'start': start,
+        'radius_km': radius_km,
+        'mode': mode,
+        'distance_weight': distance_weight
+    }
+
+
+def candidate_stores(catalog, start, radius_km):
+    """Stores the solver may use: those within radius_km of start, or every store without a start."""
+    if start is None:
+        return catalog.get_stores()
+    return catalog.stores_nearby(start[0], start[1], radius_km=radius_km)
+
+
+def basket_key(basket):
+    """
+    Canonical form of a parsed basket: identical baskets from starting points in
+    the same START_BUCKET_DEGREES bucket share a key.
+    """
+    start = basket['start']
+    if start is not None:
+        start = (round(start[0] / config.START_BUCKET_DEGREES), round(start[1] / config.START_BUCKET_DEGREES))
+    return (
+        tuple(sorted(basket['requirements'].items())),
+        basket['max_stores'],
+        basket['mode'],
+        basket['distance_weight'] if basket['mode'] == 'joint' else None,
+        basket['radius_km'],
+        start
+    )
+
+
+def bucket_center(start):
+    """The center of the START_BUCKET_DEGREES bucket holding start (None stays None)."""
+    if start is None:
+        return None
+    size = config.START_BUCKET_DEGREES
+    return (round(start[0] / size) * size, round(start[1] / size) * size)
+
+
+def prepare_assignment(catalog, basket, offers=None, warm_stores=None):
+    """
+    Everything the solver needs for a basket, as plain picklable data:
+    {'items', 'matrix', 'requirements', 'max_stores', 'mode', 'distance_weight',
+     'store_ids', 'from_start', 'store_distances', 'warm_stores'}.
+
+    Candidate stores are chosen around the bucket center of the starting point so
+    the plan does not depend on where in the bucket the user stands. `offers` is
+    an optional, larger PriceMatrix to take the offers from instead of the
+    catalog (shared by the baskets of a batch, or kept from a previous plan).
+    `warm_stores` are the stores of a previous plan to start the search from.
+    """
+    requirements = basket['requirements']
+    with span('db_fetch'):
+        items = catalog.get_products(list(requirements))
+    logger.debug('basket items: %s', payload([item['name'] for item in items]))
+    if not items:
+        raise PlanError('Item names and store names are required')
+
+    start = bucket_center(basket['start'])
+    with span('nearby_stores'):
+        stores = candidate_stores(catalog, start, basket['radius_km'])
+    if not stores:
+        raise PlanError('No stores within radius_km of the starting point')
+    item_ids = [item['id'] for item in items]
+    store_ids = [store['id'] for store in stores]
+    with span('matrix_build'):
+        if offers is None:
+            item_store_matrix = catalog.item_store_matrix(item_ids, store_ids)
+        else:
+            item_store_matrix = offers.take(item_ids, store_ids)
+    logger.debug('item-store matrix over %d stores: %s', len(store_ids), payload(item_store_matrix))
+    if not item_store_matrix:
+        raise PlanError('No valid item-store matrix found')
+
+    problem = {
+        'items': items,
+        'matrix': item_store_matrix,
+        'requirements': requirements,
+        'max_stores': basket['max_stores'],
+        'mode': basket['mode'],
+        'distance_weight': basket['distance_weight'],
+        'store_ids': store_ids,
+        'from_start': None,
+        'store_distances': None,
+        'warm_stores': warm_stores
+    }
+    if basket['mode'] == 'joint':
+        start = start or DEFAULT_START
+        with span('distance_matrix'):
+            problem['from_start'] = catalog.distances_from(start[0], start[1], store_ids)
+            problem['store_distances'] = catalog.store_distance_matrix(store_ids)
+    return problem
+
+
+def solve_assignment(problem):
+    """
+    Run the price (or joint) solver on a prepared problem. Safe to call in a worker
+    process: the solver's spans come back in the result under 'spans'.
+    """
+    with bound(problem.get('log_context')), collect() as spans:
+        with span('solve'):
+            if problem['mode'] == 'joint':
+                result = joint_solve(
+                    problem['matrix'], problem['requirements'], problem['max_stores'], problem['store_ids'],
+                    problem['from_start'], problem['store_distances'], problem['distance_weight'],
+                    problem['warm_stores']
+                )
+            else:
+                result = optimize(problem['matrix'], problem['requirements'], problem['max_stores'],
+                                  warm_stores=problem['warm_stores'])
+    if result:
+        result['spans'] = spans
+    return result
+
+
+def solver_input(problem):
+    # the product dicts stay in this process; workers only need the numbers, and
+    # the request's logging context so their records carry its id
+    data = {key: value for key, value in problem.items() if key != 'items'}
+    data['log_context'] = current()
+    return data
+
+
+def submit_assignment(problem):
+    """Queue a prepared problem on the solver pool. Raises PlanError(503) when the pool is saturated."""
+    try:
+        return get_solver_pool().submit(solve_assignment, solver_input(problem))
+    except SolverBusy:
+        raise PlanError('Solver is busy, try again shortly', 503)
+
+
+def assignment_result(future):
+    """Wait for a submitted problem; solver timeouts and failures become PlanError."""
+    try:
+        with span('solver_wait'):
+            result = future.result()
+    except SolverTimeout:
+        raise PlanError('Optimization timed out', 504)
+    except Exception as e:
+        logger.error('solver failed: %s', e)
+        raise PlanError('Optimization failed', 500)
+    if not result:
+        raise PlanError('Optimization failed', 500)
+    for stage, seconds in result.pop('spans', ()):
+        record(stage, seconds)
+    return result
+
+
+def make_assignment(problem, result):
+    """
+    What is cached per basket: the solver result, the product dicts, and the
+    PriceMatrix and candidate stores it was solved over (reused by edits).
+    """
+    return {'result': result, 'items': problem['items'], 'matrix': problem['matrix'], 'store_ids': problem['store_ids']}
+
+
+def cached_assignment(catalog, key):
+    """The make_assignment() dict cached for a basket_key in this catalog generation, or None."""
+    return _assignment_cache.get(key, catalog.generation)
+
+
+def cache_assignment(catalog, key, assignment):
+    _assignment_cache.put(key, assignment, catalog.generation)
+
+
+def assign_basket(catalog, basket):
+    """
+    Price plan for a basket, memoized per basket_key and catalog generation.
+    Returns make_assignment()'s dict.
+    """
+    key = basket_key(basket)
+    cached = cached_assignment(catalog, key)
+    if cached is not None:
+        return cached
+    problem = prepare_assignment(catalog, basket)
+    assignment = make_assignment(problem, assignment_result(submit_assignment(problem)))
+    cache_assignment(catalog, key, assignment)
+    return assignment
+
+
+def plan_basket(catalog, basket, on_priced=None):
+    """
+    Cheapest plan for a parsed basket (or cheapest cost + travel in 'joint'
+    mode), with the chosen stores in visiting order from the starting point.
+    on_priced, if given, is called with the unrouted price plan as soon as it is
+    known. Raises PlanError for requests that cannot be planned.
+    """
+    assignment = assign_basket(catalog, basket)
+    if on_priced is not None:
+        on_priced(price_plan(catalog, assignment))
+    return finish_plan(catalog, basket, assignment)
+
+
+def price_plan(catalog, assignment):
+    """The price plan by store name, before routing: {'plan', 'cost', 'status', 'engine', 'gap'}."""
+    result, items = assignment['result'], assignment['items']
+    stores = catalog.get_stores(list(dict.fromkeys(s for s, _, _ in result['plan'])))
+    return translate_ip_result_to_plan(result, items, stores, assignment['matrix'])
+
+
+def finish_plan(catalog, basket, assignment):
+    """Translate a price plan and order its stores into the response shape of /api/optimize."""
+    result, items = assignment['result'], assignment['items']
+    translated = price_plan(catalog, assignment)
+
+    route = route_plan(catalog, result['plan'], items, basket['start'], assignment['matrix'])
+    translated['plan'] = route['plan']
+    translated['cost'] = result['total_cost']
+    translated['distance'] = route['distance']
+    if basket['mode'] == 'joint' and result['total_cost'] is not None:
+        translated['objective'] = result['total_cost'] + basket['distance_weight'] * route['distance'] / 1000
+    translated['plan_id'] = remember_plan(basket)
+    logger.debug('plan: %s', payload(translated))
+    return translated
+
+
+def _purchases_by_store(plan, items, matrix=None):
+    item_names = {item['id']: item['name'] for item in items}
+    purchases = {}
+    for store_id, item_id, quantity in plan:
+        purchase = {'item': item_names[item_id], 'quantity': quantity}
+        if matrix is not None:
+            purchase['price'] = matrix.price(store_id, item_id)
+        purchases.setdefault(store_id, []).append(purchase)
+    return purchases
+
+
+def route_plan(catalog, plan, items, start, matrix=None):
+    """
+    Visit the stores of an assignment plan [(store_id, item_id, qty), ...] in the
+    shortest order from start. Routes are memoized per store set and start.
+    With the PriceMatrix the plan was solved over, purchases carry their unit price.
+    Returns {'plan': [{'store', 'items'}, ...], 'distance'}.
+    """
+    purchases = _purchases_by_store(plan, items, matrix)
+    store_ids = list(purchases)
+    start = start or DEFAULT_START
+
+    key = (tuple(sorted(store_ids)), round(start[0], 6), round(start[1], 6))
+    route = _route_cache.get(key, catalog.generation)
+    if route is None:
+        with span('distance_matrix'):
+            store_distances = catalog.store_distance_matrix(store_ids)
+        with span('route_solve'):
+            optimized_stores = optimize_path(
+                catalog.get_stores(store_ids),
+                starting_point=start,
+                store_distances=store_distances
+            )
+        if optimized_stores["status"] not in ("Optimal", "Feasible"):
+            raise PlanError('Path optimization failed', 500)
+        route = ([store['id'] for store in optimized_stores['ordered_stores']], optimized_stores['total_distance_meters'])
+        _route_cache.put(key, route, catalog.generation)
+    ordered_ids, distance = route
+    optimized_plan = catalog.get_stores(ordered_ids)
+    logger.debug('route through stores %s, %.0f m', ordered_ids, distance)
+    return {
+        'plan': [{'store': store['name'], 'items': purchases[store['id']]} for store in optimized_plan],
+        'distance': distance
+    }
+
+
+def plan_id(basket):
+    """Stable id of a parsed basket, handed to clients so they can edit the plan later."""
+    return hashlib.sha1(repr((basket_key(basket), basket['start'])).encode()).hexdigest()[:20]
+
+
+def remember_plan(basket):
+    key = plan_id(basket)
+    _plans.put(key, basket)
+    return key
+
+
+def apply_edit(basket, data):
+    """
+    A copy of basket with an edit applied. data['items'] sets the quantity of each
+    listed product (0 removes it) and data['max_stores'], if present, replaces the cap.
+    """
+    requirements = dict(basket['requirements'])
+    try:
+        for item in data.get('items', []):
+            product_id, quantity = int(item['product_id']), int(item['quantity'])
+            if quantity < 0:
+                raise ValueError(quantity)
+            if quantity:
+                requirements[product_id] = quantity
+            else:
+                requirements.pop(product_id, None)
+        max_stores = min(int(data.get('max_stores', basket['max_stores'])), MAX_STORES)
+    except (KeyError, TypeError, ValueError):
+        raise PlanError("items must be a list of {'product_id', 'quantity'} and max_stores an integer")
+    return dict(basket, requirements=requirements, max_stores=max_stores)
+
+
+def replan(catalog, data):
+    """
+    Re-optimize a previous plan after an edit: {'plan_id', 'items', 'max_stores'}.
+
+    The item-store rows of the previous solve are reused (only added products are
+    looked up) and the solver starts from the previous plan's stores. If the
+    previous plan has left the cache the edited basket is solved from scratch.
+    """
+    if not isinstance(data, dict):
+        raise PlanError('Request body must be a JSON object')
+    basket = _plans.get(data.get('plan_id'))
+    if basket is None:
+        raise PlanError('Unknown or expired plan_id', 404)
+    edited = apply_edit(basket, data)
+
+    key = basket_key(edited)
+    assignment = cached_assignment(catalog, key)
+    if assignment is None:
+        previous = cached_assignment(catalog, basket_key(basket))
+        if previous is None:
+            return plan_basket(catalog, edited)
+        requirements = edited['requirements']
+        offers = previous['matrix'].take(list(requirements))
+        added = [product_id for product_id in requirements if product_id not in basket['requirements']]
+        if added:
+            offers = offers.merge(catalog.item_store_matrix(added, previous['store_ids']))
+        warm_stores = list(dict.fromkeys(s for s, _, _ in previous['result']['plan']))
+        problem = prepare_assignment(catalog, edited, offers, warm_stores)
+        assignment = make_assignment(problem, assignment_result(submit_assignment(problem)))
+        cache_assignment(catalog, key, assignment)
+    return finish_plan(catalog, edited, assignment)
+
+
+_assignment_cache = ResultCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL)
+_route_cache = ResultCache(config.ROUTE_CACHE_SIZE, config.RESULT_CACHE_TTL)
+# parsed baskets by plan_id, independent of the catalog version
+_plans = ResultCache(config.PLAN_STORE_SIZE, config.PLAN_STORE_TTL)
+
+
+def cache_stats():
+    return {'assignments': _assignment_cache.stats(), 'routes': _route_cache.stats()}
@@ -0,0 +1,64 @@
+"""
+Load a chain's price dump into the catalog.
+
+    python -m app.stores.fetch ctown dump.csv [more.jsonl.gz ...] [--defer-indexes]
+"""
+import argparse
+
+from app import config, logs
+from app.db.ingest import ingest_feed, map_records, read_feed
+
+# chain -> {dump field: ingest record field}. The dump fields are the expected
+# export headers; adjust them here when a chain's export changes.
+CHAINS = {
+    'ctown': {
+        'store_name': 'store',
+        'item_description': 'product',
+        'department': 'category',
+        'size_uom': 'unit',
+        'regular_price': 'price',
+        'on_hand': 'inventory',
+    },
+    'keyfoods': {
+        'store': 'store',
+        'product_name': 'product',
+        'category': 'category',
+        'unit': 'unit',
+        'price': 'price',
+        'quantity_available': 'inventory',
+    },
+    'target': {
+        'location_name': 'store',
+        'title': 'product',
+        'product_type': 'category',
+        'package_unit': 'unit',
+        'current_retail': 'price',
+        'available_to_promise_quantity': 'inventory',
+    },
+}
+
+
+def chain_records(chain, path):
+    """The records of a chain's dump at path, renamed to ingest record fields."""
+    return map_records(read_feed(path), CHAINS[chain])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingest a chain price dump (CSV or JSON lines).')
+    parser.add_argument('chain', choices=sorted(CHAINS))
+    parser.add_argument('paths', nargs='+', help='.csv or .jsonl dumps, optionally gzipped')
+    parser.add_argument('--database', default=config.DATABASE_PATH)
+    parser.add_argument('--batch-size', type=int, default=config.INGEST_BATCH_SIZE)
+    parser.add_argument('--defer-indexes', action='store_true', help='drop StoreProducts indexes during the load')
+    args = parser.parse_args(argv)
+
+    logs.configure()
+    for path in args.paths:
+        stats = ingest_feed(chain_records(args.chain, path), args.database, args.batch_size, args.defer_indexes)
+        print(f"{path}: {stats['rows']} rows, {stats['written']} written, {stats['unchanged']} unchanged, "
+              f"{stats['skipped']} skipped, {stats['new_products']} new products, "
+              f"{stats['rows_per_sec']:.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 import overpy
 import sqlite3
-import math
+
+from app.calculator.distance import haversine_matrix, METERS_PER_MILE
 
 API = overpy.Overpass()
 
@@ -73,35 +74,32 @@ def get_stores_in_zip(zip_code):
     cur.execute("SELECT * FROM stores WHERE zip_code LIKE ?", (f"%{zip_code}%",))
     return cur.fetchall()
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 3959  # miles
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lon2 - lon1)
-    a = math.sin(d_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda/2)**2
-    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
-
 def find_stores_nearby(user_lat, user_lon, radius_miles=3):
     conn = sqlite3.connect("stores.db")
     cur = conn.cursor()
     cur.execute("SELECT name, chain, address, lat, lon FROM stores")
-    results = []
-
-    for row in cur.fetchall():
-        name, chain, address, lat, lon = row
-        distance = haversine(user_lat, user_lon, lat, lon)
-        if distance <= radius_miles:
-            results.append({
-                "name": name,
-                "chain": chain,
-                "address": address,
-                "lat": lat,
-                "lon": lon,
-                "distance_miles": round(distance, 2)
-            })
-
+    rows = cur.fetchall()
     conn.close()
-    return sorted(results, key=lambda x: x["distance_miles"])
+    if not rows:
+        return []
+
+    lats = [row[3] for row in rows]
+    lons = [row[4] for row in rows]
+    distances = haversine_matrix(user_lat, user_lon, lats, lons)[0] / METERS_PER_MILE
+    results = []
+    for idx in distances.argsort(kind="stable"):
+        if distances[idx] > radius_miles:
+            break
+        name, chain, address, lat, lon = rows[idx]
+        results.append({
+            "name": name,
+            "chain": chain,
+            "address": address,
+            "lat": lat,
+            "lon": lon,
+            "distance_miles": round(float(distances[idx]), 2)
+        })
+    return results
 
 if __name__ == "__main__":
     # load_osm_data()
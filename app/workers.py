@@ -0,0 +1,229 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future
+
+from app import config
+
+
+class SolverBusy(Exception):
+    pass
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+class SolverCrashed(Exception):
+    pass
+
+
+def _worker_main(conn):
+    # Runs in the worker process: numpy, PuLP and the solver modules are imported
+    # once here and stay loaded for every job the worker takes.
+    import app.planner  # noqa: F401
+    from app.logs import configure
+    configure()
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, arg = job
+        try:
+            conn.send((True, fn(arg)))
+        except Exception as e:
+            conn.send((False, f'{type(e).__name__}: {e}'))
+
+
+class _Worker:
+    """One persistent solver process and the pipe to it."""
+
+    def __init__(self, context):
+        self.context = context
+        self.process = None
+        self.conn = None
+
+    def ensure_started(self):
+        if self.process is None or not self.process.is_alive():
+            self.stop()
+            self.conn, child = self.context.Pipe()
+            self.process = self.context.Process(target=_worker_main, args=(child,), daemon=True)
+            self.process.start()
+            child.close()
+
+    def stop(self, graceful=False):
+        if self.process is None:
+            return
+        if graceful:
+            try:
+                self.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = self.conn = None
+
+
+class SolverPool:
+    """
+    Persistent solver processes fed from a bounded job queue.
+
+    submit() hands (fn, arg) to the next free worker and returns a Future; fn must
+    be a module-level function and arg plain picklable data. Jobs are refused with
+    SolverBusy once queue_depth jobs are already waiting, and a job running longer
+    than its time limit gets SolverTimeout while its worker is killed and respawned
+    so a runaway MILP cannot hold a slot. With workers=0 jobs run in the caller.
+    """
+
+    def __init__(self, workers=None, queue_depth=None, time_limit=None):
+        self.workers = config.SOLVER_WORKERS if workers is None else workers
+        self.queue_depth = config.SOLVER_QUEUE_DEPTH if queue_depth is None else queue_depth
+        self.time_limit = config.SOLVER_TIME_LIMIT if time_limit is None else time_limit
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context('spawn')
+        self._slots = []
+        self._closed = False
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def _start(self):
+        # called with the lock held, on the first submit
+        for _ in range(self.workers - len(self._slots)):
+            worker = _Worker(self._context)
+            thread = threading.Thread(target=self._serve, args=(worker,), daemon=True)
+            self._slots.append((worker, thread))
+            thread.start()
+
+    def submit(self, fn, arg, time_limit=None):
+        future = Future()
+        if self.workers <= 0:
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(fn(arg))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Solver pool is closed')
+            if self.waiting >= self.queue_depth + max(0, self.workers - self.running):
+                self.rejected += 1
+                raise SolverBusy(f'Solver queue is full ({self.waiting} jobs waiting)')
+            if len(self._slots) < self.workers:
+                self._start()
+            self.waiting += 1
+        self._jobs.put((future, fn, arg, time_limit or self.time_limit))
+        return future
+
+    def run(self, fn, arg, time_limit=None):
+        """submit() and wait for the result."""
+        return self.submit(fn, arg, time_limit).result()
+
+    def _serve(self, worker):
+        # spawn eagerly so the other workers are warm by the time jobs reach them
+        try:
+            worker.ensure_started()
+        except Exception:
+            # retried by the first job this worker takes
+            pass
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                worker.stop(graceful=True)
+                return
+            future, fn, arg, time_limit = job
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    self._execute(worker, future, fn, arg, time_limit)
+            except BaseException as e:
+                # whatever went wrong belongs to this job; the slot keeps serving
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+    def _execute(self, worker, future, fn, arg, time_limit):
+        try:
+            worker.ensure_started()
+            worker.conn.send((fn, arg))
+            if not worker.conn.poll(time_limit):
+                worker.stop()
+                with self._lock:
+                    self.timeouts += 1
+                    self.restarts += 1
+                future.set_exception(SolverTimeout(f'Solver did not finish within {time_limit}s'))
+                return
+            ok, value = worker.conn.recv()
+        except BaseException as e:
+            # the worker died, or the job or its result could not be pickled and
+            # the pipe may hold half a message: either way start the worker afresh
+            worker.stop()
+            with self._lock:
+                self.failed += 1
+                self.restarts += 1
+            if isinstance(e, (EOFError, OSError)):
+                e = SolverCrashed(f'Solver worker died: {e!r}')
+            future.set_exception(e)
+            return
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(RuntimeError(value))
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            slots, self._slots = self._slots, []
+        for _ in slots:
+            self._jobs.put(None)
+        for _, thread in slots:
+            thread.join(2)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue_depth,
+                'waiting': self.waiting,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'restarts': self.restarts
+            }
+
+
+_solver_pool = None
+_solver_pool_lock = threading.Lock()
+
+
+def get_solver_pool():
+    """Process-wide solver pool sized from config."""
+    global _solver_pool
+    if _solver_pool is None:
+        with _solver_pool_lock:
+            if _solver_pool is None:
+                _solver_pool = SolverPool()
+    return _solver_pool
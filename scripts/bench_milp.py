@@ -0,0 +1,76 @@
+"""
+Compare building the basket MILP with PuLP objects against the array-built
+model, on random catalogs of growing size.
+
+    python -m scripts.bench_milp [--solve] [--repeat 3]
+
+For each scale this reports the PuLP model build, the array build and the MPS
+write (the array path's equivalent of PuLP's writeMPS), and with --solve the
+end-to-end solve time of both back ends.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from app.calculator.milp import assignment_model, write_mps
+from app.calculator.optimizer import _milp_solve, _matrix_milp_solve, dense_offers, pulp_model
+
+SCALES = [(20, 10), (100, 30), (500, 50), (2000, 100)]  # (stores, items)
+MAX_STORES = 5
+
+
+def random_offers(n_stores, n_items, seed=0, density=0.6):
+    rng = np.random.default_rng(seed)
+    stores, items = np.nonzero(rng.random((n_stores, n_items)) < density)
+    prices = np.round(rng.uniform(1, 20, len(stores)), 2)
+    stock = rng.choice([0, 1, 2, 5, 10, 100], len(stores))
+    offers = list(zip((stores + 1).tolist(), (items + 1).tolist(), prices.tolist(), stock.tolist()))
+    requirements = {i: int(q) for i, q in zip(range(1, n_items + 1), rng.choice([1, 1, 2, 3], n_items))}
+    return offers, requirements
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--solve', action='store_true', help='also time a full solve with each back end')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    header = f"{'stores':>7} {'items':>6} {'offers':>7} {'pulp build':>11} {'pulp mps':>9} {'array build':>12} {'array mps':>10}"
+    if args.solve:
+        header += f" {'pulp solve':>11} {'array solve':>12}"
+    print(header)
+    for n_stores, n_items in SCALES:
+        offers, requirements = random_offers(n_stores, n_items)
+        item_list, store_list, prices, stock, required = dense_offers(offers, requirements)
+
+        pulp_build = best_of(args.repeat, lambda: pulp_model(offers, requirements, MAX_STORES))
+        prob = pulp_model(offers, requirements, MAX_STORES)[0]
+        pulp_write = best_of(args.repeat, lambda: prob.writeMPS('/tmp/bench_pulp.mps', rename=1))
+        array_build = best_of(args.repeat, lambda: assignment_model(prices, stock, required, MAX_STORES))
+        model = assignment_model(prices, stock, required, MAX_STORES)[0]
+        array_write = best_of(args.repeat, lambda: write_mps(model, '/tmp/bench_array.mps'))
+
+        line = (f"{n_stores:>7} {n_items:>6} {len(offers):>7} {pulp_build * 1000:>9.1f}ms {pulp_write * 1000:>7.1f}ms"
+                f" {array_build * 1000:>10.1f}ms {array_write * 1000:>8.1f}ms")
+        if args.solve:
+            with contextlib.redirect_stdout(io.StringIO()):
+                pulp_solve = best_of(1, lambda: _milp_solve(offers, requirements, MAX_STORES))
+                array_solve = best_of(1, lambda: _matrix_milp_solve(prices, stock, required, MAX_STORES, store_list, item_list))
+            line += f" {pulp_solve * 1000:>9.1f}ms {array_solve * 1000:>10.1f}ms"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Throughput of canonical item matching on a synthetic store catalog.
+
+    python -m scripts.bench_normalize [--names 1000000] [--distinct 200000] [--naive-sample 20000]
+
+Names are built from brand words, a canonical variant (or none) and a pack
+size, drawn from --distinct templates so repeats exercise the LRU. Reports
+names/s for the old nested substring scan (on a sample), the automaton without
+its cache, normalize_items over the whole catalog, and how often the two
+approaches agree.
+"""
+import argparse
+import random
+import time
+
+from app.items.items import CANONICAL_ITEMS, ItemMatcher
+
+BRANDS = ['Great Value', 'Organic Farms', 'Store Brand', 'Happy Cow', 'Golden Acre', 'Fresh Pick', 'Nature Best']
+SIZES = ['1 lb', '16 oz', '1 gal', '12 ct', '500 g', '2 L', 'family size', '']
+
+
+def naive_normalize(store_item_name, canonical_map):
+    # normalize_item before the matcher: first canonical with any variant in the name
+    name = store_item_name.lower()
+    for general, variants in canonical_map.items():
+        for keyword in variants:
+            if keyword in name:
+                return general
+    return None
+
+
+def synthetic_names(count, distinct, seed):
+    rng = random.Random(seed)
+    variants = [variant for variants in CANONICAL_ITEMS.values() for variant in variants]
+    templates = []
+    for _ in range(distinct):
+        variant = rng.choice(variants) if rng.random() < 0.8 else rng.choice(['paper towels', 'dish soap', 'batteries'])
+        words = [rng.choice(BRANDS), variant.title() if rng.random() < 0.5 else variant.upper(), rng.choice(SIZES)]
+        templates.append(' '.join(word for word in words if word))
+    return [rng.choice(templates) for _ in range(count)]
+
+
+def rate(count, seconds):
+    return f'{count / seconds:>12,.0f} names/s  ({seconds:.2f}s)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=1_000_000)
+    parser.add_argument('--distinct', type=int, default=200_000)
+    parser.add_argument('--naive-sample', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = synthetic_names(args.names, args.distinct, args.seed)
+    sample = names[:args.naive_sample]
+
+    start = time.perf_counter()
+    matcher = ItemMatcher(CANONICAL_ITEMS)
+    print(f"{'build':<22} {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    start = time.perf_counter()
+    naive = [naive_normalize(name, CANONICAL_ITEMS) for name in sample]
+    print(f"{'naive scan':<22} {rate(len(sample), time.perf_counter() - start)}")
+
+    start = time.perf_counter()
+    uncached = [matcher._match(name) for name in sample]
+    print(f"{'automaton, no cache':<22} {rate(len(sample), time.perf_counter() - start)}")
+
+    start = time.perf_counter()
+    matcher.match_many(names)
+    print(f"{'normalize_items':<22} {rate(len(names), time.perf_counter() - start)}")
+
+    agree = sum(a == b for a, b in zip(naive, uncached))
+    print(f'agreement with the naive scan: {agree / len(sample):.2%} (differences are longest-match wins)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark the /api/optimize pipeline and its stages on synthetic catalogs.
+
+    python -m scripts.benchmark [--scales small,medium,large] [--requests 200] [--output bench.json]
+
+Each scale's catalog is generated once with create_fake_data (cached in
+--data-dir by scale and seed) and benchmarked in a fresh interpreter pointed at
+it, so module-level state such as the catalog snapshot and the connection pool
+starts cold. Every stage is run on the same random baskets and reported as
+p50/p95/p99/mean milliseconds, along with process memory and the solver
+engines used. The JSON output is stable across runs so two commits can be
+diffed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# (stores, products, store-product offers)
+SCALES = {
+    'small': (20, 50, 300),
+    'medium': (200, 5000, 100000),
+    'large': (2000, 50000, 1000000),
+}
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        'count': len(ms),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+def rss_mb():
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def random_baskets(catalog, count, basket_size, seed):
+    rng = random.Random(seed)
+    offered = [int(pid) for pid, n in zip(catalog.product_ids, np.diff(catalog.offer_indptr)) if n]
+    lat_range = (float(catalog.store_lat.min()), float(catalog.store_lat.max()))
+    lon_range = (float(catalog.store_lon.min()), float(catalog.store_lon.max()))
+    baskets = []
+    for _ in range(count):
+        baskets.append({
+            'items': [{'product_id': pid, 'quantity': rng.randint(1, 3)} for pid in rng.sample(offered, min(basket_size, len(offered)))],
+            'lat': round(rng.uniform(*lat_range), 6),
+            'lon': round(rng.uniform(*lon_range), 6),
+        })
+    return baskets
+
+
+def run_scale(args):
+    """Runs in the child interpreter with BASKETROUTE_DATABASE pointing at the scale's catalog."""
+    from app.calculator.optimizer import optimize
+    from app.calculator.pathOptimize import optimize_path
+    from app.db import query
+    from app.db.catalog import get_catalog
+    from app.db.pool import get_pool
+    from app import planner
+
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    catalog = get_catalog()
+    load_seconds = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    from app.main import app
+    client = app.test_client()
+
+    baskets = random_baskets(catalog, args.requests, args.basket_size, args.seed)
+    stages = {name: [] for name in (
+        'nearby_snapshot', 'nearby_sql', 'matrix_snapshot', 'matrix_sql', 'optimize', 'optimize_path', 'pipeline'
+    )}
+    engines = {}
+
+    def timed(name, fn):
+        begin = time.perf_counter()
+        value = fn()
+        stages[name].append(time.perf_counter() - begin)
+        return value
+
+    with get_pool().connection() as conn:
+        for body in baskets:
+            basket = planner.parse_basket(body)
+            lat, lon = basket['start']
+            stores = timed('nearby_snapshot', lambda: catalog.stores_nearby(lat, lon, radius_km=basket['radius_km']))
+            timed('nearby_sql', lambda: query.get_stores_nearby(conn, f'{lat},{lon}', basket['radius_km']))
+            if not stores:
+                continue
+            store_ids = [store['id'] for store in stores]
+            items = catalog.get_products(list(basket['requirements']))
+            matrix = timed('matrix_snapshot', lambda: catalog.item_store_matrix([item['id'] for item in items], store_ids))
+            timed('matrix_sql', lambda: query.price_matrix(conn, [item['id'] for item in items], store_ids))
+            if not matrix:
+                continue
+            result = timed('optimize', lambda: optimize(matrix, basket['requirements'], basket['max_stores']))
+            engines[result['engine']] = engines.get(result['engine'], 0) + 1
+            chosen = list(dict.fromkeys(s for s, _, _ in result['plan']))
+            if chosen:
+                timed('optimize_path', lambda: optimize_path(
+                    catalog.get_stores(chosen), starting_point=(lat, lon),
+                    store_distances=catalog.store_distance_matrix(chosen)
+                ))
+
+    # the first request starts the solver workers
+    client.post('/api/optimize', json=baskets[0])
+    for body in baskets:
+        planner._assignment_cache.clear()
+        planner._route_cache.clear()
+        timed('pipeline', lambda: client.post('/api/optimize', json=body))
+
+    return {
+        'catalog': {
+            'stores': len(catalog.store_ids),
+            'products': len(catalog.product_ids),
+            'offers': len(catalog.offer_store),
+            'load_ms': round(load_seconds * 1000, 3),
+        },
+        'stages': {name: percentiles(samples) for name, samples in stages.items() if samples},
+        'engines': engines,
+        'memory': {'rss_start_mb': rss_start, 'rss_after_load_mb': rss_loaded, 'peak_rss_mb': rss_mb()},
+    }
+
+
+def build_catalog(name, seed, data_dir):
+    from app.db.init_db import create_fake_data
+
+    path = os.path.join(data_dir, f'{name}-{seed}.db')
+    if not os.path.exists(path):
+        num_stores, num_products, num_offers = SCALES[name]
+        print(f'generating {name} catalog: {num_stores} stores, {num_products} products, {num_offers} offers', file=sys.stderr)
+        create_fake_data(path + '.tmp', seed, num_stores, num_products, num_offers)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='small,medium', help=f"comma-separated, from {', '.join(SCALES)}")
+    parser.add_argument('--requests', type=int, default=200, help='baskets per scale')
+    parser.add_argument('--basket-size', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(os.environ.get('TMPDIR', '/tmp'), 'basketroute-bench'))
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--run-scale', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale:
+        # child: its stdout (and the solver workers') is discarded, results go to --output
+        result = run_scale(args)
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'settings': {'requests': args.requests, 'basket_size': args.basket_size, 'seed': args.seed},
+        'scales': {},
+    }
+    for name in args.scales.split(','):
+        path = build_catalog(name, args.seed, args.data_dir)
+        child_output = os.path.join(args.data_dir, f'{name}-{args.seed}.json')
+        subprocess.run(
+            [sys.executable, '-m', 'scripts.benchmark', '--run-scale', name, '--output', child_output,
+             '--requests', str(args.requests), '--basket-size', str(args.basket_size), '--seed', str(args.seed)],
+            env=dict(os.environ, BASKETROUTE_DATABASE=path), stdout=subprocess.DEVNULL, check=True
+        )
+        with open(child_output) as f:
+            report['scales'][name] = json.load(f)
+
+        stages = report['scales'][name]['stages']
+        print(f"{name}: " + ', '.join(f"{stage} p50 {s['p50_ms']}ms p99 {s['p99_ms']}ms" for stage, s in stages.items()))
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
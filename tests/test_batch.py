@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from app import main, planner, workers
+from app.batch import plan_batch
+from app.cache import ResultCache
+from app.db.catalog import CatalogSnapshot
+from app.workers import SolverPool
+
+STORES = [{'id': k, 'name': f'Store {k}', 'lat': 40.70 + k / 100, 'lon': -73.90,
+           'address': None, 'phone': None, 'website': None} for k in (1, 2, 3)]
+PRODUCTS = [{'id': k, 'name': f'Product {k}', 'category': 'Pantry', 'unit': 'each'} for k in (1, 2, 3)]
+OFFERS = [(1, 1, 2.0, 5), (2, 1, 1.5, 5), (2, 2, 3.0, 5), (3, 2, 2.5, 5), (3, 3, 4.0, 5)]
+
+
+@pytest.fixture
+def solves(monkeypatch):
+    """Runs the solver in the calling thread and records every basket it is given."""
+    monkeypatch.setattr(workers, '_solver_pool', SolverPool(workers=0))
+    for name in ('_assignment_cache', '_route_cache', '_plans'):
+        monkeypatch.setattr(planner, name, ResultCache(100, 60))
+    seen = []
+    solve = planner.solve_assignment
+
+    def counting_solve(problem):
+        seen.append(problem['requirements'])
+        return solve(problem)
+
+    monkeypatch.setattr(planner, 'solve_assignment', counting_solve)
+    return seen
+
+
+@pytest.fixture
+def catalog():
+    return CatalogSnapshot(('test',), STORES, PRODUCTS, OFFERS)
+
+
+def test_duplicate_baskets_are_solved_once(catalog, solves):
+    basket = {'items': [{'product_id': 1, 'quantity': 2}, {'product_id': 2, 'quantity': 1}]}
+    other = {'items': [{'product_id': 3, 'quantity': 1}]}
+    results = dict(plan_batch(catalog, [basket, other, dict(basket), basket]))
+    assert sorted(results) == [0, 1, 2, 3]
+    assert sorted(solves, key=len) == [{3: 1}, {1: 2, 2: 1}]
+    assert results[0]['cost'] == results[2]['cost'] == results[3]['cost'] == 2 * 1.5 + 2.5
+    assert results[1]['cost'] == 4.0
+
+    # a second batch is answered from the assignment cache
+    assert dict(plan_batch(catalog, [basket]))[0]['cost'] == results[0]['cost']
+    assert len(solves) == 2
+
+
+def test_invalid_basket_does_not_abort_the_batch(catalog, solves, monkeypatch):
+    bodies = [
+        {'items': [{'product_id': 1, 'quantity': 1}]},
+        {'items': [{'product_id': 1, 'quantity': 0}]},
+        'not a basket',
+        {'items': [{'product_id': 99, 'quantity': 1}]},
+        {'items': [{'product_id': 2, 'quantity': 1}]},
+    ]
+    results = dict(plan_batch(catalog, bodies))
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert set(results[1]) == set(results[2]) == set(results[3]) == {'error'}
+    assert results[0]['cost'] == 1.5 and results[4]['cost'] == 2.5
+
+    # over HTTP each failure is its own {'index', 'error'} line and the stream carries on
+    monkeypatch.setattr(main, 'get_catalog', lambda: catalog)
+    response = main.app.test_client().post('/api/optimize/batch', json={'baskets': bodies})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line['index'] for line in lines) == [0, 1, 2, 3, 4]
+    assert [line for line in lines if 'error' in line] == [
+        {'index': index, 'error': results[index]['error']} for index in (1, 2, 3)
+    ]
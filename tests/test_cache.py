@@ -0,0 +1,21 @@
+from app.cache import ResultCache
+
+
+def test_newer_generation_replaces_entries():
+    cache = ResultCache(10, 60)
+    cache.put('a', 1, 1)
+    assert cache.get('a', 2) is None
+    cache.put('b', 2, 2)
+    assert cache.get('b', 2) == 2
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_older_generation_is_ignored():
+    cache = ResultCache(10, 60)
+    cache.put('a', 1, 2)
+    # a batch still holding the previous snapshot neither reads nor clears the newer entries
+    assert cache.get('a', 1) is None
+    cache.put('b', 2, 1)
+    assert cache.get('a', 2) == 1
+    assert cache.get('b', 2) is None
+    assert cache.stats()['stale'] == 2
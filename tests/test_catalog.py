@@ -0,0 +1,31 @@
+import sqlite3
+
+from app.db.catalog import catalog_version
+from app.db.init_db import migrate, stores_version
+
+
+def test_fingerprint_changes_on_every_write():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.execute("INSERT INTO Stores (name, lat, lon) VALUES ('A', 40.7, -74.0)")
+    conn.execute("INSERT INTO Products (name) VALUES ('Milk')")
+    conn.execute("INSERT INTO StoreProducts (store_id, product_id, price, inventory) VALUES (1, 1, 2.5, 3)")
+    conn.commit()
+    seen = {catalog_version(conn)}
+    stores = {stores_version(conn)}
+    # two edits within the same second, and one that writes an older timestamp
+    for sql in ('UPDATE StoreProducts SET price = 2.4',
+                'UPDATE StoreProducts SET price = 2.3',
+                "UPDATE StoreProducts SET price = 2.2, last_updated = '2000-01-01 00:00:00'",
+                "UPDATE Products SET name = 'Whole Milk'",
+                'DELETE FROM StoreProducts'):
+        conn.execute(sql)
+        conn.commit()
+        assert catalog_version(conn) not in seen, sql
+        seen.add(catalog_version(conn))
+    assert stores_version(conn) in stores
+
+    conn.execute('UPDATE Stores SET lon = -74.01')
+    conn.execute('UPDATE Stores SET lon = -74.02')
+    conn.commit()
+    assert stores_version(conn) not in stores
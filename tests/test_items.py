@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from app.items.items import CANONICAL_ITEMS, ItemMatcher, normalize_item, normalize_items
+
+
+def naive_match(name, canonical_map):
+    """Scan every variant: the longest one contained in name wins, then the one listed first."""
+    best = None
+    for general, variants in canonical_map.items():
+        for keyword in variants:
+            if keyword.lower() in name.lower() and (best is None or len(keyword) > len(best[0])):
+                best = (keyword, general)
+    return best[1] if best else None
+
+
+def test_overlapping_variants():
+    matcher = ItemMatcher(CANONICAL_ITEMS)
+    assert matcher.match('Shredded Mozzarella 8oz') == 'mozzarella cheese'
+    # 'ground pepper' is listed first but 'ground pepperoni' is longer
+    assert matcher.match('Hormel Ground Pepperoni') == 'pepperoni'
+    assert naive_match('Hormel Ground Pepperoni', CANONICAL_ITEMS) == 'pepperoni'
+    assert matcher.match('Extra Virgin Olive Oil') == 'olive oil'
+    assert matcher.match('Paper Towels') is None
+
+
+def test_output_through_fail_links():
+    # 'abcx' walks the 'abcd' branch; 'bc' is only reached through the fail link of 'abc'
+    canonical = {'long': ['abcd'], 'short': ['bc'], 'tail': ['cx']}
+    matcher = ItemMatcher(canonical)
+    assert matcher.match('abcd') == 'long'
+    assert matcher.match('zabc') == 'short'
+    assert matcher.match('abcx') == 'short'
+    assert matcher.match('abx') is None
+    # equal lengths go to the variant listed first, wherever it occurs
+    assert ItemMatcher({'first': ['cd'], 'second': ['ab']}).match('abcd') == 'first'
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_naive_scan(seed):
+    rng = random.Random(seed)
+    # short variants over a small alphabet overlap a lot, as prefixes, suffixes and inside each other
+    canonical = {f'item {k}': [''.join(rng.choice('abc') for _ in range(rng.randint(1, 5)))
+                               for _ in range(rng.randint(1, 3))]
+                 for k in range(12)}
+    matcher = ItemMatcher(canonical)
+    names = [''.join(rng.choice('abcd') for _ in range(rng.randint(0, 12))) for _ in range(500)]
+    assert [matcher.match(name) for name in names] == [naive_match(name, canonical) for name in names]
+
+
+def test_matches_naive_scan_on_catalog_names():
+    rng = random.Random(0)
+    variants = [v for vs in CANONICAL_ITEMS.values() for v in vs]
+    names = [' '.join(rng.sample(variants, rng.randint(1, 3))).upper() for _ in range(500)]
+    assert normalize_items(names) == [naive_match(name, CANONICAL_ITEMS) for name in names]
+    assert all(normalize_item(name) == naive_match(name, CANONICAL_ITEMS) for name in names[:50])
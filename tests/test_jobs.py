@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from app.jobs import JobQueueFull, JobStore
+from app.planner import PlanError
+
+
+def wait_for(job, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.to_dict()['status'] != status:
+        assert time.monotonic() < deadline, job.to_dict()
+        time.sleep(0.01)
+    return job.to_dict()
+
+
+def test_queue_full_is_rejected():
+    store = JobStore(workers=1, max_pending=2)
+    release = threading.Event()
+    jobs = [store.submit(lambda job: release.wait(5)) for _ in range(2)]
+    # one job running and one queued fill the store
+    with pytest.raises(JobQueueFull):
+        store.submit(lambda job: None)
+    assert store.stats()['pending'] == 2
+    release.set()
+    for job in jobs:
+        wait_for(job, 'done')
+    # a slot frees up once the job has finished
+    wait_for(store.submit(lambda job: 'next'), 'done')
+
+
+def test_priced_then_done():
+    store = JobStore(workers=1, max_pending=1)
+    priced, release = threading.Event(), threading.Event()
+
+    def plan(job):
+        job.set_partial({'cost': 4.5})
+        priced.set()
+        release.wait(5)
+        return {'cost': 4.5, 'plan': []}
+
+    job = store.submit(plan)
+    assert priced.wait(5)
+    assert job.to_dict() == {'id': job.id, 'status': 'priced', 'partial': {'cost': 4.5}}
+    release.set()
+    # the finished job carries the result, not the partial
+    assert wait_for(job, 'done') == {'id': job.id, 'status': 'done', 'result': {'cost': 4.5, 'plan': []}}
+
+
+def test_failures_carry_their_status():
+    store = JobStore(workers=1, max_pending=2)
+
+    def unknown(job):
+        raise PlanError('Unknown or expired plan_id', 404)
+
+    assert wait_for(store.submit(unknown), 'failed')['error_status'] == 404
+    failed = wait_for(store.submit(lambda job: 1 / 0), 'failed')
+    assert (failed['error'], failed['error_status']) == ('Optimization failed: ZeroDivisionError', 500)
+
+
+def test_finished_jobs_expire():
+    store = JobStore(workers=1, max_pending=2, ttl_seconds=60)
+    old, recent = store.submit(lambda job: 1), store.submit(lambda job: 2)
+    wait_for(old, 'done')
+    wait_for(recent, 'done')
+    old.finished -= 61
+    assert store.get(old.id) is None
+    assert store.get(recent.id) is recent
+    assert store.stats()['jobs'] == 1
@@ -0,0 +1,116 @@
+import itertools
+import math
+import random
+
+import numpy as np
+import pytest
+
+from app import config
+from app.calculator.joint import joint_solve
+from app.calculator.optimizer import dense_offers, fill_cheapest
+from app.calculator.routing import held_karp
+
+
+def random_instance(seed, n_stores=6, n_items=5):
+    """Offers, requirements and meter distances for stores scattered around the start at (0, 0)."""
+    rng = random.Random(seed)
+    store_ids = list(range(10, 10 + n_stores))
+    rows = [(s, i, round(rng.uniform(1, 9), 2), rng.randint(0, 3))
+            for s in store_ids for i in range(1, n_items + 1) if rng.random() < 0.6]
+    stock = {}
+    for _, i, _, inv in rows:
+        stock[i] = stock.get(i, 0) + inv
+    requirements = {i: rng.randint(1, min(total, 2)) for i, total in stock.items() if total > 0}
+    points = [(rng.uniform(-3000, 3000), rng.uniform(-3000, 3000)) for _ in store_ids]
+    from_start = [math.hypot(*p) for p in points]
+    between = [[math.dist(a, b) for b in points] for a in points]
+    return rows, requirements, store_ids, from_start, between
+
+
+def brute_force(rows, requirements, max_stores, store_ids, from_start, between, distance_weight):
+    """Best purchase cost + weight × route over every store subset, or None when none covers the basket."""
+    items, stores, prices, stock, required = dense_offers(rows, requirements)
+    if not items:
+        return 0.0
+    position = {sid: k for k, sid in enumerate(store_ids)}
+    best = None
+    for size in range(1, max_stores + 1):
+        for subset in itertools.combinations(range(len(stores)), size):
+            short, cost, _ = fill_cheapest(prices[:, subset], stock[:, subset], required)
+            if short > 0:
+                continue
+            nodes = [position[stores[k]] for k in subset]
+            matrix = [[0.0] + [from_start[n] for n in nodes]] + \
+                     [[from_start[a]] + [between[a][b] for b in nodes] for a in nodes]
+            objective = float(cost) + distance_weight / 1000 * held_karp(matrix)[1]
+            best = objective if best is None else min(best, objective)
+    return best
+
+
+def check_result(result, rows, requirements, max_stores, store_ids, from_start, between, weight):
+    offers = {(s, i): (p, inv) for s, i, p, inv in rows}
+    bought = {}
+    cost = 0.0
+    for s, i, qty in result["plan"]:
+        price, inv = offers[s, i]
+        assert 0 < qty <= inv
+        bought[i] = bought.get(i, 0) + qty
+        cost += price * qty
+    assert all(bought.get(i, 0) >= qty for i, qty in requirements.items())
+    assert result["total_cost"] == pytest.approx(cost)
+    # the route visits exactly the stores bought from, and its length is as reported
+    assert sorted(result["route"]) == sorted({s for s, _, _ in result["plan"]})
+    assert len(result["route"]) <= max_stores
+    position = {sid: k for k, sid in enumerate(store_ids)}
+    path = [position[s] for s in result["route"]]
+    length = sum(between[a][b] for a, b in zip(path, path[1:])) + (from_start[path[0]] if path else 0.0)
+    assert result["distance"] == pytest.approx(length)
+    assert result["objective"] == pytest.approx(cost + weight / 1000 * length)
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("weight", [0.5, 5.0])
+def test_matches_brute_force(seed, weight):
+    rows, requirements, store_ids, from_start, between = random_instance(seed)
+    max_stores = 1 + seed % 4
+    expected = brute_force(rows, requirements, max_stores, store_ids, from_start, between, weight)
+    result = joint_solve(rows, requirements, max_stores, store_ids, from_start, between, distance_weight=weight)
+    if expected is None:
+        assert result["status"] == "Infeasible" and result["plan"] == []
+        return
+    assert result["status"] == "Optimal" and result["gap"] == 0.0
+    check_result(result, rows, requirements, max_stores, store_ids, from_start, between, weight)
+    assert result["objective"] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("limit", ["JOINT_NODE_LIMIT", "JOINT_MAX_CANDIDATES"])
+def test_truncated_search_gap_bounds_the_optimum(seed, limit, monkeypatch):
+    monkeypatch.setattr(config, limit, 2)
+    rows, requirements, store_ids, from_start, between = random_instance(seed, n_stores=7)
+    expected = brute_force(rows, requirements, 3, store_ids, from_start, between, 5.0)
+    result = joint_solve(rows, requirements, 3, store_ids, from_start, between, distance_weight=5.0)
+    if expected is None:
+        assert result["status"] == "Infeasible"
+        return
+    check_result(result, rows, requirements, 3, store_ids, from_start, between, 5.0)
+    # a truncated search is never reported as proven, and its gap covers the distance to the optimum
+    assert result["status"] == "Feasible"
+    assert 0.0 <= result["gap"] < 1.0
+    assert result["objective"] >= expected - 1e-6
+    assert expected >= result["objective"] * (1 - result["gap"]) - 1e-6
+
+
+def test_infeasible_baskets():
+    store_ids = [1, 2]
+    from_start, between = [100.0, 200.0], np.array([[0.0, 150.0], [150.0, 0.0]])
+    rows = [(1, 1, 2.0, 1), (2, 1, 3.0, 1), (2, 2, 1.0, 1)]
+    # not enough stock anywhere
+    assert joint_solve(rows, {1: 3}, 2, store_ids, from_start, between)["status"] == "Infeasible"
+    # enough stock, but only across more stores than allowed
+    assert joint_solve(rows, {1: 2}, 1, store_ids, from_start, between)["status"] == "Infeasible"
+    assert joint_solve(rows, {1: 1}, 0, store_ids, from_start, between)["status"] == "Infeasible"
+    # an item nobody stocks
+    assert joint_solve(rows, {3: 1}, 2, store_ids, from_start, between)["status"] == "Infeasible"
+    empty = joint_solve(rows, {}, 2, store_ids, from_start, between)
+    assert (empty["status"], empty["plan"], empty["route"]) == ("Optimal", [], [])
@@ -0,0 +1,102 @@
+import json
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from app.db import pool as pool_module
+from app.db.init_db import migrate
+from app.db.pool import ConnectionPool
+from app.main import app
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'catalog.db')
+    with closing(sqlite3.connect(path)) as conn:
+        migrate(conn)
+        conn.executemany('INSERT INTO Products (name, category, unit) VALUES (?, ?, ?)',
+                         [(f'Product {k}', f'Category {k % 3}', 'each') for k in range(10)])
+        conn.executemany('INSERT INTO Stores (name, lat, lon) VALUES (?, ?, ?)',
+                         [(f'Store {k}', 40.7, -73.9) for k in range(3)])
+        conn.executemany('INSERT INTO StoreProducts (store_id, product_id, price, inventory) VALUES (?, ?, ?, ?)',
+                         [(store, product, 1.0 + product, 5) for store in (1, 2, 3) for product in range(1, 11, 2)])
+        conn.commit()
+    pool = ConnectionPool(path, size=2, wal=True)
+    monkeypatch.setattr(pool_module, '_pool', pool)
+    yield path
+    pool.close()
+
+
+@pytest.fixture
+def client(db_path):
+    return app.test_client()
+
+
+def write(db_path, sql, params=()):
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute(sql, params)
+        conn.commit()
+
+
+def test_cursor_round_trip(client):
+    for path, key in (('/api/products', 'id'), ('/api/store_inventories', 'product_id')):
+        everything = client.get(path + '?format=ndjson').get_data(as_text=True).splitlines()
+        items, cursor = [], None
+        while True:
+            response = client.get(path, query_string={'limit': 4, **({'cursor': cursor} if cursor else {})})
+            assert response.status_code == 200
+            page = response.get_json()
+            items += page['items']
+            cursor = page['next_cursor']
+            if cursor is None:
+                assert 'Link' not in response.headers
+                break
+            assert response.headers['X-Next-Cursor'] == cursor
+        assert items == [json.loads(line) for line in everything]
+        assert len({(item.get('store_id'), item[key]) for item in items}) == len(items)
+
+
+def test_invalid_cursor(client):
+    assert client.get('/api/products?limit=2&cursor=bm90IGEga2V5').status_code == 400
+    assert client.get('/api/products?limit=2&cursor=%%%').status_code == 400
+    assert client.get('/api/products?limit=0').status_code == 400
+
+
+def test_fields(client):
+    page = client.get('/api/products?limit=3&fields=name,id').get_json()
+    assert page['items'] == [{'name': f'Product {k}', 'id': k + 1} for k in range(3)]
+    grouped = client.get('/api/products_by_category?fields=name').get_json()
+    assert sorted(grouped) == ['Category 0', 'Category 1', 'Category 2']
+    assert grouped['Category 1'] == [{'name': 'Product 1'}, {'name': 'Product 4'}, {'name': 'Product 7'}]
+    response = client.get('/api/products?fields=name,price')
+    assert response.status_code == 400
+    assert 'fields must be from' in response.get_json()['error']
+
+
+def test_if_none_match(client, db_path):
+    first = client.get('/api/products?limit=5')
+    etag = first.headers['ETag']
+    assert client.get('/api/products?limit=5', headers={'If-None-Match': etag}).status_code == 304
+    # validators are per representation
+    other = client.get('/api/products?limit=6', headers={'If-None-Match': etag})
+    assert other.status_code == 200 and other.headers['ETag'] != etag
+
+    # a write is seen by the next request, without waiting for a catalog snapshot refresh
+    write(db_path, "INSERT INTO Products (name, category, unit) VALUES ('Product 10', 'Category 1', 'each')")
+    changed = client.get('/api/products?limit=5', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    write(db_path, "UPDATE StoreProducts SET price = 9.5, last_updated = '2999-01-01 00:00:00' WHERE product_id = 1")
+    # products do not depend on StoreProducts; inventories do
+    assert client.get('/api/products?limit=5', headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
+    inventories = client.get('/api/store_inventories?limit=5')
+    write(db_path, "UPDATE StoreProducts SET price = 8.5, last_updated = '2999-01-02 00:00:00' WHERE product_id = 1")
+    assert client.get('/api/store_inventories?limit=5',
+                      headers={'If-None-Match': inventories.headers['ETag']}).status_code == 200
+
+
+def test_connection_released_without_transaction(client):
+    client.get('/api/products')
+    client.get('/api/products?limit=2', headers={'If-None-Match': '*'})
+    with pool_module.get_pool().connection() as conn:
+        assert not conn.in_transaction
@@ -0,0 +1,68 @@
+import logging
+
+import pytest
+
+from app import config, logs
+from app.logs import begin_request, bound, current, end_request, get_logger, payload
+
+
+@pytest.fixture
+def records():
+    """Records emitted by an INFO-level logger, as (level, message)."""
+    captured = []
+    handler = logging.Handler()
+    handler.emit = lambda record: captured.append((record.levelname, record.getMessage()))
+    base = logging.getLogger('tests.logs')
+    base.setLevel(logging.INFO)
+    base.addHandler(handler)
+    yield captured
+    base.removeHandler(handler)
+
+
+def dump_of(request_id):
+    token = begin_request(request_id)
+    try:
+        return current()[1]
+    finally:
+        end_request(token)
+
+
+def test_sampling_decision(monkeypatch):
+    monkeypatch.setattr(config, 'LOG_DEBUG_REQUEST_IDS', frozenset({'wanted'}))
+    monkeypatch.setattr(config, 'LOG_SAMPLE_RATE', 0.25)
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.2)
+    assert dump_of('other') == 'sampled'
+    # listed requests are dumped in full whatever the draw
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.9)
+    assert dump_of('other') is None
+    assert dump_of('wanted') == 'full'
+    monkeypatch.setattr(config, 'LOG_SAMPLE_RATE', 0.0)
+    monkeypatch.setattr(logs.random, 'random', lambda: 0.0)
+    assert dump_of('other') is None
+    assert current() is None
+
+
+def test_sampled_requests_log_debug(records):
+    logger = get_logger('tests.logs')
+    logger.debug('outside')
+    with bound(('r1', None)):
+        logger.debug('ordinary')
+        logger.info('kept')
+    with bound(('r2', 'sampled')):
+        assert logger.isEnabledFor(logging.DEBUG)
+        logger.debug('sampled')
+    assert records == [('INFO', 'kept'), ('DEBUG', 'sampled')]
+
+
+def test_payload_cap(monkeypatch, records):
+    monkeypatch.setattr(config, 'LOG_PAYLOAD_LIMIT', 10)
+    value = list(range(20))
+    text = repr(value)
+    assert str(payload([1, 2])) == '[1, 2]'
+    assert str(payload(value)) == f'{text[:10]}... (20 entries, {len(text)} chars)'
+    assert str(payload(12345678901234)) == '1234567890... (14 chars)'
+    with bound(('r1', 'sampled')):
+        get_logger('tests.logs').debug('offers: %s', payload(value))
+        with bound(('r2', 'full')):
+            assert str(payload(value)) == text
+    assert records == [('DEBUG', f'offers: {text[:10]}... (20 entries, {len(text)} chars)')]
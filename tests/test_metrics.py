@@ -0,0 +1,52 @@
+from app import metrics
+from app.metrics import Histogram, render_gauges
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('stage_seconds', 'Stage time.', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, 'solve')
+    histogram.observe(0.25, 'db "fetch"')
+    assert histogram.render() == [
+        '# HELP stage_seconds Stage time.',
+        '# TYPE stage_seconds histogram',
+        'stage_seconds_bucket{stage="db \\"fetch\\"",le="0.1"} 0',
+        'stage_seconds_bucket{stage="db \\"fetch\\"",le="1.0"} 1',
+        'stage_seconds_bucket{stage="db \\"fetch\\"",le="+Inf"} 1',
+        'stage_seconds_sum{stage="db \\"fetch\\""} 0.25',
+        'stage_seconds_count{stage="db \\"fetch\\""} 1',
+        # a value on a bound falls in that bucket (le is inclusive)
+        'stage_seconds_bucket{stage="solve",le="0.1"} 2',
+        'stage_seconds_bucket{stage="solve",le="1.0"} 3',
+        'stage_seconds_bucket{stage="solve",le="+Inf"} 4',
+        'stage_seconds_sum{stage="solve"} 2.65',
+        'stage_seconds_count{stage="solve"} 4',
+    ]
+
+
+def test_unlabelled_series():
+    histogram = Histogram('wait_seconds', 'Wait time.', buckets=(1.0,))
+    assert histogram.render() == ['# HELP wait_seconds Wait time.', '# TYPE wait_seconds histogram']
+    histogram.observe(3.0)
+    assert histogram.render()[2:] == [
+        'wait_seconds_bucket{le="1.0"} 0',
+        'wait_seconds_bucket{le="+Inf"} 1',
+        'wait_seconds_sum 3.0',
+        'wait_seconds_count 1',
+    ]
+
+
+def test_gauges():
+    assert render_gauges('jobs', 'Jobs.', 'gauge', [({'state': 'waiting'}, 2), ({}, 5)]) == [
+        '# HELP jobs Jobs.', '# TYPE jobs gauge', 'jobs{state="waiting"} 2', 'jobs 5'
+    ]
+
+
+def test_collected_spans_skip_the_histogram(monkeypatch):
+    histogram = Histogram('stage_seconds', 'Stage time.', ('stage',))
+    monkeypatch.setattr(metrics, 'STAGE_SECONDS', histogram)
+    with metrics.collect() as spans:
+        metrics.record('solve', 0.5)
+    assert spans == [('solve', 0.5)] and len(histogram.render()) == 2
+    metrics.record('solve', 0.5)
+    assert histogram.render()[-1] == 'stage_seconds_count{stage="solve"} 1'
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from app.db import init_db
+from app.db.init_db import MIGRATIONS, migrate
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def test_migrate_is_idempotent():
+    conn = sqlite3.connect(':memory:')
+    assert migrate(conn) == len(MIGRATIONS)
+    assert migrate(conn) == len(MIGRATIONS)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+
+
+def test_failed_migration_is_rolled_back(monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+
+    def half_applied(conn):
+        conn.execute('ALTER TABLE Stores ADD COLUMN region TEXT')
+        raise RuntimeError('interrupted')
+
+    monkeypatch.setattr(init_db, 'MIGRATIONS', MIGRATIONS + [half_applied])
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+    assert 'region' not in columns(conn, 'Stores')
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+
+    # the same migration applies cleanly once it no longer fails
+    monkeypatch.setattr(init_db, 'MIGRATIONS', MIGRATIONS + [lambda conn: conn.execute('ALTER TABLE Stores ADD COLUMN region TEXT')])
+    assert migrate(conn) == len(MIGRATIONS) + 1
+    assert 'region' in columns(conn, 'Stores')
+
+
+def test_moving_a_store_rebuilds_distances():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.executemany('INSERT INTO Stores (name, lat, lon) VALUES (?, ?, ?)',
+                     [('A', 40.70, -74.00), ('B', 40.71, -74.00), ('C', 40.72, -74.00)])
+    # stamps from an earlier second, so the move below is seen whenever the test runs
+    conn.execute("UPDATE Stores SET last_updated = '2000-01-01 00:00:00'")
+    conn.commit()
+    assert init_db.refresh_store_distances(conn)
+    assert not init_db.refresh_store_distances(conn)
+    before = conn.execute('SELECT meters FROM StoreDistances WHERE store_a = 1 AND store_b = 2').fetchone()[0]
+
+    with conn:
+        conn.execute('UPDATE Stores SET lat = 40.80 WHERE id = 2')
+    assert init_db.refresh_store_distances(conn)
+    after = conn.execute('SELECT meters FROM StoreDistances WHERE store_a = 1 AND store_b = 2').fetchone()[0]
+    assert after == pytest.approx(before * 10, rel=0.01)
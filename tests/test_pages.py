@@ -0,0 +1,77 @@
+import gzip
+import time
+
+import pytest
+
+from app import main, pages
+from app.db.catalog import CatalogSnapshot
+from app.pages import PageCache
+
+
+def snapshot(version, product_names):
+    stores = [{'id': 1, 'name': 'Store 1', 'lat': 40.7, 'lon': -73.9, 'address': None, 'phone': None, 'website': None}]
+    products = [{'id': k, 'name': name, 'category': 'Pantry', 'unit': 'each'} for k, name in enumerate(product_names, 1)]
+    return CatalogSnapshot(version, stores, products, [])
+
+
+@pytest.fixture
+def catalogs(monkeypatch):
+    """The snapshot the page cache sees is catalogs[-1]."""
+    catalogs = [snapshot(('v1',), ['Sourdough'])]
+    monkeypatch.setattr(pages, 'get_catalog', lambda: catalogs[-1])
+    return catalogs
+
+
+@pytest.fixture
+def page_cache(catalogs, monkeypatch):
+    cache = PageCache(main.app, interval=0.01)
+    monkeypatch.setattr(main, 'index_page', cache)
+    yield cache
+    cache.close()
+
+
+def test_version_change_rerenders(catalogs, page_cache):
+    first = page_cache.get()
+    assert first.version == ('v1',)
+    assert page_cache.get() is first
+
+    catalogs.append(snapshot(('v2',), ['Sourdough', 'Rye']))
+    deadline = time.monotonic() + 5
+    while page_cache.get() is first:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert page_cache.get().version == ('v2',)
+
+
+def test_compressed_variants_match_identity(page_cache):
+    client = main.app.test_client()
+    identity = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in identity.headers
+    body = identity.get_data()
+    assert body == page_cache.get().bodies['identity'] and body.startswith(b'<!DOCTYPE html>')
+
+    gzipped = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.get_data()) == body
+    # one ETag per page, whichever encoding was sent
+    assert gzipped.headers['ETag'] == identity.headers['ETag']
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+    assert client.get('/', headers={'If-None-Match': identity.headers['ETag']}).status_code == 304
+
+
+def test_brotli_variant_matches_identity(page_cache):
+    brotli = pytest.importorskip('brotli')
+    page = page_cache.get()
+    assert brotli.decompress(page.bodies['br']) == page.bodies['identity']
+    response = main.app.test_client().get('/', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.get_data()) == page.bodies['identity']
+
+
+def test_without_brotli_br_clients_get_gzip(page_cache, monkeypatch):
+    monkeypatch.setattr(pages, 'brotli', None)
+    page = page_cache.get()
+    assert 'br' not in page.bodies
+    response = main.app.test_client().get('/', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == page.bodies['identity']
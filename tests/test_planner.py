@@ -0,0 +1,108 @@
+import pytest
+
+from app import main, planner, workers
+from app.cache import ResultCache
+from app.db.catalog import CatalogSnapshot
+from app.planner import PlanError, parse_basket, plan_basket, replan
+from app.workers import SolverPool
+
+STORES = [{'id': k, 'name': f'Store {k}', 'lat': 40.70 + k / 100, 'lon': -73.90,
+           'address': None, 'phone': None, 'website': None} for k in (1, 2, 3)]
+PRODUCTS = [{'id': k, 'name': f'Product {k}', 'category': 'Pantry', 'unit': 'each'} for k in (1, 2, 3)]
+# each product is cheapest at its own store, and store 3 stocks everything (rows by product, as loaded)
+OFFERS = [(1, 1, 1.0, 5), (3, 1, 2.0, 5), (2, 2, 1.0, 5), (3, 2, 2.0, 5), (3, 3, 1.0, 5)]
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    """A small snapshot with empty planner caches and the solver run in the calling thread."""
+    monkeypatch.setattr(workers, '_solver_pool', SolverPool(workers=0))
+    for name in ('_assignment_cache', '_route_cache', '_plans'):
+        monkeypatch.setattr(planner, name, ResultCache(100, 60))
+    return CatalogSnapshot(('test',), STORES, PRODUCTS, OFFERS)
+
+
+@pytest.fixture
+def solves(monkeypatch):
+    """The problems handed to the solver."""
+    seen = []
+    solve = planner.solve_assignment
+
+    def recording_solve(problem):
+        seen.append(problem)
+        return solve(problem)
+
+    monkeypatch.setattr(planner, 'solve_assignment', recording_solve)
+    return seen
+
+
+def items_bought(plan):
+    return sorted(item['item'] for stop in plan['plan'] for item in stop['items'])
+
+
+def test_parse_basket_merges_items():
+    basket = parse_basket({'items': [{'product_id': '3', 'quantity': 2}, {'product_id': 3, 'quantity': '1'}],
+                           'max_stores': 9, 'location': '40.7,-73.9'})
+    assert basket['requirements'] == {3: 3}
+    assert basket['max_stores'] == 5
+    assert basket['start'] == (40.7, -73.9)
+    assert basket['mode'] == 'cost'
+
+
+@pytest.mark.parametrize('body', [
+    [],
+    {'items': [{'product_id': 1}]},
+    {'items': [{'product_id': 'x', 'quantity': 1}]},
+    {'items': [{'product_id': 1, 'quantity': 0}]},
+    {'items': [{'product_id': 1, 'quantity': -2}]},
+    {'items': [{'product_id': 1, 'quantity': 3}, {'product_id': 2, 'quantity': -1}]},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'max_stores': 'two'},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'lat': 40.7},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'lat': 91, 'lon': 0},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'location': 'downtown'},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'radius_km': 0},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'mode': 'fastest'},
+    {'items': [{'product_id': 1, 'quantity': 1}], 'mode': 'joint', 'distance_weight': -1},
+])
+def test_invalid_baskets(body):
+    with pytest.raises(PlanError) as error:
+        parse_basket(body)
+    assert error.value.status == 400
+
+
+def test_replan_reuses_the_previous_assignment(catalog, solves, monkeypatch):
+    first = plan_basket(catalog, parse_basket({'items': [{'product_id': k, 'quantity': 1} for k in (1, 2, 3)]}))
+    assert first['cost'] == 3.0 and len(first['plan']) == 3
+
+    # only the cap changes: the previous offers are reused, nothing is read from the catalog
+    lookups = []
+    monkeypatch.setattr(catalog, 'item_store_matrix', lambda *args: lookups.append(args))
+    edited = replan(catalog, {'plan_id': first['plan_id'], 'max_stores': 1})
+    assert lookups == []
+    assert [stop['store'] for stop in edited['plan']] == ['Store 3'] and edited['cost'] == 5.0
+    assert solves[-1]['matrix'] is not solves[0]['matrix']
+    assert sorted(solves[-1]['warm_stores']) == [1, 2, 3]
+
+    # the same edit again is answered from the assignment cache
+    assert replan(catalog, {'plan_id': first['plan_id'], 'max_stores': 1})['cost'] == 5.0
+    assert len(solves) == 2
+
+
+def test_replan_quantity_zero_removes_the_item(catalog, solves):
+    first = plan_basket(catalog, parse_basket({'items': [{'product_id': k, 'quantity': 2} for k in (1, 2, 3)]}))
+    edited = replan(catalog, {'plan_id': first['plan_id'], 'items': [{'product_id': 2, 'quantity': 0},
+                                                                    {'product_id': 1, 'quantity': 1}]})
+    assert solves[-1]['requirements'] == {1: 1, 3: 2}
+    assert items_bought(edited) == ['Product 1', 'Product 3']
+    assert edited['cost'] == 1.0 + 2 * 1.0
+    # the edited plan can itself be edited
+    assert replan(catalog, {'plan_id': edited['plan_id'], 'items': [{'product_id': 3, 'quantity': 0}]})['cost'] == 1.0
+
+
+def test_replan_unknown_plan_id(catalog, monkeypatch):
+    with pytest.raises(PlanError) as error:
+        replan(catalog, {'plan_id': 'not-a-plan', 'max_stores': 2})
+    assert error.value.status == 404
+    monkeypatch.setattr(main, 'get_catalog', lambda: catalog)
+    response = main.app.test_client().post('/api/optimize/edit', json={'plan_id': 'not-a-plan'})
+    assert response.status_code == 404
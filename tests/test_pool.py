@@ -0,0 +1,79 @@
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+
+from app.db.pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute('CREATE TABLE Stores (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.execute("INSERT INTO Stores (name) VALUES ('Store 1')")
+        conn.commit()
+    return path
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.1, wal=True)
+    yield pool
+    pool.close()
+
+
+def write(db_path, sql):
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute(sql)
+        conn.commit()
+
+
+def test_release_rolls_back_and_reuses(pool, db_path):
+    with pool.connection() as conn:
+        conn.execute('BEGIN')
+        assert conn.execute('SELECT COUNT(*) FROM Stores').fetchone() == (1,)
+        first = conn
+    assert not first.in_transaction
+
+    # the next borrower gets the same connection, reading the latest commit rather than the old snapshot
+    write(db_path, "INSERT INTO Stores (name) VALUES ('Store 2')")
+    with pool.connection() as conn:
+        assert conn is first
+        assert conn.execute('SELECT COUNT(*) FROM Stores').fetchone() == (2,)
+
+
+def test_nested_acquire_shares_the_connection(pool):
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+        # still borrowed by this thread: another thread finds the pool exhausted
+        errors = []
+
+        def borrow():
+            try:
+                pool.acquire()
+            except PoolTimeout as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+    with pytest.raises(ValueError):
+        pool.release(outer)
+
+
+def test_query_only(pool, db_path):
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            conn.execute("INSERT INTO Stores (name) VALUES ('Store 2')")
+        assert conn.execute('PRAGMA query_only').fetchone() == (1,)
+    writable = ConnectionPool(db_path, size=1, readonly=False)
+    with writable.connection() as conn:
+        conn.execute("INSERT INTO Stores (name) VALUES ('Store 2')")
+        conn.commit()
+    writable.close()
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM Stores').fetchone() == (2,)
@@ -0,0 +1,134 @@
+import random
+
+import pulp
+import pytest
+
+from app import config
+from app.calculator.optimizer import _milp_solve, assignmentSolver
+
+
+def random_offers(seed, n_stores=7, n_items=8):
+    """A small random instance: (store_id, item_id, price, inventory) rows and requirements."""
+    rng = random.Random(seed)
+    rows = [(s, i, round(rng.uniform(1, 9), 2), rng.randint(0, 5))
+            for s in range(1, n_stores + 1) for i in range(1, n_items + 1) if rng.random() < 0.7]
+    stock = {}
+    for _, i, _, inv in rows:
+        stock[i] = stock.get(i, 0) + inv
+    requirements = {i: rng.randint(1, min(total, 2)) for i, total in stock.items() if total > 0}
+    return rows, requirements
+
+
+def milp_optimum(rows, requirements, max_stores):
+    result = _milp_solve(rows, requirements, max_stores)
+    assert result["status"] in ("Optimal", "Infeasible")
+    return result
+
+
+def check_plan(result, rows, requirements, max_stores):
+    """The plan covers every requirement within stock, at no more than max_stores stores, for its cost."""
+    offers = {(s, i): (p, inv) for s, i, p, inv in rows}
+    bought = {}
+    cost = 0.0
+    for s, i, qty in result["plan"]:
+        price, inv = offers[s, i]
+        assert 0 < qty <= inv
+        bought[i] = bought.get(i, 0) + qty
+        cost += price * qty
+    assert all(bought.get(i, 0) >= qty for i, qty in requirements.items())
+    assert len({s for s, _, _ in result["plan"]}) <= max_stores
+    assert result["total_cost"] == pytest.approx(cost)
+
+
+@pytest.fixture(params=["matrix", "pulp"])
+def milp_backend(request, monkeypatch):
+    monkeypatch.setattr(config, "SOLVER_MILP_BACKEND", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_relaxation_is_optimal(seed):
+    rows, requirements = random_offers(seed)
+    result = assignmentSolver(rows, requirements, max_stores=7)
+    assert result["engine"] == "relaxation"
+    check_plan(result, rows, requirements, 7)
+    assert result["total_cost"] == pytest.approx(milp_optimum(rows, requirements, 7)["total_cost"])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_enumeration_is_optimal(seed):
+    rows, requirements = random_offers(seed)
+    result = assignmentSolver(rows, requirements, max_stores=2)
+    expected = milp_optimum(rows, requirements, 2)
+    if expected["status"] == "Infeasible":
+        assert result["status"] == "Infeasible"
+        return
+    assert result["engine"] in ("relaxation", "enumeration")
+    check_plan(result, rows, requirements, 2)
+    assert result["total_cost"] == pytest.approx(expected["total_cost"])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_heuristic_gap_bounds_the_optimum(seed, monkeypatch):
+    monkeypatch.setattr(config, "SOLVER_ENUMERATION_LIMIT", 0)
+    rows, requirements = random_offers(seed)
+    expected = milp_optimum(rows, requirements, 3)
+    result = assignmentSolver(rows, requirements, max_stores=3, gap_threshold=1.0)
+    assert result["engine"] == "heuristic"
+    check_plan(result, rows, requirements, 3)
+    assert result["total_cost"] >= expected["total_cost"] - 1e-6
+    # the gap is measured against a lower bound, so it covers the distance to the optimum too
+    assert expected["total_cost"] >= result["total_cost"] * (1 - result["gap"]) - 1e-6
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_milp_fallback_is_optimal(seed, milp_backend, monkeypatch):
+    monkeypatch.setattr(config, "SOLVER_ENUMERATION_LIMIT", 0)
+    rows, requirements = random_offers(seed)
+    expected = milp_optimum(rows, requirements, 2)
+    result = assignmentSolver(rows, requirements, max_stores=2, gap_threshold=0.0)
+    if expected["status"] == "Infeasible":
+        assert result["status"] == "Infeasible"
+        return
+    assert result["status"] == "Optimal"
+    check_plan(result, rows, requirements, 2)
+    assert result["total_cost"] == pytest.approx(expected["total_cost"])
+
+
+def test_milp_stopped_on_time_is_feasible(monkeypatch):
+    # PuLP reports a CBC run stopped at its time limit with a solution as Optimal;
+    # only sol_status says the solution was not proven optimal
+    solve = pulp.LpProblem.solve
+
+    def stopped_on_time(prob, solver=None, **kwargs):
+        status = solve(prob, solver, **kwargs)
+        prob.sol_status = pulp.LpSolutionIntegerFeasible
+        return status
+
+    monkeypatch.setattr(pulp.LpProblem, "solve", stopped_on_time)
+    rows, requirements = random_offers(0)
+    result = _milp_solve(rows, requirements, 3)
+    assert (result["status"], result["gap"]) == ("Feasible", None)
+    check_plan(result, rows, requirements, 3)
+
+
+def test_infeasible_stock():
+    rows = [(1, 1, 2.0, 1), (2, 1, 3.0, 1), (2, 2, 1.0, 5)]
+    result = assignmentSolver(rows, {1: 3, 2: 1}, max_stores=2)
+    assert result["status"] == "Infeasible"
+    assert result["plan"] == []
+    assert milp_optimum(rows, {1: 3, 2: 1}, 2)["status"] == "Infeasible"
+
+
+def test_max_stores_cap(milp_backend, monkeypatch):
+    # item 1 is cheapest at store 1 and item 2 at store 2, but store 3 stocks both
+    rows = [(1, 1, 1.0, 5), (2, 2, 1.0, 5), (3, 1, 1.5, 5), (3, 2, 1.5, 5)]
+    requirements = {1: 2, 2: 2}
+    assert assignmentSolver(rows, requirements, max_stores=2)["total_cost"] == pytest.approx(4.0)
+    assert assignmentSolver(rows, requirements, max_stores=0)["status"] == "Infeasible"
+    for limit in (config.SOLVER_ENUMERATION_LIMIT, 0):
+        monkeypatch.setattr(config, "SOLVER_ENUMERATION_LIMIT", limit)
+        result = assignmentSolver(rows, requirements, max_stores=1, gap_threshold=0.0)
+        assert result["plan"] == [(3, 1, 2), (3, 2, 2)]
+        assert result["total_cost"] == pytest.approx(6.0)
+        assert milp_optimum(rows, requirements, 1)["total_cost"] == pytest.approx(6.0)
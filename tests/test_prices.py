@@ -0,0 +1,53 @@
+import pickle
+
+import numpy as np
+
+from app.calculator.prices import PriceMatrix
+
+ROWS = [(1, 10, 2.0, 3), (2, 10, 1.5, 1), (2, 11, 4.0, 2), (3, 12, 0.5, 5), (3, 13, 9.0, 0)]
+
+
+def same(a, b):
+    return (a.item_ids.tolist(), a.store_ids.tolist(), a.rows()) == (b.item_ids.tolist(), b.store_ids.tolist(), b.rows())
+
+
+def test_from_rows_drops_offers_without_stock():
+    matrix = PriceMatrix.from_rows(ROWS)
+    assert matrix.item_ids.tolist() == [10, 11, 12] and matrix.store_ids.tolist() == [1, 2, 3]
+    assert matrix.rows() == [row for row in ROWS if row[3]]
+    assert (matrix.price(2, 11), matrix.price(1, 11), matrix.price(9, 10)) == (4.0, None, None)
+    assert not PriceMatrix.from_rows([])
+
+
+def test_for_items():
+    matrix = PriceMatrix.from_rows(ROWS)
+    # known items only: a view of the same arrays
+    known = matrix.for_items([11, 10])
+    assert known.item_ids.tolist() == [10, 11] and np.shares_memory(known.prices, matrix.prices)
+    # items nobody stocks get empty rows, in id order
+    padded = matrix.for_items([12, 99, 10])
+    assert padded.item_ids.tolist() == [10, 12, 99] and padded.store_ids.tolist() == [1, 2, 3]
+    assert padded.rows() == [(1, 10, 2.0, 3), (2, 10, 1.5, 1), (3, 12, 0.5, 5)]
+    assert np.isinf(padded.prices[2]).all() and not padded.stock[2].any()
+
+
+def test_merge():
+    old = PriceMatrix.from_rows([(1, 10, 2.0, 3), (2, 11, 4.0, 2)])
+    new = PriceMatrix.from_rows([(1, 10, 1.0, 1), (3, 12, 0.5, 5)])
+    merged = old.merge(new)
+    assert merged.item_ids.tolist() == [10, 11, 12] and merged.store_ids.tolist() == [1, 2, 3]
+    # the other matrix wins where both have an offer
+    assert merged.rows() == [(1, 10, 1.0, 1), (2, 11, 4.0, 2), (3, 12, 0.5, 5)]
+    # no offer in the other matrix leaves the cell alone
+    assert same(old.merge(PriceMatrix.empty([10], [1])), old)
+
+
+def test_pickle_round_trip():
+    matrix = PriceMatrix.from_rows(ROWS)
+    for part in (matrix, matrix.take([10, 12], [2, 3]), matrix.for_items([12, 99]), PriceMatrix.from_rows([])):
+        restored = pickle.loads(pickle.dumps(part))
+        assert same(restored, part)
+        assert np.array_equal(restored.prices, part.prices) and np.array_equal(restored.stock, part.stock)
+    # a view is sent as its own offers, not with the whole base array
+    view = matrix.take([10])
+    assert len(pickle.dumps(view)) < len(pickle.dumps(matrix))
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+from app.db import query
+from app.db.init_db import migrate
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    conn.executemany(
+        'INSERT INTO Stores (name, lat, lon) VALUES (?, ?, ?)',
+        [(f'Store {k}', 40.6 + k / 1000, -74.0 + k / 1000) for k in range(100)]
+    )
+    conn.executemany(
+        'INSERT INTO Products (name, category, unit) VALUES (?, ?, ?)',
+        [(f'Product {k}', f'Category {k % 7}', 'unit') for k in range(500)]
+    )
+    conn.executemany(
+        'INSERT INTO StoreProducts (store_id, product_id, price, inventory) VALUES (?, ?, ?, ?)',
+        [(store, product, 1.5, (store + product) % 5) for store in range(1, 101) for product in range(1, 501, 7)]
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    yield conn
+    conn.close()
+
+
+def traced(conn, fn):
+    """The statements fn runs on conn, with their parameters bound."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    # skip SQLite's own statements for triggers and virtual table shadow tables
+    return [sql for sql in statements if sql.lstrip().upper().startswith('SELECT') and "'main'." not in sql]
+
+
+def full_scans(conn, sql):
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    return [detail for _, _, _, detail in plan
+            if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail and 'CONSTANT ROW' not in detail]
+
+
+HOT_QUERIES = {
+    'build_item_store_matrix': lambda conn: query.build_item_store_matrix(
+        conn, [{'id': 8, 'name': 'Product 7'}, {'id': 15, 'name': 'Product 14'}], [{'id': 1}, {'id': 2}]),
+    'item_store_offers': lambda conn: query.item_store_offers(conn, [8, 15, 22], [1, 2, 3]),
+    'item_store_offers bound as JSON': lambda conn: query.item_store_offers(
+        conn, list(range(1, 501)), list(range(1, 101))),
+    'get_products_by_names': lambda conn: query.get_products_by_names(conn, ['Product 1', 'Product 2']),
+    'get_products_by_ids': lambda conn: query.get_products_by_ids(conn, [1, 2, 3]),
+    'get_stores_by_names': lambda conn: query.get_stores_by_names(conn, ['Store 1', 'Store 2']),
+    'get_product_prices': lambda conn: query.get_product_prices(conn, 'Product 7'),
+    'get_stores_nearby': lambda conn: query.get_stores_nearby(conn, '40.65,-73.95', 2),
+    'get_stores_like': lambda conn: query.get_stores_like(conn, 'store 4'),
+    'search_products': lambda conn: query.search_products(conn, 'product 1'),
+    'products page': lambda conn: list(query.iter_listing(conn, 'products', [10], 20)),
+    'stores page': lambda conn: list(query.iter_listing(conn, 'stores', [10], 20)),
+    'products_by_category page': lambda conn: list(query.iter_listing(conn, 'products_by_category', ['Category 3', 40], 20)),
+    'inventories page': lambda conn: list(query.iter_listing(conn, 'inventories', [5, 50], 20)),
+}
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_has_no_full_scan(conn, name):
+    statements = traced(conn, lambda: HOT_QUERIES[name](conn))
+    assert statements
+    for sql in statements:
+        assert full_scans(conn, sql) == [], sql
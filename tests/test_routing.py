@@ -0,0 +1,56 @@
+import itertools
+import math
+import random
+
+import pytest
+
+from app import config
+from app.calculator.routing import (
+    _nearest_neighbour, held_karp, local_search, path_length, select_strategy, solve_route
+)
+
+
+def random_matrix(seed, n_stores, symmetric=True):
+    """Distances from the start (node 0) and between n_stores stores."""
+    rng = random.Random(seed)
+    if not symmetric:
+        return [[0.0 if a == b else rng.uniform(1, 100) for b in range(n_stores + 1)] for a in range(n_stores + 1)]
+    points = [(rng.uniform(0, 10), rng.uniform(0, 10)) for _ in range(n_stores + 1)]
+    return [[math.dist(a, b) for b in points] for a in points]
+
+
+def brute_force(distance_matrix):
+    stores = range(1, len(distance_matrix))
+    return min(path_length(distance_matrix, order) for order in itertools.permutations(stores))
+
+
+@pytest.mark.parametrize("symmetric", [True, False])
+@pytest.mark.parametrize("n_stores", range(8))
+def test_held_karp_matches_brute_force(n_stores, symmetric):
+    for seed in range(3):
+        matrix = random_matrix(seed, n_stores, symmetric)
+        order, length, status = held_karp(matrix)
+        assert status == "Optimal"
+        assert sorted(order) == list(range(1, n_stores + 1))
+        assert length == pytest.approx(path_length(matrix, order))
+        assert length == pytest.approx(brute_force(matrix))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_local_search_above_exact_limit(seed):
+    n_stores = config.ROUTING_EXACT_MAX_STORES + 4
+    matrix = random_matrix(seed, n_stores)
+    assert select_strategy(n_stores) == "local_search"
+    order, length, status = solve_route(matrix)
+    assert status == "Feasible"
+    assert sorted(order) == list(range(1, n_stores + 1))
+    assert length == pytest.approx(path_length(matrix, order))
+    assert length <= path_length(matrix, _nearest_neighbour(matrix)) + 1e-9
+
+
+def test_local_search_without_time_budget():
+    # past the deadline the nearest neighbour path is still returned whole
+    matrix = random_matrix(0, 12)
+    order, length, _ = local_search(matrix, time_budget=0.0)
+    assert order == _nearest_neighbour(matrix)
+    assert length == pytest.approx(path_length(matrix, order))
@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app.db import search
+from app.db.init_db import migrate
+from app.db.query import get_stores_like, search_products
+
+PRODUCTS = [
+    ('Green Apple', 'Produce'),        # 1: name contains 'apple'
+    ('Apple Juice', 'Beverages'),      # 2: name starts with 'apple'
+    ('Cider', 'Apple Products'),       # 3: only the category matches
+    ('Applesauce', 'Snacks'),          # 4: name starts with the prefix 'apple'
+    ('Bread', 'Bakery'),
+    ('Apple Pie', 'Bakery'),           # 6: name starts with 'apple'
+    ('Pineapple Chunks', 'Produce'),   # 7: 'apple' inside a word, never a token match
+]
+
+
+def fill(conn):
+    conn.executemany('INSERT INTO Products (name, category, unit) VALUES (?, ?, ?)',
+                     [(name, category, 'each') for name, category in PRODUCTS])
+    conn.executemany('INSERT INTO Stores (name, lat, lon) VALUES (?, ?, ?)',
+                     [('Key Food Broadway', 40.8, -73.9), ('C-Town 100% Fresh', 40.7, -73.9)])
+    conn.commit()
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    fill(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def plain_conn():
+    """A catalog as migrated by a SQLite without FTS5: no search index at all."""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    for table in ('Products', 'Stores'):
+        for trigger in ('Insert', 'Update', 'Delete'):
+            conn.execute(f'DROP TRIGGER {table}Search{trigger}')
+        conn.execute(f'DROP TABLE {table}SearchTerms')
+        conn.execute(f'DROP TABLE {table}Search')
+    fill(conn)
+    yield conn
+    conn.close()
+
+
+def names(result):
+    return [product['name'] for product in result['results']]
+
+
+def test_tier_ordering(conn):
+    # name starts with the query, then name contains it, then another column does
+    assert names(search_products(conn, 'apple ')) == ['Apple Juice', 'Apple Pie', 'Green Apple', 'Cider']
+    # the last word is a prefix unless the query ends in a space
+    assert names(search_products(conn, 'apple')) == ['Apple Juice', 'Applesauce', 'Apple Pie', 'Green Apple', 'Cider']
+
+
+def test_tiers_paginate(conn):
+    pages = [search_products(conn, 'apple', limit=2, offset=offset) for offset in (0, 2, 4)]
+    assert [names(page) for page in pages] == [['Apple Juice', 'Applesauce'], ['Apple Pie', 'Green Apple'], ['Cider']]
+    assert [page['next_offset'] for page in pages] == [2, 4, None]
+
+
+@pytest.mark.parametrize('typo', ['appel ', 'aple ', 'apples ', 'aople '])
+def test_one_edit_correction(conn, typo):
+    result = search_products(conn, typo, version=('test', typo))
+    assert result['fuzzy']
+    assert names(result) == ['Apple Juice', 'Apple Pie', 'Green Apple', 'Cider']
+
+
+def test_two_edits_are_not_corrected(conn):
+    assert search_products(conn, 'apxlx ', version=('test',)) == {'results': [], 'next_offset': None, 'fuzzy': False}
+
+
+def test_like_fallback_without_fts5(plain_conn):
+    assert not search.has_index(plain_conn, 'Products')
+    result = search_products(plain_conn, 'apple')
+    # substring matches, so 'Pineapple' is found too, ranked after the names starting with it
+    assert names(result) == ['Apple Juice', 'Applesauce', 'Apple Pie', 'Green Apple', 'Pineapple Chunks', 'Cider']
+    assert not result['fuzzy']
+    assert names(search_products(plain_conn, 'apple', limit=2, offset=4)) == ['Pineapple Chunks', 'Cider']
+    # LIKE wildcards in the query are matched literally
+    assert search.search(plain_conn, 'Stores', ('name',), '100%', 10) == ([2], False, False)
+    assert search.search(plain_conn, 'Stores', ('name',), 'Key_Food', 10) == ([], False, False)
+    assert [store['name'] for store in get_stores_like(plain_conn, 'broad')] == ['Key Food Broadway']
+
+
+def test_vocabulary_built_once_under_concurrency(tmp_path, monkeypatch):
+    path = str(tmp_path / 'catalog.db')
+    with sqlite3.connect(path) as setup:
+        migrate(setup)
+        fill(setup)
+    monkeypatch.setattr(search, '_vocabularies', {})
+    built = []
+    original = search.Vocabulary.__init__
+
+    def counting_init(self, docs):
+        built.append(self)
+        original(self, docs)
+
+    monkeypatch.setattr(search.Vocabulary, '__init__', counting_init)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        conn = sqlite3.connect(path)
+        barrier.wait()
+        results.append(search.get_vocabulary(conn, 'Products', ('v', 1)))
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1
+    assert all(vocabulary is built[0] for vocabulary in results)
@@ -0,0 +1,112 @@
+import csv
+import gzip
+import json
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from app.db.ingest import Ingester, ingest_feed, read_feed, secondary_indexes
+from app.db.init_db import migrate
+from app.stores.fetch import CHAINS, chain_records, main
+
+OLD = '2000-01-01 00:00:00'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    with closing(sqlite3.connect(path)) as conn:
+        migrate(conn)
+        conn.executemany('INSERT INTO Stores (name, lat, lon) VALUES (?, ?, ?)',
+                         [('C-Town Broadway', 40.80, -73.96), ('Key Food 86th', 40.78, -73.95)])
+        conn.commit()
+    return path
+
+
+def offers(conn):
+    return conn.execute(
+        'SELECT s.name, p.name, sp.price, sp.inventory, sp.last_updated FROM StoreProducts sp '
+        'JOIN Stores s ON s.id = sp.store_id JOIN Products p ON p.id = sp.product_id ORDER BY 1, 2'
+    ).fetchall()
+
+
+def test_unchanged_rows_keep_last_updated(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        ingester = Ingester(conn)
+        ingester.ingest([{'store': 'C-Town Broadway', 'product': 'Whole  Milk', 'price': '$3.49', 'inventory': '4'},
+                         {'store_id': 2, 'product': 'whole milk', 'price': 3.29, 'inventory': 2}])
+        assert ingester.stats['written'] == 2 and ingester.stats['new_products'] == 1
+        with conn:
+            conn.execute('UPDATE StoreProducts SET last_updated = ?', (OLD,))
+
+        # same price and inventory: the conflicting row is left alone, timestamp included
+        ingester.ingest([{'store': 'C-Town Broadway', 'product': 'WHOLE MILK', 'price': '3.49', 'inventory': 4},
+                         {'store_id': 2, 'product': 'Whole Milk', 'price': '3.29', 'inventory': '1'}])
+        assert ingester.stats['unchanged'] == 1 and ingester.stats['written'] == 3
+        (_, _, price_a, inv_a, updated_a), (_, _, price_b, inv_b, updated_b) = offers(conn)
+        assert (price_a, inv_a, updated_a) == (3.49, 4, OLD)
+        assert (price_b, inv_b) == (3.29, 1) and updated_b != OLD
+
+
+def test_unknown_stores_and_bad_prices_are_skipped(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        stats = Ingester(conn).ingest([{'store': 'Nowhere', 'product': 'Eggs', 'price': 1},
+                                       {'store_id': 1, 'product': 'Eggs', 'price': 'n/a'},
+                                       {'store_id': 1, 'product': '', 'price': 1}])
+        assert stats['skipped'] == 3 and offers(conn) == []
+
+
+def test_read_feed_formats(tmp_path):
+    records = [{'store': 'C-Town Broadway', 'product': 'Eggs', 'price': '2.99'},
+               {'store': 'Key Food 86th', 'product': 'Café Latte', 'price': '4.50'}]
+    with gzip.open(tmp_path / 'feed.jsonl.gz', 'wt', encoding='utf-8') as f:
+        f.write('\n'.join(json.dumps(record) for record in records) + '\n\n')
+    (tmp_path / 'feed.ndjson').write_text(json.dumps(records[0]) + '\n', encoding='utf-8')
+    with gzip.open(tmp_path / 'feed.csv.gz', 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['store', 'product', 'price'])
+        writer.writeheader()
+        writer.writerows(records)
+
+    assert list(read_feed(str(tmp_path / 'feed.jsonl.gz'))) == records
+    assert list(read_feed(str(tmp_path / 'feed.ndjson'))) == records[:1]
+    assert list(read_feed(str(tmp_path / 'feed.csv.gz'))) == records
+    (tmp_path / 'feed.xml').write_text('<feed/>', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(read_feed(str(tmp_path / 'feed.xml')))
+
+
+def test_defer_indexes_rebuilds_them(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        before = sorted(secondary_indexes(conn, 'StoreProducts'))
+    assert before
+    during = []
+
+    def records():
+        # consumed inside the load, so this sees the indexes as they are mid-ingest
+        with closing(sqlite3.connect(db_path)) as reader:
+            during.extend(secondary_indexes(reader, 'StoreProducts'))
+        for k in range(10):
+            yield {'store_id': 1 + k % 2, 'product': f'Product {k}', 'price': k + 0.5, 'inventory': k}
+
+    stats = ingest_feed(records(), db_path, batch_size=3, defer_indexes=True)
+    assert stats['written'] == 10
+    assert during == []
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert sorted(secondary_indexes(conn, 'StoreProducts')) == before
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+
+
+def test_chain_columns(tmp_path, db_path):
+    assert all(sorted(columns.values()) == ['category', 'inventory', 'price', 'product', 'store', 'unit']
+               for columns in CHAINS.values())
+    path = tmp_path / 'ctown.jsonl'
+    path.write_text(json.dumps({'store_name': 'C-Town Broadway', 'item_description': 'Sourdough',
+                                'department': 'Bakery', 'regular_price': '5.99', 'on_hand': 3, 'upc': '0'}) + '\n')
+    assert list(chain_records('ctown', str(path))) == [
+        {'store': 'C-Town Broadway', 'product': 'Sourdough', 'category': 'Bakery', 'unit': None,
+         'price': '5.99', 'inventory': 3}
+    ]
+    main(['ctown', str(path), '--database', db_path])
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert [row[:4] for row in offers(conn)] == [('C-Town Broadway', 'Sourdough', 5.99, 3)]
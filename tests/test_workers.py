@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from app.workers import SolverBusy, SolverCrashed, SolverPool, SolverTimeout
+
+
+# targets run in spawned workers, so they must be importable module-level functions
+def echo(arg):
+    return arg
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def crash(code):
+    os._exit(code)
+
+
+@pytest.fixture
+def pool():
+    pool = SolverPool(workers=1, queue_depth=0, time_limit=30)
+    # the first job waits for the worker to start and import the solvers
+    assert pool.run(echo, 'warm') == 'warm'
+    yield pool
+    pool.close()
+
+
+def test_timeout_restarts_the_worker(pool):
+    with pytest.raises(SolverTimeout):
+        pool.run(sleep_for, 10, time_limit=0.5)
+    assert pool.run(echo, 1) == 1
+    stats = pool.stats()
+    assert (stats['timeouts'], stats['restarts'], stats['running']) == (1, 1, 0)
+
+
+def test_busy_when_every_slot_is_taken(pool):
+    running = pool.submit(sleep_for, 1)
+    with pytest.raises(SolverBusy):
+        pool.submit(echo, 2)
+    assert running.result() == 1
+    assert pool.stats()['rejected'] == 1
+    assert pool.run(echo, 3) == 3
+
+
+def test_crash_restarts_the_worker(pool):
+    with pytest.raises(SolverCrashed):
+        pool.run(crash, 3)
+    assert pool.run(echo, 4) == 4
+    assert pool.stats()['restarts'] == 1
+
+
+def test_raising_target_keeps_the_worker(pool):
+    with pytest.raises(RuntimeError, match='ValueError: bad basket'):
+        pool.run(fail, 'bad basket')
+    assert pool.run(echo, 5) == 5
+    stats = pool.stats()
+    assert (stats['failed'], stats['restarts']) == (1, 0)
+
+
+def test_unpicklable_job_keeps_the_pool_serving(pool):
+    # the job fails in this process, while being sent
+    with pytest.raises(Exception):
+        pool.run(echo, lambda: None)
+    assert pool.run(echo, 6) == 6
+    assert pool.stats()['failed'] == 1